@@ -0,0 +1,322 @@
+# broadcast.py
+"""
+שליחת הודעה לכל המשתמשים בטבלת users (broadcast).
+
+- הנמענים נקראים באצוות של BROADCAST_BATCH_SIZE לפי users.id (keyset),
+  כך שגם 100k+ משתמשים לא נטענים לזיכרון בבת אחת.
+- בכל אצווה נשלחות עד BROADCAST_CONCURRENCY הודעות במקביל; הקצב עצמו
+  נקבע ב-rate limiter (LOW_PRIORITY – הודעות תשלום / אדמין עוקפות את התור).
+- התוצאה לכל נמען (sent / failed / blocked) נשמרת ב-broadcast_deliveries
+  יחד עם הקידום של last_user_id. אחרי קריסה / deploy ה-broadcast ממשיך
+  מהאצווה האחרונה שנשמרה (resume()) – לכל היותר אצווה אחת נשלחת שוב.
+- רק ה-leader (ראה leader.py) שולח: worker אחר רק יוצר את השורה ב-DB,
+  וה-leader אוסף broadcasts חדשים / תקועים כל BROADCAST_POLL_INTERVAL שניות
+  (watch()).
+- התקדמות וקצב מתעדכנים בהודעה אחת בצ'אט של האדמין, כל
+  BROADCAST_PROGRESS_INTERVAL שניות.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, TelegramError
+
+from db_async import (
+    create_broadcast,
+    get_broadcast,
+    get_unfinished_broadcasts,
+    set_broadcast_status,
+    set_broadcast_progress_message,
+    get_broadcast_recipients,
+    record_broadcast_batch,
+)
+from rate_limiter import LOW_PRIORITY
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_BATCH_SIZE = int(os.environ.get("BROADCAST_BATCH_SIZE", "200"))
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_PROGRESS_INTERVAL = float(os.environ.get("BROADCAST_PROGRESS_INTERVAL", "10"))
+# כמה שניות לחכות בכיבוי לאצווה שבאמצע שליחה
+BROADCAST_DRAIN_TIMEOUT = float(os.environ.get("BROADCAST_DRAIN_TIMEOUT", "10"))
+BROADCAST_POLL_INTERVAL = float(os.environ.get("BROADCAST_POLL_INTERVAL", "5"))
+
+FINISHED = ("done", "cancelled")
+
+
+def format_progress(row: Dict[str, Any], rate: Optional[float] = None) -> str:
+    processed = row["sent"] + row["failed"] + row["blocked"]
+    total = max(row["total"], processed)
+    percent = processed * 100 // total if total else 100
+    lines = [
+        f"📣 Broadcast #{row['id']} – {row['status']}",
+        f"התקדמות: {processed}/{total} ({percent}%)",
+        f"• נשלחו: {row['sent']}",
+        f"• חסמו את הבוט: {row['blocked']}",
+        f"• שגיאות: {row['failed']}",
+    ]
+    if rate:
+        lines.append(f"קצב: {rate:.1f} הודעות/שנייה")
+        if row["status"] == "running" and total > processed:
+            lines.append(f"זמן משוער לסיום: {int((total - processed) / rate)} שניות")
+    return "\n".join(lines)
+
+
+class BroadcastRunner:
+    def __init__(
+        self,
+        bot: Bot,
+        batch_size: int = BROADCAST_BATCH_SIZE,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        progress_interval: float = BROADCAST_PROGRESS_INTERVAL,
+        poll_interval: float = BROADCAST_POLL_INTERVAL,
+    ) -> None:
+        self.bot = bot
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.progress_interval = progress_interval
+        self.poll_interval = poll_interval
+
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cancelled: Set[int] = set()
+        self._stopping = False
+        self._watcher: Optional[asyncio.Task] = None
+        # broadcast_id -> מצב אחרון + קצב, ל-stats()
+        self._progress: Dict[int, Dict[str, Any]] = {}
+
+    # ---------- lifecycle ----------
+
+    async def create(
+        self,
+        text: str,
+        created_by: Optional[int],
+        admin_chat_id: Optional[int],
+        start: bool = True,
+    ) -> Optional[Dict[str, Any]]:
+        """start=False – רק נוצר ב-DB; ה-leader יתחיל אותו ב-watch()."""
+        row = await create_broadcast(text, created_by, admin_chat_id)
+        if row is not None and start:
+            self.start(row["id"])
+        return row
+
+    def start(self, broadcast_id: int) -> None:
+        task = self._tasks.get(broadcast_id)
+        if task is not None and not task.done():
+            return
+        self._tasks[broadcast_id] = asyncio.create_task(self._run(broadcast_id))
+
+    async def resume(self) -> List[int]:
+        """ממשיך broadcasts שלא הסתיימו ולא רצים כאן (אחרי deploy / קריסה)."""
+        started = []
+        for broadcast_id in await get_unfinished_broadcasts():
+            task = self._tasks.get(broadcast_id)
+            if task is not None and not task.done():
+                continue
+            logger.info("Resuming broadcast #%s", broadcast_id)
+            self.start(broadcast_id)
+            started.append(broadcast_id)
+        return started
+
+    def watch(self) -> None:
+        """ב-leader: מתחיל broadcasts שנוצרו ב-workers אחרים, עד stop()."""
+        self._stopping = False
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            try:
+                await self.resume()
+            except Exception as e:
+                logger.error("Failed to resume broadcasts: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """עוצר אחרי השליחות שכבר יצאו; False אם לא קיים / כבר הסתיים."""
+        cancelled = await set_broadcast_status(broadcast_id, "cancelled")
+        task = self._tasks.get(broadcast_id)
+        if cancelled and task is not None and not task.done():
+            self._cancelled.add(broadcast_id)
+        return cancelled
+
+    async def stop(self, timeout: float = BROADCAST_DRAIN_TIMEOUT) -> None:
+        """
+        כיבוי: לא מתחילים שליחות חדשות ומחכים שהאצווה הנוכחית תישמר.
+        ה-broadcast נשאר running וממשיך ב-resume() הבא (כאן או ב-leader אחר).
+        """
+        self._stopping = True
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = {}
+
+    def _should_stop(self, broadcast_id: int) -> bool:
+        return self._stopping or broadcast_id in self._cancelled
+
+    # ---------- sending ----------
+
+    async def _deliver(
+        self, semaphore: asyncio.Semaphore, broadcast_id: int, text: str, user_id: int
+    ) -> Optional[Tuple[int, str, Optional[str]]]:
+        async with semaphore:
+            if self._should_stop(broadcast_id):
+                return None
+            try:
+                await self.bot.send_message(
+                    chat_id=user_id, text=text, rate_limit_args=LOW_PRIORITY
+                )
+                return (user_id, "sent", None)
+            except Forbidden as e:
+                # חסם את הבוט / החשבון נמחק
+                return (user_id, "blocked", str(e))
+            except BadRequest as e:
+                if "chat not found" in str(e).lower():
+                    return (user_id, "blocked", str(e))
+                return (user_id, "failed", str(e))
+            except TelegramError as e:
+                return (user_id, "failed", str(e))
+
+    async def _send_batch(
+        self, broadcast_id: int, text: str, user_ids: List[int]
+    ) -> Tuple[List[Tuple[int, str, Optional[str]]], Optional[int]]:
+        """
+        שולח אצווה; מחזיר את התוצאות ואת ה-id האחרון שאפשר לקדם אליו את
+        ה-cursor (עד הנמען הראשון שלא נשלח בגלל עצירה).
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        outcomes = await asyncio.gather(
+            *(self._deliver(semaphore, broadcast_id, text, uid) for uid in user_ids)
+        )
+        results = [outcome for outcome in outcomes if outcome is not None]
+        last_user_id: Optional[int] = None
+        for user_id, outcome in zip(user_ids, outcomes):
+            if outcome is None:
+                break
+            last_user_id = user_id
+        return results, last_user_id
+
+    async def _run(self, broadcast_id: int) -> None:
+        try:
+            row = await get_broadcast(broadcast_id)
+            if row is None or row["status"] in FINISHED:
+                return
+            await set_broadcast_status(broadcast_id, "running")
+            row["status"] = "running"
+            await self._report(row, None, force=True)
+
+            started = time.monotonic()
+            processed = 0
+            after_id = row["last_user_id"]
+            while not self._should_stop(broadcast_id):
+                user_ids = await get_broadcast_recipients(
+                    broadcast_id, after_id, self.batch_size
+                )
+                if not user_ids:
+                    if await set_broadcast_status(broadcast_id, "done"):
+                        row["status"] = "done"
+                    else:  # בוטל בינתיים ב-worker אחר
+                        row = await get_broadcast(broadcast_id) or row
+                    break
+
+                results, last_user_id = await self._send_batch(
+                    broadcast_id, row["text"], user_ids
+                )
+                if results:
+                    state = await record_broadcast_batch(
+                        broadcast_id, results, last_user_id or after_id
+                    )
+                    if state is not None:
+                        row.update(state)
+                    processed += len(results)
+                if last_user_id is None:
+                    break
+                after_id = last_user_id
+
+                rate = processed / max(time.monotonic() - started, 0.001)
+                await self._report(row, rate)
+                if row["status"] == "cancelled":
+                    break
+
+            if broadcast_id in self._cancelled:
+                row["status"] = "cancelled"
+            rate = processed / max(time.monotonic() - started, 0.001)
+            await self._report(row, rate, force=True)
+            logger.info(
+                "Broadcast #%s %s: sent=%s failed=%s blocked=%s",
+                broadcast_id,
+                row["status"],
+                row["sent"],
+                row["failed"],
+                row["blocked"],
+            )
+        except Exception as e:
+            logger.error("Broadcast #%s failed: %s", broadcast_id, e)
+        finally:
+            self._cancelled.discard(broadcast_id)
+
+    # ---------- progress ----------
+
+    async def _report(
+        self, row: Dict[str, Any], rate: Optional[float], force: bool = False
+    ) -> None:
+        """מעדכן את הודעת ההתקדמות בצ'אט האדמין (לכל היותר פעם ב-interval)."""
+        progress = self._progress.setdefault(row["id"], {"reported_at": 0.0})
+        progress.update(
+            status=row["status"],
+            total=row["total"],
+            sent=row["sent"],
+            failed=row["failed"],
+            blocked=row["blocked"],
+            rate=round(rate, 2) if rate else None,
+        )
+        if not row.get("admin_chat_id"):
+            return
+        now = time.monotonic()
+        if not force and now - progress["reported_at"] < self.progress_interval:
+            return
+        progress["reported_at"] = now
+
+        text = format_progress(row, rate)
+        try:
+            if row.get("progress_message_id"):
+                await self.bot.edit_message_text(
+                    chat_id=row["admin_chat_id"],
+                    message_id=row["progress_message_id"],
+                    text=text,
+                )
+            else:
+                message = await self.bot.send_message(
+                    chat_id=row["admin_chat_id"], text=text
+                )
+                row["progress_message_id"] = message.message_id
+                await set_broadcast_progress_message(row["id"], message.message_id)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.warning("Failed to update broadcast progress: %s", e)
+        except Exception as e:
+            logger.warning("Failed to update broadcast progress: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": sorted(
+                broadcast_id
+                for broadcast_id, task in self._tasks.items()
+                if not task.done()
+            ),
+            "progress": {
+                str(broadcast_id): {
+                    key: value for key, value in progress.items() if key != "reported_at"
+                }
+                for broadcast_id, progress in self._progress.items()
+            },
+        }
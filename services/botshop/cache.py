@@ -0,0 +1,201 @@
+# cache.py
+"""
+cache בזיכרון (LRU + TTL) לקריאות per-user שמשתנות לעיתים רחוקות,
+כמו פרטי בנק של מפיץ, נקודות שיתוף ופרופיל המשתמש. פונקציות הכתיבה ב-db_async
+מעדכנות / מבטלות את הערכים, וה-TTL חוסם את זמן ה-staleness
+כשכתיבה נעשתה ב-worker אחר.
+
+לשימוש מתוך ה-event loop בלבד (אין נעילה).
+
+SnapshotCache שומר תשובה שלמה ומוכנה (bytes + ETag) של endpoint ציבורי,
+כמו /public/share_board.
+"""
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))
+SHARE_BOARD_CACHE_SECONDS = float(os.environ.get("SHARE_BOARD_CACHE_SECONDS", "30"))
+# אחרי הענקת נקודות – לא בונים מחדש לפני שעבר זמן כזה מהבנייה הקודמת
+SHARE_BOARD_MIN_REBUILD_SECONDS = float(os.environ.get("SHARE_BOARD_MIN_REBUILD_SECONDS", "5"))
+
+# מסמן "אין ב-cache" – כדי שאפשר יהיה לשמור גם None (למשל מפיץ בלי בנק)
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = CACHE_MAX_ENTRIES,
+        ttl: float = CACHE_TTL_SECONDS,
+    ) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # עולה בכל כתיבה/ביטול; קריאה מה-DB שהתחילה לפני כתיבה לא תמלא את ה-cache
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def begin_read(self) -> int:
+        """נקרא לפני קריאה מה-DB; את התוצאה מעבירים ל-fill()."""
+        return self._epoch
+
+    def fill(self, key: Hashable, value: Any, epoch: int) -> None:
+        """שומר ערך שנקרא מה-DB, אלא אם הייתה כתיבה מאז begin_read()."""
+        if epoch == self._epoch:
+            self._store(key, value)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """write-through אחרי כתיבה ל-DB."""
+        self._epoch += 1
+        self._store(key, value)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._epoch += 1
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._data.clear()
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class Snapshot(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: datetime
+
+
+class SnapshotCache:
+    """
+    תשובה מוכנה אחת, שנבנית מחדש לכל היותר פעם ב-ttl שניות. mark_stale()
+    מקדים את הבנייה הבאה, אבל לא לפני min_interval שניות מהבנייה הקודמת –
+    גל של כתיבות לא גורם לבנייה בכל בקשה. רק בקשה אחת בונה (lock) – השאר
+    מחכות לה ומקבלות את אותה תוצאה. Last-Modified זז רק כשהתוכן באמת השתנה.
+    """
+
+    def __init__(self, name: str, ttl: float, min_interval: float = 0.0) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.min_interval = min(min_interval, ttl)
+        self._snapshot: Optional[Snapshot] = None
+        self._expires_at = 0.0
+        self._built_at = 0.0
+        self._epoch = 0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.builds = 0
+        self.errors = 0
+
+    def _fresh(self) -> bool:
+        return self._snapshot is not None and self._expires_at > time.monotonic()
+
+    async def get(self, build: Callable[[], Awaitable[bytes]]) -> Snapshot:
+        if self._fresh():
+            self.hits += 1
+            return self._snapshot
+        async with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self._snapshot
+            epoch = self._epoch
+            try:
+                body = await build()
+            except Exception:
+                self.errors += 1
+                if self._snapshot is None:
+                    raise
+                # מגישים את הגרסה הקודמת עד הניסיון הבא
+                return self._snapshot
+            self.builds += 1
+            previous = self._snapshot
+            if previous is not None and previous.body == body:
+                snapshot = previous
+            else:
+                snapshot = Snapshot(
+                    body=body,
+                    etag='"%s"' % hashlib.sha1(body).hexdigest(),
+                    last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+                )
+            self._snapshot = snapshot
+            self._built_at = time.monotonic()
+            # אם הייתה כתיבה בזמן הבנייה – בונים שוב אחרי min_interval
+            interval = self.ttl if epoch == self._epoch else self.min_interval
+            self._expires_at = self._built_at + interval
+            return snapshot
+
+    def mark_stale(self) -> None:
+        """התוכן השתנה: הבנייה הבאה לא תחכה ל-ttl, רק ל-min_interval."""
+        self._epoch += 1
+        self._expires_at = min(self._expires_at, self._built_at + self.min_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl": self.ttl,
+            "min_interval": self.min_interval,
+            "hits": self.hits,
+            "builds": self.builds,
+            "errors": self.errors,
+            "etag": self._snapshot.etag if self._snapshot else None,
+        }
+
+
+share_points_cache = TTLCache("share_points")
+promoter_bank_cache = TTLCache("promoter_bank")
+user_profile_cache = TTLCache("user_profile")
+share_board_snapshot = SnapshotCache(
+    "share_board", SHARE_BOARD_CACHE_SECONDS, SHARE_BOARD_MIN_REBUILD_SECONDS
+)
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    stats = {
+        cache.name: cache.stats()
+        for cache in (share_points_cache, promoter_bank_cache, user_profile_cache)
+    }
+    stats[share_board_snapshot.name] = share_board_snapshot.stats()
+    return stats
@@ -0,0 +1,146 @@
+# counters.py
+"""
+מונים עם write-behind עבור טבלת metrics.
+
+במקום upsert לכל /start, הדלתות נצברות בזיכרון ונכתבות ל-DB באצווה
+(כל METRICS_FLUSH_INTERVAL שניות או אחרי METRICS_FLUSH_EVERY הגדלות).
+קריאה מחזירה את ה-snapshot האחרון מה-DB + הדלתות שעוד לא נכתבו.
+
+מספרים סידוריים מדויקים (העותק הממוספר אחרי אישור) מגיעים מטווחים
+ששמורים מראש ב-DB, כך שהם עולים תמיד גם כשיש כמה workers.
+בהפעלה מחדש יתרת הטווח הולכת לאיבוד – המספור נשאר עולה, עם דילוג.
+"""
+import os
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from db_async import add_metrics, get_metrics, reserve_metric_range
+
+logger = logging.getLogger(__name__)
+
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+METRICS_FLUSH_EVERY = int(os.environ.get("METRICS_FLUSH_EVERY", "50"))
+METRICS_SERIAL_BLOCK = int(os.environ.get("METRICS_SERIAL_BLOCK", "10"))
+
+
+class MetricCounters:
+    def __init__(
+        self,
+        flush_interval: float = METRICS_FLUSH_INTERVAL,
+        flush_every: int = METRICS_FLUSH_EVERY,
+        serial_block: int = METRICS_SERIAL_BLOCK,
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.serial_block = serial_block
+
+        self._snapshot: Dict[str, int] = {}
+        self._pending: Dict[str, int] = {}
+        # דלתות שנמצאות באמצע flush – נספרות בקריאות עד שה-snapshot מתעדכן
+        self._inflight: Dict[str, int] = {}
+        self._pending_ops = 0
+        # key -> [next serial, last serial in reserved range]
+        self._ranges: Dict[str, List[int]] = {}
+
+        self._flush_lock = asyncio.Lock()
+        self._range_locks: Dict[str, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # ---------- lifecycle ----------
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._safe_flush(refresh=True)
+
+    async def _safe_flush(self, refresh: bool = False) -> None:
+        try:
+            await self.flush(refresh=refresh)
+        except Exception as e:
+            logger.error("Failed to flush metric counters: %s", e)
+
+    # ---------- reads / writes ----------
+
+    async def _ensure_loaded(self, key: str) -> None:
+        if key in self._snapshot:
+            return
+        values = await get_metrics([key])
+        self._snapshot.setdefault(key, values.get(key, 0))
+
+    async def incr(self, key: str, delta: int = 1) -> int:
+        """מגדיל מונה בזיכרון ומחזיר את הערך המשוער (snapshot + pending)."""
+        await self._ensure_loaded(key)
+        self._pending[key] = self._pending.get(key, 0) + delta
+        self._pending_ops += 1
+        if self._pending_ops >= self.flush_every and (
+            self._flush_task is None or self._flush_task.done()
+        ):
+            self._flush_task = asyncio.create_task(self._safe_flush())
+        return self._value(key)
+
+    async def get(self, key: str) -> int:
+        await self._ensure_loaded(key)
+        return self._value(key)
+
+    def _value(self, key: str) -> int:
+        return (
+            self._snapshot[key]
+            + self._inflight.get(key, 0)
+            + self._pending.get(key, 0)
+        )
+
+    async def next_serial(self, key: str) -> int:
+        """
+        מחזיר את המספר הסידורי הבא עבור key (מטווח שמור מראש)
+        וגם סופר אותו כהגדלה של המונה.
+        """
+        lock = self._range_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            rng = self._ranges.get(key)
+            if rng is None or rng[0] > rng[1]:
+                last = await reserve_metric_range(key, self.serial_block)
+                rng = [last - self.serial_block + 1, last]
+                self._ranges[key] = rng
+            serial = rng[0]
+            rng[0] += 1
+        await self.incr(key, 1)
+        return serial
+
+    async def flush(self, refresh: bool = False) -> None:
+        """
+        כותב את הדלתות שנצברו בשאילתה אחת ומעדכן את ה-snapshot.
+        עם refresh=True מרענן גם מונים בלי דלתות (שינויים של workers אחרים).
+        """
+        async with self._flush_lock:
+            self._inflight, self._pending = self._pending, {}
+            self._pending_ops = 0
+            try:
+                fresh = await add_metrics(self._inflight)
+                if refresh:
+                    stale = [k for k in self._snapshot if k not in fresh]
+                    if stale:
+                        fresh.update(await get_metrics(stale))
+            except Exception:
+                # מחזירים את הדלתות כדי לא לאבד אותן – ננסה שוב ב-flush הבא
+                for key, delta in self._inflight.items():
+                    self._pending[key] = self._pending.get(key, 0) + delta
+                self._inflight = {}
+                raise
+            self._snapshot.update(fresh)
+            self._inflight = {}
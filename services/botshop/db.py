@@ -1,419 +1,448 @@
 # db.py
 import os
+import time
 import logging
+import threading
+from datetime import datetime, timezone
 from contextlib import contextmanager
-from typing import Optional, Any, List, Dict
+from typing import Optional, Any, Dict
 
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
+
+import queries
+import telemetry
 
 logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
+# גודל ה-pool – botshop חולק את מגבלת החיבורים של Postgres עם gateway ו-slhton
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "5"))
+# כמה שניות לחכות לחיבור פנוי לפני שנכשלים
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+# חיבור שעמד בצד יותר מזה (בשניות) נבדק עם SELECT 1 לפני שימוש; 0 = בדיקה בכל checkout
+DB_POOL_CHECK_IDLE = float(os.environ.get("DB_POOL_CHECK_IDLE", "30"))
+
+# replica אופציונלי לשאילתות דוחות (top referrers / sharers, דוח חודשי, סטטיסטיקות)
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+# מעל lag כזה (בשניות) הקריאות חוזרות ל-primary
+DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", "10"))
+# כל כמה שניות למדוד את ה-lag מחדש
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", "5"))
+# כמה שורות מושכים בכל סבב מה-cursor של ייצוא
+DB_EXPORT_FETCH_SIZE = int(os.environ.get("DB_EXPORT_FETCH_SIZE", "2000"))
+# כמה ייצואים רצים במקביל – כל אחד על חיבור ייעודי משלו, מחוץ ל-pool
+DB_EXPORT_MAX_CONCURRENT = int(os.environ.get("DB_EXPORT_MAX_CONCURRENT", "2"))
+# כמה שניות worker שאינו leader מחכה שהמיגרציות יסתיימו לפני שהוא עולה
+DB_SCHEMA_WAIT_TIMEOUT = float(os.environ.get("DB_SCHEMA_WAIT_TIMEOUT", "120"))
+
 if not DATABASE_URL:
     logger.warning("DATABASE_URL is not set. DB functions will be no-op.")
 
 
-def get_conn():
-    if not DATABASE_URL:
-        return None
-    conn = psycopg2.connect(
-        DATABASE_URL,
-        cursor_factory=psycopg2.extras.DictCursor,
-    )
-    return conn
+# =========================
+# connection pool
+# =========================
 
+class PoolTimeout(Exception):
+    """No pooled connection became available within DB_POOL_TIMEOUT."""
+
+
+class _TimedCursor(psycopg2.extras.DictCursor):
+    """DictCursor שמודד execute / fetch ומדווח על שאילתות איטיות (ראה telemetry.py)."""
+
+    def execute(self, query, vars=None):
+        label = telemetry.current_db_call.get()
+        start = time.perf_counter()
+        super().execute(query, vars)
+        elapsed = time.perf_counter() - start
+        telemetry.observe("db_execute", label, elapsed)
+        if telemetry.is_slow(elapsed):
+            plan = self._explain(query, vars) if telemetry.should_explain(query) else None
+            telemetry.record_slow_query(label, elapsed, query, plan)
+
+    def _explain(self, query, vars) -> Optional[str]:
+        # cursor רגיל ונפרד – לא דורס את התוצאות של השאילתה עצמה;
+        # savepoint כדי ש-EXPLAIN שנכשל לא יפיל את הטרנזקציה
+        with self.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            try:
+                cur.execute("SAVEPOINT slow_query_explain;")
+                cur.execute("EXPLAIN " + query, vars)
+                plan = "\n".join(row[0] for row in cur.fetchall())
+                cur.execute("RELEASE SAVEPOINT slow_query_explain;")
+                return plan
+            except psycopg2.Error as e:
+                logger.debug("EXPLAIN failed: %s", e)
+                try:
+                    cur.execute("ROLLBACK TO SAVEPOINT slow_query_explain;")
+                except psycopg2.Error:
+                    pass
+                return None
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            telemetry.observe(
+                "db_fetch", telemetry.current_db_call.get(), time.perf_counter() - start
+            )
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class _BoundedPool:
+    """
+    ThreadedConnectionPool עם semaphore: כשכל החיבורים בשימוש, checkout
+    מחכה עד DB_POOL_TIMEOUT במקום להיכשל מיד. חיבור שעמד בצד יותר
+    מ-DB_POOL_CHECK_IDLE נבדק לפני שימוש.
+    """
 
-@contextmanager
-def db_cursor():
-    conn = get_conn()
-    if conn is None:
-        yield None, None
-        return
-    try:
-        cur = conn.cursor()
-        yield conn, cur
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        cur.close()
-        conn.close()
+    def __init__(self, name: str, dsn: Optional[str]) -> None:
+        self.name = name
+        self.dsn = dsn
+        self._pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(DB_POOL_MAX)
+        self._last_used: Dict[int, float] = {}
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "health_checks": 0,
+            "recycled": 0,
+            "in_use": 0,
+        }
+
+    def _bump(self, key: str, delta: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += delta
+
+    def _get(self) -> Optional[psycopg2.pool.ThreadedConnectionPool]:
+        if not self.dsn:
+            return None
+        if self._pool is not None:
+            return self._pool
+        with self._lock:
+            if self._pool is None:
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN,
+                    DB_POOL_MAX,
+                    self.dsn,
+                    cursor_factory=_TimedCursor,
+                )
+                logger.info(
+                    "DB %s pool created (min=%s, max=%s)",
+                    self.name,
+                    DB_POOL_MIN,
+                    DB_POOL_MAX,
+                )
+        return self._pool
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None:
+            # חיבור טרי שנפתח זה עתה
+            return True
+        if time.monotonic() - last_used < DB_POOL_CHECK_IDLE:
+            return True
+        self._bump("health_checks")
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        pool = self._get()
+        if pool is None:
+            return None
 
+        if not self._slots.acquire(blocking=False):
+            self._bump("waits")
+            if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+                self._bump("timeouts")
+                raise PoolTimeout(
+                    f"no DB connection available after {DB_POOL_TIMEOUT}s "
+                    f"({self.name} pool max={DB_POOL_MAX})"
+                )
+
+        try:
+            conn = pool.getconn()
+            if not self._is_healthy(conn):
+                self._bump("recycled")
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._bump("checkouts")
+        self._bump("in_use")
+        return conn
+
+    def putconn(self, conn, broken: bool = False) -> None:
+        pool = self._pool
+        if pool is None:
+            conn.close()
+            return
+        close = broken or bool(conn.closed)
+        if close:
+            self._bump("recycled")
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        try:
+            pool.putconn(conn, close=close)
+        finally:
+            self._bump("in_use", -1)
+            self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+                logger.info("DB %s pool closed.", self.name)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["max_size"] = DB_POOL_MAX
+        return stats
+
+
+class ReplicaState:
+    """
+    מצב ה-replica: ה-lag האחרון שנמדד, מתי נמדד, ומוני ניתוב.
+    משותף בצורתו ל-db.py ול-db_async.py (לכל אחד מופע משלו).
+    """
+
+    def __init__(
+        self,
+        max_lag: float = DB_REPLICA_MAX_LAG,
+        check_interval: float = DB_REPLICA_CHECK_INTERVAL,
+    ) -> None:
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag: Optional[float] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "reads": 0,
+            "fallbacks": 0,
+            "lag_checks": 0,
+            "errors": 0,
+        }
+
+    def claim_check(self) -> bool:
+        """True אם הגיע הזמן למדוד lag – רק הקורא הראשון בכל מחזור מקבל True."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.check_interval:
+                return False
+            self._checked_at = now
+            self._stats["lag_checks"] += 1
+            return True
+
+    def record_lag(self, lag: float) -> None:
+        if lag > self.max_lag:
+            logger.warning(
+                "DB replica lag %.1fs exceeds %.1fs – reads go to primary.",
+                lag,
+                self.max_lag,
+            )
+        self.lag = lag
+
+    def record_failure(self, error: Exception) -> None:
+        """replica לא זמין – קוראים מה-primary עד הבדיקה הבאה."""
+        with self._lock:
+            self.lag = None
+            self._checked_at = time.monotonic()
+            self._stats["errors"] += 1
+        logger.warning("DB replica unavailable, falling back to primary: %s", error)
+
+    def usable(self) -> bool:
+        return self.lag is not None and self.lag <= self.max_lag
+
+    def bump(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        stats["lag_seconds"] = self.lag
+        stats["max_lag"] = self.max_lag
+        stats["usable"] = self.usable()
+        return stats
+
+
+_primary = _BoundedPool("primary", DATABASE_URL)
+_replica = _BoundedPool("replica", DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+replica_state = ReplicaState()
 
-def init_schema() -> None:
+
+def get_conn():
     """
-    יוצר את הטבלאות אם הן לא קיימות.
-    לא מוחק נתונים קיימים.
+    מוציא חיבור מה-pool (חוסם עד DB_POOL_TIMEOUT אם כולם בשימוש).
+    חיבור שבור נזרק ומוחלף בחדש. יש להחזיר עם put_conn().
     """
-    if not DATABASE_URL:
-        logger.warning("init_schema called but DATABASE_URL not set.")
-        return
+    return _primary.getconn()
 
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            logger.warning("No DB cursor available in init_schema.")
-            return
 
-        # payments – כבר קיימת אצלך, כאן רק לוודא
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS payments (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                username TEXT,
-                pay_method TEXT,
-                status TEXT NOT NULL DEFAULT 'pending',
-                reason TEXT,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            );
-            """
-        )
-
-        # users – לזיהוי משתמשים/מפנים
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id BIGINT PRIMARY KEY,
-                username TEXT,
-                first_seen_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            );
-            """
-        )
-
-        # referrals – הפניות בין משתמשים
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS referrals (
-                id SERIAL PRIMARY KEY,
-                referrer_id BIGINT NOT NULL,
-                referred_id BIGINT NOT NULL,
-                source TEXT,
-                points INT NOT NULL DEFAULT 1,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            );
-            """
-        )
-
-        # rewards – פרסים / נקודות (כולל SHARE_POINTS)
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS rewards (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                reward_type TEXT NOT NULL,
-                reason TEXT,
-                points INT NOT NULL DEFAULT 0,
-                status TEXT NOT NULL DEFAULT 'pending',
-                tx_hash TEXT,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            );
-            """
-        )
-
-        # promoters – מי שרכש והפך למפיץ עם פרטי בנק משלו
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS promoters (
-                user_id BIGINT PRIMARY KEY,
-                bank_details TEXT NOT NULL,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            );
-            """
-        )
-
-        # metrics – מונים כלליים (למשל start_image_views)
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS metrics (
-                key TEXT PRIMARY KEY,
-                value BIGINT NOT NULL DEFAULT 0,
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-            );
-            """
-        )
-
-        logger.info(
-            "DB schema ensured (payments, users, referrals, rewards, promoters, metrics)."
-        )
+def put_conn(conn, broken: bool = False) -> None:
+    _primary.putconn(conn, broken=broken)
 
 
-# =========================
-# payments
-# =========================
+def close_pool() -> None:
+    _primary.close()
+    if _replica is not None:
+        _replica.close()
 
-def log_payment(user_id: int, username: Optional[str], pay_method: str) -> None:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            logger.warning("log_payment called without DB.")
-            return
-        cur.execute(
-            """
-            INSERT INTO payments (user_id, username, pay_method, status, created_at, updated_at)
-            VALUES (%s, %s, %s, 'pending', NOW(), NOW());
-            """,
-            (user_id, username, pay_method),
-        )
-
-
-def update_payment_status(user_id: int, status: str, reason: Optional[str]) -> None:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            logger.warning("update_payment_status called without DB.")
-            return
-        cur.execute(
-            """
-            UPDATE payments
-            SET status = %s,
-                reason = %s,
-                updated_at = NOW()
-            WHERE id = (
-                SELECT id
-                FROM payments
-                WHERE user_id = %s
-                ORDER BY created_at DESC
-                LIMIT 1
-            );
-            """,
-            (status, reason, user_id),
-        )
 
+def get_pool_stats() -> Dict[str, int]:
+    """מוני ה-pool: checkouts, waits (נאלצו לחכות), timeouts (מיצוי), recycled וכו'."""
+    return _primary.stats()
 
-# =========================
-# users / referrals
-# =========================
 
-def store_user(user_id: int, username: Optional[str]) -> None:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return
-        cur.execute(
-            """
-            INSERT INTO users (id, username, first_seen_at)
-            VALUES (%s, %s, NOW())
-            ON CONFLICT (id) DO UPDATE
-              SET username = EXCLUDED.username;
-            """,
-            (user_id, username),
-        )
-
-
-def add_referral(referrer_id: int, referred_id: int, source: str) -> None:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return
-        cur.execute(
-            """
-            INSERT INTO referrals (referrer_id, referred_id, source, points)
-            VALUES (%s, %s, %s, 1)
-            ON CONFLICT DO NOTHING;
-            """,
-            (referrer_id, referred_id, source),
-        )
-
-
-def get_top_referrers(limit: int = 10) -> List[Dict[str, Any]]:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return []
-        cur.execute(
-            """
-            SELECT r.referrer_id,
-                   u.username,
-                   COUNT(*) AS total_referrals,
-                   SUM(r.points) AS total_points
-            FROM referrals r
-            LEFT JOIN users u ON u.id = r.referrer_id
-            GROUP BY r.referrer_id, u.username
-            ORDER BY total_points DESC, total_referrals DESC
-            LIMIT %s;
-            """,
-            (limit,),
-        )
-        rows = cur.fetchall()
-        return [dict(row) for row in rows]
+def get_replica_stats() -> Dict[str, Any]:
+    """lag אחרון של ה-replica (בשניות) ומוני ניתוב; {} כשאין replica."""
+    if _replica is None:
+        return {}
+    stats = replica_state.snapshot()
+    stats["pool"] = _replica.stats()
+    return stats
 
 
-# =========================
-# דוחות תשלומים
-# =========================
+def _check_replica_lag() -> None:
+    try:
+        conn = _replica.getconn()
+    except (psycopg2.Error, PoolTimeout) as e:
+        replica_state.record_failure(e)
+        return
+    broken = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute(queries.REPLICA_LAG)
+            lag = float(cur.fetchone()[0])
+        conn.rollback()
+        replica_state.record_lag(lag)
+    except psycopg2.Error as e:
+        broken = True
+        replica_state.record_failure(e)
+    finally:
+        _replica.putconn(conn, broken=broken)
 
-def get_monthly_payments(year: int, month: int) -> List[Dict[str, Any]]:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return []
-        cur.execute(
-            """
-            SELECT pay_method,
-                   status,
-                   COUNT(*) AS count
-            FROM payments
-            WHERE EXTRACT(YEAR FROM created_at) = %s
-              AND EXTRACT(MONTH FROM created_at) = %s
-            GROUP BY pay_method, status
-            ORDER BY pay_method, status;
-            """,
-            (year, month),
-        )
-        rows = cur.fetchall()
-        return [dict(row) for row in rows]
-
-
-def get_approval_stats() -> Optional[Dict[str, Any]]:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return None
-        cur.execute(
-            """
-            SELECT
-              COUNT(*) FILTER (WHERE status = 'pending') AS pending,
-              COUNT(*) FILTER (WHERE status = 'approved') AS approved,
-              COUNT(*) FILTER (WHERE status = 'rejected') AS rejected,
-              COUNT(*) AS total
-            FROM payments;
-            """
-        )
-        row = cur.fetchone()
-        if not row:
-            return None
-        return dict(row)
+
+def _checkout(readonly: bool):
+    """
+    בוחר pool: קריאה בלבד הולכת ל-replica כשהוא זמין וה-lag בגבול,
+    אחרת ל-primary.
+    """
+    if readonly and _replica is not None:
+        if replica_state.claim_check():
+            _check_replica_lag()
+        if replica_state.usable():
+            try:
+                conn = _replica.getconn()
+                replica_state.bump("reads")
+                return _replica, conn
+            except (psycopg2.Error, PoolTimeout) as e:
+                replica_state.record_failure(e)
+        replica_state.bump("fallbacks")
+    return _primary, _primary.getconn()
+
+
+@contextmanager
+def db_cursor(readonly: bool = False):
+    """
+    cursor בטרנזקציה (commit ביציאה תקינה, rollback בחריגה).
+    readonly=True – השאילתה יכולה לרוץ על ה-replica (ראה _checkout).
+    """
+    start = time.perf_counter()
+    pool, conn = _checkout(readonly)
+    telemetry.observe(
+        "db_pool_wait", telemetry.current_db_call.get(), time.perf_counter() - start
+    )
+    if conn is None:
+        yield None, None
+        return
+    broken = False
+    cur = None
+    try:
+        cur = conn.cursor()
+        yield conn, cur
+        conn.commit()
+    except Exception as e:
+        broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken and pool is _replica:
+            replica_state.record_failure(e)
+        raise
+    finally:
+        if cur is not None and not cur.closed:
+            cur.close()
+        pool.putconn(conn, broken=broken)
 
 
 # =========================
-# rewards / נקודות
+# דוחות תשלומים
 # =========================
 
-def create_reward(user_id: int, reward_type: str, reason: str, points: int = 0) -> None:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return
-        cur.execute(
-            """
-            INSERT INTO rewards (user_id, reward_type, reason, points, status, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, 'pending', NOW(), NOW());
-            """,
-            (user_id, reward_type, reason, points),
-        )
-
-
-def get_share_points(user_id: int) -> int:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return 0
-        cur.execute(
-            """
-            SELECT COALESCE(SUM(points), 0) AS pts
-            FROM rewards
-            WHERE user_id = %s
-              AND reward_type = 'SHARE_POINTS';
-            """,
-            (user_id,),
-        )
-        row = cur.fetchone()
-        if not row:
-            return 0
-        return int(row["pts"])
-
-
-def get_top_sharers(limit: int = 10) -> List[Dict[str, Any]]:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return []
-        cur.execute(
-            """
-            SELECT r.user_id,
-                   u.username,
-                   COALESCE(SUM(r.points), 0) AS total_points
-            FROM rewards r
-            LEFT JOIN users u ON u.id = r.user_id
-            WHERE r.reward_type = 'SHARE_POINTS'
-            GROUP BY r.user_id, u.username
-            ORDER BY total_points DESC
-            LIMIT %s;
-            """,
-            (limit,),
-        )
-        rows = cur.fetchall()
-        return [dict(row) for row in rows]
+def month_bounds(year: int, month: int):
+    """גבולות החודש ב-UTC כטווח חצי-פתוח [start, end)."""
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    if month == 12:
+        end = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    else:
+        end = datetime(year, month + 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+
+def current_month_start() -> datetime:
+    now = datetime.now(timezone.utc)
+    return datetime(now.year, now.month, 1, tzinfo=timezone.utc)
 
 
 # =========================
-# promoters – בנק אישי למפיצים
+# rewards – הנפקה מרוכזת (airdrop / בונוס)
 # =========================
 
-def set_promoter_bank(user_id: int, bank_details: str) -> None:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return
-        cur.execute(
-            """
-            INSERT INTO promoters (user_id, bank_details, created_at)
-            VALUES (%s, %s, NOW())
-            ON CONFLICT (user_id) DO UPDATE
-              SET bank_details = EXCLUDED.bank_details;
-            """,
-            (user_id, bank_details),
-        )
-
-
-def get_promoter_bank(user_id: int) -> Optional[str]:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return None
-        cur.execute(
-            """
-            SELECT bank_details
-            FROM promoters
-            WHERE user_id = %s;
-            """,
-            (user_id,),
-        )
-        row = cur.fetchone()
-        if not row:
-            return None
-        return row["bank_details"]
+REWARD_TARGETS = ("approved", "top_sharers")
 
 
 # =========================
-# metrics – counters
+# פרופיל משתמש
 # =========================
 
-def increment_metric(key: str, delta: int = 1) -> int:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return 0
-        cur.execute(
-            """
-            INSERT INTO metrics (key, value, updated_at)
-            VALUES (%s, %s, NOW())
-            ON CONFLICT (key) DO UPDATE
-              SET value = metrics.value + EXCLUDED.value,
-                  updated_at = NOW()
-            RETURNING value;
-            """,
-            (key, delta),
-        )
-        row = cur.fetchone()
-        return int(row["value"]) if row else 0
-
-
-def get_metric(key: str) -> int:
-    with db_cursor() as (conn, cur):
-        if cur is None:
-            return 0
-        cur.execute(
-            """
-            SELECT value
-            FROM metrics
-            WHERE key = %s;
-            """,
-            (key,),
-        )
-        row = cur.fetchone()
-        if not row:
-            return 0
-        return int(row["value"])
+# פרופיל של משתמש שאין עליו כלום ב-DB (או כשאין DB)
+EMPTY_PROFILE: Dict[str, Any] = {
+    "share_points": 0,
+    "referral_count": 0,
+    "bank_details": None,
+    "payment_status": None,
+    "paid": False,
+}
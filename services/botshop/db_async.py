@@ -0,0 +1,971 @@
+# db_async.py
+"""
+ה-API של ה-DB בגרסה אסינכרונית, עבור ה-handlers של PTB ו-FastAPI.
+בנוי על psycopg 3 עם AsyncConnectionPool משלו, כך ששאילתה איטית
+לא חוסמת את ה-event loop. ה-SQL משותף עם db.py דרך queries.py.
+"""
+import time
+import asyncio
+import logging
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Optional, Any, AsyncIterator, List, Dict, Iterable, Set, Tuple
+
+import psycopg
+from psycopg.rows import dict_row, tuple_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+import migrations
+import partitions
+import queries
+import telemetry
+from telemetry import timed_db_call
+from cache import (
+    MISSING,
+    share_points_cache,
+    promoter_bank_cache,
+    user_profile_cache,
+    share_board_snapshot,
+)
+from db import (
+    DATABASE_URL,
+    DATABASE_REPLICA_URL,
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_POOL_TIMEOUT,
+    DB_EXPORT_FETCH_SIZE,
+    DB_EXPORT_MAX_CONCURRENT,
+    DB_SCHEMA_WAIT_TIMEOUT,
+    month_bounds,
+    current_month_start,
+    REWARD_TARGETS,
+    EMPTY_PROFILE,
+    ReplicaState,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# connection pool
+# =========================
+
+class _TimedCursor(psycopg.AsyncCursor):
+    """AsyncCursor שמודד execute / fetch ומדווח על שאילתות איטיות (ראה telemetry.py)."""
+
+    async def execute(self, query, params=None, **kwargs):
+        label = telemetry.current_db_call.get()
+        start = time.perf_counter()
+        await super().execute(query, params, **kwargs)
+        elapsed = time.perf_counter() - start
+        telemetry.observe("db_execute", label, elapsed)
+        if telemetry.is_slow(elapsed):
+            plan = await self._explain(query, params) if telemetry.should_explain(query) else None
+            telemetry.record_slow_query(label, elapsed, query, plan)
+        return self
+
+    async def _explain(self, query, params) -> Optional[str]:
+        # cursor רגיל ונפרד – לא דורס את התוצאות של השאילתה עצמה;
+        # savepoint כדי ש-EXPLAIN שנכשל לא יפיל את הטרנזקציה
+        cur = psycopg.AsyncCursor(self.connection, row_factory=tuple_row)
+        try:
+            await cur.execute("SAVEPOINT slow_query_explain;")
+            try:
+                await cur.execute("EXPLAIN " + query, params)
+                plan = "\n".join(row[0] for row in await cur.fetchall())
+                await cur.execute("RELEASE SAVEPOINT slow_query_explain;")
+                return plan
+            except psycopg.Error as e:
+                logger.debug("EXPLAIN failed: %s", e)
+                await cur.execute("ROLLBACK TO SAVEPOINT slow_query_explain;")
+                return None
+        except psycopg.Error:
+            return None
+        finally:
+            await cur.close()
+
+    async def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return await fetch(*args)
+        finally:
+            telemetry.observe(
+                "db_fetch", telemetry.current_db_call.get(), time.perf_counter() - start
+            )
+
+    async def fetchone(self):
+        return await self._timed_fetch(super().fetchone)
+
+    async def fetchmany(self, size: int = 0):
+        return await self._timed_fetch(super().fetchmany, size)
+
+    async def fetchall(self):
+        return await self._timed_fetch(super().fetchall)
+
+
+_pool: Optional[AsyncConnectionPool] = None
+_replica_pool: Optional[AsyncConnectionPool] = None
+_pool_lock = asyncio.Lock()
+replica_state = ReplicaState()
+# בדיקות lag שרצות ברקע (שומרים הפניה כדי שלא ייאספו באמצע)
+_lag_tasks: Set[asyncio.Task] = set()
+
+
+async def _open(dsn: str, name: str) -> AsyncConnectionPool:
+    pool = AsyncConnectionPool(
+        dsn,
+        min_size=DB_POOL_MIN,
+        max_size=DB_POOL_MAX,
+        timeout=DB_POOL_TIMEOUT,
+        kwargs={"row_factory": dict_row, "cursor_factory": _TimedCursor},
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+    await pool.open()
+    logger.info(
+        "Async DB %s pool opened (min=%s, max=%s)", name, DB_POOL_MIN, DB_POOL_MAX
+    )
+    return pool
+
+
+async def _get_pool() -> Optional[AsyncConnectionPool]:
+    global _pool
+    if not DATABASE_URL:
+        return None
+    if _pool is not None:
+        return _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await _open(DATABASE_URL, "primary")
+    return _pool
+
+
+async def _get_replica_pool() -> Optional[AsyncConnectionPool]:
+    global _replica_pool
+    if not DATABASE_REPLICA_URL:
+        return None
+    if _replica_pool is not None:
+        return _replica_pool
+    async with _pool_lock:
+        if _replica_pool is None:
+            _replica_pool = await _open(DATABASE_REPLICA_URL, "replica")
+    return _replica_pool
+
+
+async def open_pool() -> None:
+    await _get_pool()
+    await _get_replica_pool()
+
+
+async def close_pool() -> None:
+    global _pool, _replica_pool
+    for task in list(_lag_tasks):
+        task.cancel()
+    async with _pool_lock:
+        for pool in (_pool, _replica_pool):
+            if pool is not None:
+                await pool.close()
+        if _pool is not None or _replica_pool is not None:
+            logger.info("Async DB pools closed.")
+        _pool = None
+        _replica_pool = None
+
+
+def get_pool_stats() -> Dict[str, int]:
+    if _pool is None:
+        return {}
+    return _pool.get_stats()
+
+
+def get_replica_stats() -> Dict[str, Any]:
+    """lag אחרון של ה-replica (בשניות) ומוני ניתוב; {} כשאין replica."""
+    if not DATABASE_REPLICA_URL:
+        return {}
+    stats = replica_state.snapshot()
+    if _replica_pool is not None:
+        stats["pool"] = _replica_pool.get_stats()
+    return stats
+
+
+async def _check_replica_lag(pool: AsyncConnectionPool) -> None:
+    try:
+        async with pool.connection(timeout=DB_POOL_TIMEOUT) as conn:
+            cur = await conn.execute(queries.REPLICA_LAG)
+            row = await cur.fetchone()
+        replica_state.record_lag(float(row["lag"]))
+    except (psycopg.Error, PoolTimeout) as e:
+        replica_state.record_failure(e)
+    finally:
+        _lag_tasks.discard(asyncio.current_task())
+
+
+@asynccontextmanager
+async def db_cursor(readonly: bool = False):
+    """
+    cursor בטרנזקציה – pool.connection() עושה commit ביציאה תקינה
+    ו-rollback בחריגה. readonly=True – השאילתה יכולה לרוץ על ה-replica
+    כשהוא זמין וה-lag בגבול DB_REPLICA_MAX_LAG; אחרת על ה-primary.
+    """
+    pool = await _get_pool()
+    if pool is None:
+        yield None, None
+        return
+
+    start = time.perf_counter()
+    async with AsyncExitStack() as stack:
+        conn = None
+        on_replica = False
+        if readonly and DATABASE_REPLICA_URL:
+            replica = await _get_replica_pool()
+            if replica_state.claim_check():
+                # הבדיקה רצה ברקע; הקריאה הזו מנותבת לפי המדידה הקודמת
+                _lag_tasks.add(asyncio.create_task(_check_replica_lag(replica)))
+            if replica_state.usable():
+                try:
+                    conn = await stack.enter_async_context(replica.connection())
+                    on_replica = True
+                    replica_state.bump("reads")
+                except (psycopg.Error, PoolTimeout) as e:
+                    replica_state.record_failure(e)
+            if conn is None:
+                replica_state.bump("fallbacks")
+        if conn is None:
+            conn = await stack.enter_async_context(pool.connection())
+        telemetry.observe(
+            "db_pool_wait", telemetry.current_db_call.get(), time.perf_counter() - start
+        )
+
+        cur = await stack.enter_async_context(conn.cursor())
+        try:
+            yield conn, cur
+        except psycopg.OperationalError as e:
+            if on_replica:
+                replica_state.record_failure(e)
+            raise
+
+
+async def init_schema() -> None:
+    """
+    מריץ את מיגרציות הסכמה שעוד לא רצו (ראה migrations.py) ב-thread נפרד.
+    לא מוחק נתונים קיימים; כשאין שינוי זו שאילתה אחת.
+    """
+    if not DATABASE_URL:
+        logger.warning("init_schema called but DATABASE_URL not set.")
+        return
+
+    await asyncio.to_thread(migrations.run_migrations, DATABASE_URL)
+
+
+async def wait_for_schema(timeout: float = DB_SCHEMA_WAIT_TIMEOUT) -> bool:
+    """
+    ל-worker שאינו leader: מחכה שה-leader יריץ את כל המיגרציות לפני
+    שמתחילים לטפל בעדכונים. False אם עבר timeout (ממשיכים בכל זאת).
+    """
+    latest = migrations.latest_version()
+    deadline = time.monotonic() + timeout
+    version = 0
+    while True:
+        try:
+            async with db_cursor() as (conn, cur):
+                if cur is None:
+                    return True
+                await cur.execute(queries.SCHEMA_VERSION)
+                version = (await cur.fetchone())["version"]
+        except psycopg.errors.UndefinedTable:
+            version = 0
+        except (psycopg.Error, PoolTimeout) as e:
+            logger.warning("Waiting for DB schema: %s", e)
+        if version >= latest:
+            return True
+        if time.monotonic() >= deadline:
+            logger.warning(
+                "DB schema still at version %s (expected %s) after %ss.",
+                version,
+                latest,
+                timeout,
+            )
+            return False
+        await asyncio.sleep(1)
+
+
+async def maintain_partitions() -> Dict[str, Dict[str, List[str]]]:
+    """
+    יוצר partitions חודשיים קדימה ל-payments / rewards ומעביר לארכיון
+    partitions ישנים (ראה partitions.py), ב-thread נפרד.
+    """
+    if not DATABASE_URL:
+        logger.warning("maintain_partitions called but DATABASE_URL not set.")
+        return {}
+
+    return await asyncio.to_thread(partitions.maintain_partitions, DATABASE_URL)
+
+
+@timed_db_call
+async def backfill_leaderboards() -> None:
+    """בונה מחדש את referral_totals / reward_totals מ-referrals / rewards."""
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        for statement in queries.BACKFILL_LEADERBOARDS:
+            await cur.execute(statement)
+        logger.info("Leaderboard totals backfilled.")
+
+
+# =========================
+# payments
+# =========================
+
+@timed_db_call
+async def log_payment(user_id: int, username: Optional[str], pay_method: str) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            logger.warning("log_payment called without DB.")
+            return
+        await cur.execute(queries.LOG_PAYMENT, (user_id, username, pay_method))
+    user_profile_cache.invalidate(user_id)
+
+
+@timed_db_call
+async def update_payment_status(user_id: int, status: str, reason: Optional[str]) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            logger.warning("update_payment_status called without DB.")
+            return
+        await cur.execute(
+            queries.UPDATE_PAYMENT_STATUS,
+            {"user_id": user_id, "status": status, "reason": reason},
+        )
+    user_profile_cache.invalidate(user_id)
+
+
+# =========================
+# pending_payments / pending_rejects
+# =========================
+
+@timed_db_call
+async def save_pending_payment(
+    user_id: int,
+    file_id: str,
+    pay_method: Optional[str],
+    username: Optional[str],
+    chat_id: Optional[int],
+) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(
+            queries.SAVE_PENDING_PAYMENT, (user_id, file_id, pay_method, username, chat_id)
+        )
+
+
+@timed_db_call
+async def get_pending_payment(user_id: int) -> Optional[Dict[str, Any]]:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return None
+        await cur.execute(queries.GET_PENDING_PAYMENT, (user_id,))
+        row = await cur.fetchone()
+        return dict(row) if row else None
+
+
+@timed_db_call
+async def set_pending_reject(admin_id: int, target_id: int) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.SET_PENDING_REJECT, (admin_id, target_id))
+
+
+@timed_db_call
+async def pop_pending_reject(admin_id: int) -> Optional[int]:
+    """ה-user_id שהאדמין בחר לדחות (ומוחק את הבחירה), או None."""
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return None
+        await cur.execute(queries.POP_PENDING_REJECT, (admin_id,))
+        row = await cur.fetchone()
+        return int(row["target_id"]) if row else None
+
+
+# =========================
+# users / referrals
+# =========================
+
+@timed_db_call
+async def store_user(user_id: int, username: Optional[str]) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.STORE_USER, (user_id, username))
+
+
+@timed_db_call
+async def add_referral(referrer_id: int, referred_id: int, source: str) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.ADD_REFERRAL, (referrer_id, referred_id, source))
+    user_profile_cache.invalidate(referrer_id)
+
+
+@timed_db_call
+async def get_top_referrers(limit: int = 10) -> List[Dict[str, Any]]:
+    async with db_cursor(readonly=True) as (conn, cur):
+        if cur is None:
+            return []
+        await cur.execute(queries.GET_TOP_REFERRERS, (limit,))
+        return await cur.fetchall()
+
+
+# =========================
+# דוחות תשלומים
+# =========================
+
+@timed_db_call
+async def get_monthly_payments(year: int, month: int) -> List[Dict[str, Any]]:
+    """
+    פילוח תשלומים לחודש (UTC) לפי אמצעי תשלום וסטטוס.
+    החודש הנוכחי מחושב חי; חודשים קודמים מגיעים מ-payments_monthly.
+    """
+    start, end = month_bounds(year, month)
+    async with db_cursor(readonly=True) as (conn, cur):
+        if cur is None:
+            return []
+        if end <= current_month_start():
+            await cur.execute(queries.GET_MONTHLY_PAYMENTS_ROLLUP, (start.date(),))
+        else:
+            await cur.execute(queries.GET_MONTHLY_PAYMENTS_LIVE, (start, end))
+        rows = await cur.fetchall()
+        return [dict(row) for row in rows]
+
+
+@timed_db_call
+async def get_approval_stats() -> Optional[Dict[str, Any]]:
+    async with db_cursor(readonly=True) as (conn, cur):
+        if cur is None:
+            return None
+        await cur.execute(queries.GET_APPROVAL_STATS)
+        return await cur.fetchone()
+
+
+# =========================
+# rewards / נקודות
+# =========================
+
+@timed_db_call
+async def create_reward(
+    user_id: int, reward_type: str, reason: str, points: int = 0
+) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.CREATE_REWARD, (user_id, reward_type, reason, points))
+    if reward_type == "SHARE_POINTS":
+        share_points_cache.invalidate(user_id)
+        user_profile_cache.invalidate(user_id)
+        share_board_snapshot.mark_stale()
+
+
+@timed_db_call
+async def get_share_points(user_id: int) -> int:
+    cached = share_points_cache.get(user_id)
+    if cached is not MISSING:
+        return cached
+    epoch = share_points_cache.begin_read()
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return 0
+        await cur.execute(queries.GET_SHARE_POINTS, (user_id,))
+        row = await cur.fetchone()
+    points = int(row["pts"]) if row else 0
+    share_points_cache.fill(user_id, points, epoch)
+    return points
+
+
+@timed_db_call
+async def get_top_sharers(limit: int = 10) -> List[Dict[str, Any]]:
+    async with db_cursor(readonly=True) as (conn, cur):
+        if cur is None:
+            return []
+        await cur.execute(queries.GET_TOP_SHARERS, (limit,))
+        return await cur.fetchall()
+
+
+# =========================
+# rewards – הנפקה מרוכזת (airdrop / בונוס)
+# =========================
+
+@timed_db_call
+async def create_rewards_bulk(
+    rewards: Iterable[Tuple[int, int]], reward_type: str, reason: str
+) -> int:
+    """
+    מנפיק rewards לרשימת (user_id, points) בטרנזקציה אחת (COPY).
+    מחזיר כמה שורות נוספו ל-rewards.
+    """
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return 0
+        await cur.execute(queries.CREATE_BULK_REWARD_STAGING)
+        async with cur.copy(queries.COPY_BULK_REWARD_ROWS) as copy:
+            for user_id, points in rewards:
+                await copy.write_row((user_id, points))
+        await cur.execute(queries.INSERT_BULK_REWARDS, (reward_type, reason))
+        inserted = cur.rowcount
+        await cur.execute(queries.UPSERT_BULK_REWARD_TOTALS, (reward_type,))
+    if reward_type == "SHARE_POINTS":
+        share_points_cache.clear()
+        user_profile_cache.clear()
+        share_board_snapshot.mark_stale()
+    return inserted
+
+
+@timed_db_call
+async def get_reward_targets(target: str, limit: Optional[int] = None) -> List[int]:
+    """
+    user_ids לקמפיין: approved – כל מי שיש לו תשלום מאושר,
+    top_sharers – limit המשתפים המובילים.
+    """
+    if target not in REWARD_TARGETS:
+        raise ValueError(f"unknown reward target: {target}")
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return []
+        if target == "approved":
+            await cur.execute(queries.GET_APPROVED_USER_IDS)
+        else:
+            await cur.execute(queries.GET_TOP_SHARER_IDS, (limit or 10,))
+        return [int(row["user_id"]) for row in await cur.fetchall()]
+
+
+@timed_db_call
+async def get_user_paid(user_id: int) -> bool:
+    """האם יש למשתמש תשלום מאושר (המקור של PaidUserIndex)."""
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return False
+        await cur.execute(queries.IS_USER_PAID, (user_id,))
+        row = await cur.fetchone()
+        return bool(row["paid"]) if row else False
+
+
+# =========================
+# promoters – בנק אישי למפיצים
+# =========================
+
+@timed_db_call
+async def set_promoter_bank(user_id: int, bank_details: str) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.SET_PROMOTER_BANK, (user_id, bank_details))
+    promoter_bank_cache.set(user_id, bank_details)
+    user_profile_cache.invalidate(user_id)
+
+
+@timed_db_call
+async def get_promoter_bank(user_id: int) -> Optional[str]:
+    cached = promoter_bank_cache.get(user_id)
+    if cached is not MISSING:
+        return cached
+    epoch = promoter_bank_cache.begin_read()
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return None
+        await cur.execute(queries.GET_PROMOTER_BANK, (user_id,))
+        row = await cur.fetchone()
+    bank_details = row["bank_details"] if row else None
+    promoter_bank_cache.fill(user_id, bank_details, epoch)
+    return bank_details
+
+
+# =========================
+# פרופיל משתמש
+# =========================
+
+@timed_db_call
+async def get_user_profile(user_id: int) -> Dict[str, Any]:
+    """
+    נקודות שיתוף, מספר הפניות, בנק מפיץ, סטטוס התשלום האחרון
+    והאם יש תשלום מאושר – בשאילתה אחת (ודרך user_profile_cache).
+    """
+    cached = user_profile_cache.get(user_id)
+    if cached is not MISSING:
+        return dict(cached)
+    epoch = user_profile_cache.begin_read()
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return dict(EMPTY_PROFILE)
+        await cur.execute(queries.GET_USER_PROFILE, {"user_id": user_id})
+        profile = dict(await cur.fetchone())
+    user_profile_cache.fill(user_id, profile, epoch)
+    return dict(profile)
+
+
+# =========================
+# media_cache – file_id של קבצים שהועלו
+# =========================
+
+@timed_db_call
+async def get_media_file_id(key: str) -> Optional[str]:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return None
+        await cur.execute(queries.GET_MEDIA_FILE_ID, (key,))
+        row = await cur.fetchone()
+        return row["file_id"] if row else None
+
+
+@timed_db_call
+async def set_media_file_id(key: str, file_id: str) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.SET_MEDIA_FILE_ID, (key, file_id))
+
+
+@timed_db_call
+async def delete_media_file_id(key: str) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.DELETE_MEDIA_FILE_ID, (key,))
+
+
+# =========================
+# metrics – counters
+# =========================
+
+@timed_db_call
+async def increment_metric(key: str, delta: int = 1) -> int:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return 0
+        await cur.execute(queries.INCREMENT_METRIC, (key, delta))
+        row = await cur.fetchone()
+        return int(row["value"]) if row else 0
+
+
+@timed_db_call
+async def get_metric(key: str) -> int:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return 0
+        await cur.execute(queries.GET_METRIC, (key,))
+        row = await cur.fetchone()
+        if not row:
+            return 0
+        return int(row["value"])
+
+
+@timed_db_call
+async def add_metrics(deltas: Dict[str, int]) -> Dict[str, int]:
+    """מוסיף כמה מונים בשאילתה אחת ומחזיר את הערכים החדשים."""
+    if not deltas:
+        return {}
+    keys = sorted(deltas)
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return {}
+        await cur.execute(queries.ADD_METRICS, (keys, [deltas[k] for k in keys]))
+        return {row["key"]: int(row["value"]) for row in await cur.fetchall()}
+
+
+@timed_db_call
+async def get_metrics(keys: List[str]) -> Dict[str, int]:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return {}
+        await cur.execute(queries.GET_METRICS, (list(keys),))
+        return {row["key"]: int(row["value"]) for row in await cur.fetchall()}
+
+
+@timed_db_call
+async def reserve_metric_range(key: str, size: int) -> int:
+    """
+    שומר size מספרים סידוריים עבור key ומחזיר את האחרון בטווח;
+    הטווח הוא (value - size + 1) .. value.
+    """
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return 0
+        await cur.execute(
+            queries.RESERVE_METRIC_RANGE,
+            {"hwm_key": f"{key}:serial_hwm", "key": key, "size": size},
+        )
+        row = await cur.fetchone()
+        return int(row["value"]) if row else 0
+
+
+# =========================
+# dedup של עדכוני טלגרם
+# =========================
+
+@timed_db_call
+async def claim_update(update_id: int) -> bool:
+    """
+    רושם update_id ב-processed_updates. True אם הוא חדש,
+    False אם worker כלשהו כבר קיבל אותו.
+    """
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return True
+        await cur.execute(queries.CLAIM_UPDATE, (update_id,))
+        return await cur.fetchone() is not None
+
+
+@timed_db_call
+async def release_update(update_id: int) -> None:
+    """מוחק update_id שלא עובד בסוף (למשל נדחה כי התור מלא), כדי שהניסיון החוזר יעבור."""
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.RELEASE_UPDATE, (update_id,))
+
+
+@timed_db_call
+async def purge_processed_updates(ttl_seconds: float) -> int:
+    """מוחק רשומות dedup ישנות מ-ttl_seconds; מחזיר כמה נמחקו."""
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return 0
+        await cur.execute(queries.PURGE_PROCESSED_UPDATES, (ttl_seconds,))
+        return cur.rowcount
+
+
+# =========================
+# broadcasts – הודעה לכל המשתמשים
+# =========================
+
+@timed_db_call
+async def create_broadcast(
+    text: str, created_by: Optional[int], admin_chat_id: Optional[int]
+) -> Optional[Dict[str, Any]]:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return None
+        await cur.execute(queries.CREATE_BROADCAST, (text, created_by, admin_chat_id))
+        row = await cur.fetchone()
+        return dict(row) if row else None
+
+
+@timed_db_call
+async def get_broadcast(broadcast_id: int) -> Optional[Dict[str, Any]]:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return None
+        await cur.execute(queries.GET_BROADCAST, (broadcast_id,))
+        row = await cur.fetchone()
+        return dict(row) if row else None
+
+
+@timed_db_call
+async def list_broadcasts(limit: int = 20) -> List[Dict[str, Any]]:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return []
+        await cur.execute(queries.LIST_BROADCASTS, (limit,))
+        return [dict(row) for row in await cur.fetchall()]
+
+
+@timed_db_call
+async def get_unfinished_broadcasts() -> List[int]:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return []
+        await cur.execute(queries.GET_UNFINISHED_BROADCASTS)
+        return [row["id"] for row in await cur.fetchall()]
+
+
+@timed_db_call
+async def set_broadcast_status(broadcast_id: int, status: str) -> bool:
+    """מחזיר False אם ה-broadcast לא קיים או כבר הסתיים / בוטל."""
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return False
+        await cur.execute(
+            queries.SET_BROADCAST_STATUS,
+            {"status": status, "broadcast_id": broadcast_id},
+        )
+        return await cur.fetchone() is not None
+
+
+@timed_db_call
+async def set_broadcast_progress_message(broadcast_id: int, message_id: int) -> None:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.SET_BROADCAST_PROGRESS_MESSAGE, (message_id, broadcast_id))
+
+
+@timed_db_call
+async def get_broadcast_recipients(
+    broadcast_id: int, after_id: int, limit: int
+) -> List[int]:
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return []
+        await cur.execute(
+            queries.GET_BROADCAST_RECIPIENTS,
+            {"broadcast_id": broadcast_id, "after_id": after_id, "limit": limit},
+        )
+        return [row["id"] for row in await cur.fetchall()]
+
+
+@timed_db_call
+async def record_broadcast_batch(
+    broadcast_id: int,
+    results: List[Tuple[int, str, Optional[str]]],
+    last_user_id: int,
+) -> Optional[Dict[str, Any]]:
+    """
+    שומר (user_id, status, error) של אצווה ומקדם את last_user_id.
+    מחזיר את המצב המעודכן (status + מונים) – כך רואים גם ביטול מ-worker אחר.
+    """
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return None
+        await cur.execute(
+            queries.RECORD_BROADCAST_BATCH,
+            {
+                "broadcast_id": broadcast_id,
+                "user_ids": [r[0] for r in results],
+                "statuses": [r[1] for r in results],
+                "errors": [r[2] for r in results],
+                "last_user_id": last_user_id,
+            },
+        )
+        row = await cur.fetchone()
+        return dict(row) if row else None
+
+
+# =========================
+# PTB persistence – user_data / bot_data
+# =========================
+
+@timed_db_call
+async def get_ptb_user_data(
+    user_id: int, since: int
+) -> Tuple[bool, Optional[bytes], int]:
+    """
+    (changed, data, seen): changed – השורה נכתבה מאז since; data None –
+    נמחקה (או שאין שורה). seen – ה-since לקריאה הבאה.
+    """
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return False, None, since
+        await cur.execute(queries.GET_PTB_USER_DATA, (user_id, since))
+        row = await cur.fetchone()
+    data = bytes(row["data"]) if row["data"] is not None else None
+    return row["changed"], data, int(row["seen"])
+
+
+@timed_db_call
+async def save_ptb_user_data(rows: Dict[int, bytes]) -> None:
+    """כותב כמה משתמשים בשאילתה אחת."""
+    if not rows:
+        return
+    user_ids = sorted(rows)
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(
+            queries.SAVE_PTB_USER_DATA, (user_ids, [rows[uid] for uid in user_ids])
+        )
+
+
+@timed_db_call
+async def delete_ptb_user_data(user_ids: List[int]) -> None:
+    if not user_ids:
+        return
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.DELETE_PTB_USER_DATA, (list(user_ids),))
+
+
+@timed_db_call
+async def get_ptb_bot_data(since: int) -> Tuple[List[Tuple[str, Optional[bytes]]], int]:
+    """
+    ([(key, data)], seen) – המפתחות שנכתבו מאז since (data None – נמחק),
+    ו-seen ל-since של הקריאה הבאה.
+    """
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return [], since
+        await cur.execute(queries.GET_PTB_BOT_DATA, (since,))
+        rows = await cur.fetchall()
+    changed = [
+        (row["key"], bytes(row["data"]) if row["data"] is not None else None)
+        for row in rows
+        if row["key"] is not None
+    ]
+    return changed, int(rows[0]["seen"])
+
+
+@timed_db_call
+async def save_ptb_bot_data(rows: Dict[str, bytes]) -> None:
+    if not rows:
+        return
+    keys = sorted(rows)
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.SAVE_PTB_BOT_DATA, (keys, [rows[key] for key in keys]))
+
+
+@timed_db_call
+async def delete_ptb_bot_data(keys: List[str]) -> None:
+    if not keys:
+        return
+    async with db_cursor() as (conn, cur):
+        if cur is None:
+            return
+        await cur.execute(queries.DELETE_PTB_BOT_DATA, (list(keys),))
+
+
+# =========================
+# exports – ייצוא מלא לאדמין
+# =========================
+
+class ExportBusy(Exception):
+    """כבר רצים DB_EXPORT_MAX_CONCURRENT ייצואים."""
+
+
+_exports_running = 0
+
+
+async def export_rows(
+    table: str, after_id: int = 0, limit: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    מחזיר את השורות של table לפי id (אחרי after_id) מ-cursor בצד השרת,
+    כך שהזיכרון קבוע גם במיליוני שורות. רץ על חיבור ייעודי (לא מה-pool,
+    כדי שהורדה ארוכה לא תתפוס חיבור של ה-handlers) בטרנזקציית
+    REPEATABLE READ READ ONLY – snapshot עקבי לכל ההורדה.
+    מעל DB_EXPORT_MAX_CONCURRENT ייצואים פתוחים – ExportBusy בשורה הראשונה.
+    """
+    global _exports_running
+    if table not in queries.EXPORT_COLUMNS:
+        raise ValueError(f"unknown export table: {table}")
+    if not DATABASE_URL:
+        return
+    if _exports_running >= DB_EXPORT_MAX_CONCURRENT:
+        raise ExportBusy(f"{_exports_running} exports already running")
+
+    _exports_running += 1
+    try:
+        conn = await psycopg.AsyncConnection.connect(DATABASE_URL, row_factory=dict_row)
+        try:
+            await conn.set_isolation_level(psycopg.IsolationLevel.REPEATABLE_READ)
+            await conn.set_read_only(True)
+            async with conn.cursor(name=f"export_{table}") as cur:
+                cur.itersize = DB_EXPORT_FETCH_SIZE
+                await cur.execute(
+                    queries.EXPORT_QUERIES[table], {"after_id": after_id, "limit": limit}
+                )
+                async for row in cur:
+                    yield row
+        finally:
+            await conn.close()
+    finally:
+        _exports_running -= 1
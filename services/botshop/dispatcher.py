@@ -0,0 +1,217 @@
+# dispatcher.py
+"""
+תור עדכונים ל-webhook: ה-endpoint מכניס עדכון לתור ומחזיר 200 מיד,
+ו-WEBHOOK_WORKERS workers מעבדים את התור ברקע.
+
+- סדר לפי צ'אט: לכל צ'אט תור משלו, ובכל רגע רק worker אחד מעבד אותו,
+  כך שעדכונים של אותו צ'אט מעובדים אחד אחרי השני, לפי סדר ההגעה.
+- worker פנוי לוקח את הצ'אט הבא שמחכה (ולא לפי chat_id % workers) – handler
+  שממתין ל-rate limit של צ'אט אחד (למשל קבוצת הלוגים, 20 הודעות לדקה)
+  לא מעכב צ'אטים אחרים כל עוד יש workers פנויים. צ'אט שנשארו לו עדכונים
+  חוזר לסוף התור, כדי שצ'אט עמוס לא יתפוס worker לאורך זמן.
+- back-pressure: כשיש WEBHOOK_QUEUE_MAX עדכונים ממתינים – 503;
+  כשלצ'אט אחד יש WEBHOOK_CHAT_QUEUE_MAX ממתינים – 429; בזמן כיבוי – 503.
+  טלגרם שולח שוב עדכון שלא קיבל עליו 2xx.
+- כיבוי: עדכונים שעוד בתור אחרי WEBHOOK_DRAIN_TIMEOUT נזרקים; הם נספרים
+  ב-dropped, ו-on_drop(update_id) נקרא לכל אחד (משחרר את ה-claim של ה-dedup).
+  עדכון שנקטע באמצע עיבוד נספר ב-cancelled ונשאר מסומן – ייתכן שחלק ממנו כבר בוצע.
+- מדדים: עומק התור (stats()) וזמני המתנה / עיבוד בסדרה webhook
+  של telemetry.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from telegram import Update
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_MAX = int(os.environ.get("WEBHOOK_QUEUE_MAX", "1000"))
+WEBHOOK_CHAT_QUEUE_MAX = int(os.environ.get("WEBHOOK_CHAT_QUEUE_MAX", "20"))
+# כמה שניות לחכות בכיבוי לעדכונים שכבר בתור
+WEBHOOK_DRAIN_TIMEOUT = float(os.environ.get("WEBHOOK_DRAIN_TIMEOUT", "10"))
+
+# תוצאות של submit()
+ACCEPTED = "accepted"
+QUEUE_FULL = "queue_full"
+CHAT_BUSY = "chat_busy"
+# לא רץ (לפני start / בזמן כיבוי) – טלגרם ישלח שוב, אולי ל-worker אחר
+STOPPING = "stopping"
+
+
+def chat_key(update: Update) -> int:
+    """המפתח לסדר: הצ'אט, ואם אין – המשתמש."""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return 0
+
+
+class UpdateDispatcher:
+    def __init__(
+        self,
+        process: Callable[[Update], Awaitable[None]],
+        workers: int = WEBHOOK_WORKERS,
+        max_queue: int = WEBHOOK_QUEUE_MAX,
+        max_per_chat: int = WEBHOOK_CHAT_QUEUE_MAX,
+        on_drop: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> None:
+        self.process = process
+        self.on_drop = on_drop
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.max_per_chat = max_per_chat
+
+        # צ'אטים שיש להם עדכון ממתין ואף worker לא מעבד אותם כרגע
+        self._ready: "asyncio.Queue[int]" = asyncio.Queue()
+        # צ'אט -> (update, enqueued_at) לפי סדר ההגעה; צ'אט נמצא כאן כל עוד
+        # הוא ב-_ready או בעיבוד
+        self._pending: Dict[int, Deque[Tuple[Update, float]]] = {}
+        self._active = 0
+        self._tasks: List[asyncio.Task] = []
+        # עדכונים שהתקבלו ועוד לא סיימו עיבוד, סה"כ ולפי צ'אט
+        self._depth = 0
+        self._per_chat: Dict[int, int] = {}
+        self._stopping = False
+        self._stats: Dict[str, int] = {
+            "accepted": 0,
+            "rejected_full": 0,
+            "rejected_chat": 0,
+            "rejected_stopping": 0,
+            "processed": 0,
+            "failed": 0,
+            "dropped": 0,
+            "cancelled": 0,
+            "max_depth": 0,
+        }
+
+    # ---------- lifecycle ----------
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._stopping = False
+        self._ready = asyncio.Queue()
+        self._pending = {}
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(
+            "Webhook dispatcher started (workers=%s, max_queue=%s)",
+            self.workers,
+            self.max_queue,
+        )
+
+    async def stop(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT) -> None:
+        """מחכה עד timeout שהתור יתרוקן ואז עוצר את ה-workers."""
+        if not self._tasks:
+            return
+        # עדכונים חדשים נדחים מעכשיו; מה שכבר בתור מעובד
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # מה שלא הגיע ל-worker עד ה-timeout לא יעובד כאן
+        dropped = [update.update_id for pending in self._pending.values() for update, _ in pending]
+        self._ready = asyncio.Queue()
+        self._pending = {}
+        self._per_chat = {}
+        self._depth = 0
+        if not dropped:
+            return
+        self._stats["dropped"] += len(dropped)
+        logger.warning(
+            "Webhook dispatcher stopped with %s updates still queued: %s", len(dropped), dropped
+        )
+        if self.on_drop is not None:
+            results = await asyncio.gather(
+                *(self.on_drop(update_id) for update_id in dropped), return_exceptions=True
+            )
+            for update_id, result in zip(dropped, results):
+                if isinstance(result, Exception):
+                    logger.error("on_drop failed for update_id=%s: %s", update_id, result)
+
+    # ---------- enqueue / process ----------
+
+    def submit(self, update: Update) -> str:
+        """מכניס עדכון לתור בלי לחכות; מחזיר ACCEPTED / QUEUE_FULL / CHAT_BUSY / STOPPING."""
+        if not self._tasks or self._stopping:
+            self._stats["rejected_stopping"] += 1
+            return STOPPING
+        if self._depth >= self.max_queue:
+            self._stats["rejected_full"] += 1
+            return QUEUE_FULL
+        key = chat_key(update)
+        if self._per_chat.get(key, 0) >= self.max_per_chat:
+            self._stats["rejected_chat"] += 1
+            return CHAT_BUSY
+
+        self._per_chat[key] = self._per_chat.get(key, 0) + 1
+        self._depth += 1
+        self._stats["accepted"] += 1
+        if self._depth > self._stats["max_depth"]:
+            self._stats["max_depth"] = self._depth
+        item = (update, time.perf_counter())
+        pending = self._pending.get(key)
+        if pending is not None:
+            # הצ'אט כבר בתור / בעיבוד – העדכון יטופל אחרי הקודמים
+            pending.append(item)
+        else:
+            self._pending[key] = deque([item])
+            self._ready.put_nowait(key)
+        return ACCEPTED
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            update, enqueued_at = self._pending[key].popleft()
+            self._active += 1
+            started = time.perf_counter()
+            telemetry.observe("webhook", "queue_wait", started - enqueued_at)
+            try:
+                await self.process(update)
+                self._stats["processed"] += 1
+            except asyncio.CancelledError:
+                self._stats["cancelled"] += 1
+                logger.warning("Processing of update_id=%s cancelled on shutdown.", update.update_id)
+                raise
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error("Failed to process update_id=%s: %s", update.update_id, e)
+            finally:
+                done = time.perf_counter()
+                telemetry.observe("webhook", "process", done - started)
+                telemetry.observe("webhook", "total", done - enqueued_at)
+                self._active -= 1
+                self._depth -= 1
+                remaining = self._per_chat.get(key, 1) - 1
+                if remaining:
+                    self._per_chat[key] = remaining
+                else:
+                    self._per_chat.pop(key, None)
+                if self._pending[key]:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                self._ready.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        stats["depth"] = self._depth
+        stats["busy_chats"] = len(self._per_chat)
+        stats["workers"] = self.workers
+        stats["max_queue"] = self.max_queue
+        stats["busy_workers"] = self._active
+        stats["ready_chats"] = self._ready.qsize()
+        return stats
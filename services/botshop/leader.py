@@ -0,0 +1,174 @@
+# leader.py
+"""
+בחירת leader בין כמה workers / replicas (uvicorn --workers N, כמה מכונות).
+
+- ה-leader הוא מי שמחזיק pg_try_advisory_lock(LEADER_LOCK_ID) על חיבור
+  ייעודי ל-DB (לא מה-pool – מנעול session נשאר על החיבור שלקח אותו).
+- רק ה-leader רושם webhook, מריץ מיגרציות / partitions ומריץ jobs
+  מתוזמנים ו-broadcasts; שאר ה-workers רק מטפלים בעדכונים.
+- כל LEADER_CHECK_INTERVAL שניות ה-leader בודק שהחיבור חי. worker שנפל
+  (או שהחיבור שלו נותק) משחרר את המנעול ב-Postgres, ו-worker אחר לוקח
+  אותו בניסיון הבא שלו (כל LEADER_RETRY_INTERVAL שניות).
+"""
+import os
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+# מזהה קבוע ל-advisory lock של ה-leader (ליד MIGRATIONS_LOCK_ID)
+LEADER_LOCK_ID = 7_240_002
+LEADER_RETRY_INTERVAL = float(os.environ.get("LEADER_RETRY_INTERVAL", "10"))
+LEADER_CHECK_INTERVAL = float(os.environ.get("LEADER_CHECK_INTERVAL", "10"))
+# timeout לחיבור / לבדיקה – חיבור תקוע נחשב כנפול
+LEADER_CONNECT_TIMEOUT = float(os.environ.get("LEADER_CONNECT_TIMEOUT", "5"))
+
+Callback = Callable[[], Awaitable[None]]
+
+
+class LeaderElection:
+    def __init__(
+        self,
+        dsn: str,
+        on_elected: Optional[Callback] = None,
+        on_demoted: Optional[Callback] = None,
+        lock_id: int = LEADER_LOCK_ID,
+        retry_interval: float = LEADER_RETRY_INTERVAL,
+        check_interval: float = LEADER_CHECK_INTERVAL,
+    ) -> None:
+        self.dsn = dsn
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.lock_id = lock_id
+        self.retry_interval = retry_interval
+        self.check_interval = check_interval
+
+        self._conn: Optional[psycopg.AsyncConnection] = None
+        self._is_leader = False
+        self._since: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, int] = {
+            "elections": 0,
+            "demotions": 0,
+            "attempts": 0,
+            "errors": 0,
+        }
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    # ---------- lifecycle ----------
+
+    async def acquire(self) -> bool:
+        """
+        ניסיון אחד לקחת את המנעול, בלי callbacks – ל-startup, לפני
+        שהאפליקציה עולה. True אם ה-worker הזה הוא ה-leader.
+        """
+        if self._is_leader:
+            return True
+        self._stats["attempts"] += 1
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = await psycopg.AsyncConnection.connect(
+                    self.dsn,
+                    autocommit=True,
+                    connect_timeout=max(1, int(LEADER_CONNECT_TIMEOUT)),
+                    keepalives=1,
+                    keepalives_idle=max(1, int(self.check_interval)),
+                    keepalives_interval=max(1, int(self.check_interval)),
+                    keepalives_count=3,
+                )
+            cur = await asyncio.wait_for(
+                self._conn.execute("SELECT pg_try_advisory_lock(%s);", (self.lock_id,)),
+                LEADER_CONNECT_TIMEOUT,
+            )
+            row = await cur.fetchone()
+        except (psycopg.Error, asyncio.TimeoutError, OSError) as e:
+            self._stats["errors"] += 1
+            logger.warning("Leader election attempt failed: %s", e)
+            await self._close()
+            return False
+
+        if row[0]:
+            self._is_leader = True
+            self._since = time.time()
+            self._stats["elections"] += 1
+            logger.info("This worker is now the leader (pid %s).", os.getpid())
+        return self._is_leader
+
+    def start(self) -> None:
+        """לולאת רקע: ניסיון בחירה / בדיקת חיבור, עם on_elected / on_demoted."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._is_leader:
+            await self._demote("shutdown")
+        # סגירת החיבור משחררת את המנעול – worker אחר לוקח אותו מיד
+        await self._close()
+
+    async def _run(self) -> None:
+        while True:
+            if self._is_leader:
+                await asyncio.sleep(self.check_interval)
+                if not await self._alive():
+                    await self._demote("lost DB connection")
+            else:
+                if await self.acquire():
+                    await self._callback(self.on_elected)
+                    continue
+                await asyncio.sleep(self.retry_interval)
+
+    # ---------- helpers ----------
+
+    async def _alive(self) -> bool:
+        try:
+            await asyncio.wait_for(self._conn.execute("SELECT 1;"), LEADER_CONNECT_TIMEOUT)
+            return True
+        except (psycopg.Error, asyncio.TimeoutError, OSError, AttributeError) as e:
+            self._stats["errors"] += 1
+            logger.error("Leader connection check failed: %s", e)
+            return False
+
+    async def _demote(self, reason: str) -> None:
+        log = logger.info if reason == "shutdown" else logger.warning
+        log("This worker is no longer the leader (%s).", reason)
+        self._is_leader = False
+        self._since = None
+        self._stats["demotions"] += 1
+        await self._close()
+        await self._callback(self.on_demoted)
+
+    async def _callback(self, callback: Optional[Callback]) -> None:
+        if callback is None:
+            return
+        try:
+            await callback()
+        except Exception as e:
+            logger.error("Leader callback %s failed: %s", callback.__name__, e)
+
+    async def _close(self) -> None:
+        if self._conn is not None:
+            try:
+                await self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        stats["is_leader"] = self._is_leader
+        stats["pid"] = os.getpid()
+        stats["leader_for_seconds"] = (
+            round(time.time() - self._since, 1) if self._since is not None else None
+        )
+        return stats
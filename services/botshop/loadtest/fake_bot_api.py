@@ -0,0 +1,243 @@
+# fake_bot_api.py
+"""
+Bot API מקומי ומזויף לבדיקות עומס – הבוט מדבר איתו במקום עם api.telegram.org
+(TELEGRAM_API_BASE_URL=http://127.0.0.1:8081), בלי רשת ובלי טוקן אמיתי.
+
+- כל קריאה נספרת לפי method; run.py (שמריץ את השרת באותו process) נרשם
+  ל-chat_id / callback_query_id ומקבל את הרגע שבו הבוט ענה למשתמש.
+- הזרקת latency (FAKE_API_LATENCY_MS ± FAKE_API_JITTER_MS) ו-429 עם
+  retry_after (FAKE_API_429_RATE) לשליחות בלבד – getMe / setWebhook תמיד עוברים.
+- GET /_stats – מונים; POST /_reset – איפוס.
+
+הרצה:
+    python loadtest/fake_bot_api.py --port 8081 --latency-ms 40 --rate-429 0.01
+"""
+import os
+import time
+import json
+import random
+import asyncio
+import argparse
+import itertools
+from collections import Counter
+from email import policy
+from email.parser import BytesParser
+from typing import Any, Dict
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+FAKE_API_LATENCY_MS = float(os.environ.get("FAKE_API_LATENCY_MS", "30"))
+FAKE_API_JITTER_MS = float(os.environ.get("FAKE_API_JITTER_MS", "20"))
+FAKE_API_429_RATE = float(os.environ.get("FAKE_API_429_RATE", "0"))
+FAKE_API_RETRY_AFTER = int(os.environ.get("FAKE_API_RETRY_AFTER", "1"))
+
+
+class Faults:
+    """מה מוזרק לכל קריאה; run.py / main() מעדכנים לפי הפרמטרים."""
+
+    latency_ms = FAKE_API_LATENCY_MS
+    jitter_ms = FAKE_API_JITTER_MS
+    rate_429 = FAKE_API_429_RATE
+    retry_after = FAKE_API_RETRY_AFTER
+
+
+BOT_USER = {
+    "id": 999_000_001,
+    "is_bot": True,
+    "first_name": "LoadTest",
+    "username": os.environ.get("BOT_USERNAME", "BuyMyShopbot"),
+}
+
+# methods שמחזירים Message; כל השאר מחזירים True
+MESSAGE_METHODS = {
+    "sendMessage",
+    "sendPhoto",
+    "sendDocument",
+    "editMessageText",
+    "editMessageCaption",
+    "editMessageReplyMarkup",
+    "forwardMessage",
+}
+# רק אלה יכולים לקבל 429 מוזרק
+THROTTLED_PREFIXES = ("send", "edit", "answer", "forward", "copy")
+
+app = FastAPI()
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.started = time.time()
+        self.methods: Counter = Counter()
+        self.injected_429: Counter = Counter()
+        # מפתח -> future שממתין לקריאה הבאה עם ה-chat_id / callback_query_id הזה
+        self.waiters: Dict[str, asyncio.Future] = {}
+        self._message_ids = itertools.count(1)
+
+    def expect(self, key: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[key] = future
+        return future
+
+    def forget(self, key: str) -> None:
+        self.waiters.pop(key, None)
+
+    def record(self, method: str, params: Dict[str, Any]) -> None:
+        now = time.perf_counter()
+        self.methods[method] += 1
+        for name in ("chat_id", "callback_query_id"):
+            if params.get(name) is None:
+                continue
+            future = self.waiters.pop(str(params[name]), None)
+            if future is not None and not future.done():
+                future.set_result((now, method))
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+
+recorder = Recorder()
+
+
+# =========================
+# parsing
+# =========================
+
+async def read_params(request: Request) -> Dict[str, Any]:
+    """PTB שולח form-urlencoded, או multipart כשיש קובץ; JSON רק מכלים אחרים."""
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    if not body:
+        return dict(request.query_params)
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        params: Dict[str, Any] = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name and part.get_filename() is None:
+                params[name] = part.get_payload(decode=True).decode("utf-8", "replace")
+        return params
+    return {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+
+
+def make_message(method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        chat_id = int(params.get("chat_id") or 0)
+    except ValueError:
+        chat_id = 0
+    message_id = params.get("message_id") or recorder.next_message_id()
+    message: Dict[str, Any] = {
+        "message_id": int(message_id),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+        "from": BOT_USER,
+    }
+    if method == "sendPhoto":
+        message["photo"] = [
+            {
+                "file_id": f"FAKE_PHOTO_{message['message_id']}",
+                "file_unique_id": f"u{message['message_id']}",
+                "width": 1280,
+                "height": 720,
+            }
+        ]
+    elif "text" in params:
+        message["text"] = params["text"]
+    return message
+
+
+# =========================
+# Bot API
+# =========================
+
+@app.api_route("/bot{token}/{method}", methods=["GET", "POST"])
+async def bot_api(token: str, method: str, request: Request):
+    params = await read_params(request)
+
+    if Faults.latency_ms or Faults.jitter_ms:
+        delay = Faults.latency_ms + random.uniform(-Faults.jitter_ms, Faults.jitter_ms)
+        await asyncio.sleep(max(0.0, delay) / 1000)
+
+    if method.startswith(THROTTLED_PREFIXES) and random.random() < Faults.rate_429:
+        recorder.injected_429[method] += 1
+        return JSONResponse(
+            status_code=429,
+            content={
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {Faults.retry_after}",
+                "parameters": {"retry_after": Faults.retry_after},
+            },
+        )
+
+    recorder.record(method, params)
+    if method == "getMe":
+        result: Any = BOT_USER
+    elif method == "getWebhookInfo":
+        result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+    elif method in MESSAGE_METHODS:
+        result = make_message(method, params)
+    else:
+        result = True
+    return {"ok": True, "result": result}
+
+
+# =========================
+# בקרה (ל-run.py)
+# =========================
+
+@app.get("/_stats")
+async def stats():
+    return {
+        "started": recorder.started,
+        "methods": dict(recorder.methods),
+        "injected_429": dict(recorder.injected_429),
+    }
+
+
+@app.post("/_reset")
+async def reset():
+    recorder.reset()
+    return {"ok": True}
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=FAKE_API_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=FAKE_API_JITTER_MS)
+    parser.add_argument("--rate-429", type=float, default=FAKE_API_429_RATE)
+    parser.add_argument("--retry-after", type=int, default=FAKE_API_RETRY_AFTER)
+
+
+def configure(args: argparse.Namespace) -> None:
+    Faults.latency_ms = args.latency_ms
+    Faults.jitter_ms = args.jitter_ms
+    Faults.rate_429 = args.rate_429
+    Faults.retry_after = args.retry_after
+
+
+def make_server(host: str, port: int) -> uvicorn.Server:
+    return uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    configure(args)
+    make_server(args.host, args.port).run()
+
+
+if __name__ == "__main__":
+    main()
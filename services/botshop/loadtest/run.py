@@ -0,0 +1,362 @@
+# run.py
+"""
+בדיקת עומס ל-/webhook של botshop – offline לגמרי (fake Bot API + Postgres מקומי).
+
+- מרים את fake_bot_api באותו process (אלא אם --no-fake-api), כך שאפשר למדוד
+  לכל עדכון גם את זמן ה-ack של ה-webhook וגם end-to-end: מה-POST ועד
+  הקריאה הראשונה של הבוט ל-Bot API עבור אותו משתמש / callback.
+- --spawn-bot מריץ את הבוט עצמו (uvicorn main:app) כתהליך בן, מכוון ל-fake
+  Bot API; בלי זה – מחכים ש-/health של בוט שהורץ ידנית יענה.
+- --concurrency בקשות במקביל (ו---rate לתקרת עדכונים לשנייה), במשך
+  --duration שניות או עד --updates עדכונים.
+- בסוף: לכל תרחיש – throughput, p50 / p95 / p99 ל-ack ול-e2e, ושיעורי
+  שגיאות (status לא 200, חריגות רשת, עדכונים שלא נענו תוך --response-timeout).
+
+הרצה (ראה README):
+    python loadtest/run.py --spawn-bot --concurrency 50 --duration 60 --latency-ms 40 --rate-429 0.01
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlsplit
+
+import httpx
+
+import fake_bot_api
+from fake_bot_api import recorder
+from scenarios import DEFAULT_ADMIN_ID, DEFAULT_MIX, Planned, UpdateFactory, parse_mix
+
+BOTSHOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """nearest-rank על רשימה ממוינת."""
+    if not values:
+        return None
+    rank = math.ceil(pct / 100 * len(values))
+    return values[min(len(values), max(rank, 1)) - 1]
+
+
+class ScenarioStats:
+    def __init__(self) -> None:
+        self.sent = 0
+        self.statuses: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.timeouts = 0
+        self.ack: List[float] = []
+        self.e2e: List[float] = []
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        ok = self.statuses.get(200, 0)
+        failed = self.sent - ok
+        self.ack.sort()
+        self.e2e.sort()
+
+        def ms(values: List[float], pct: float) -> Optional[float]:
+            value = percentile(values, pct)
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "sent": self.sent,
+            "ok": ok,
+            "throughput": round(self.sent / elapsed, 1) if elapsed else 0.0,
+            "error_rate": round(failed / self.sent, 4) if self.sent else 0.0,
+            "timeout_rate": round(self.timeouts / ok, 4) if ok else 0.0,
+            "statuses": {str(code): count for code, count in sorted(self.statuses.items())},
+            "errors": dict(self.errors),
+            "timeouts": self.timeouts,
+            "ack_ms": {f"p{p}": ms(self.ack, p) for p in (50, 95, 99)},
+            "e2e_ms": {f"p{p}": ms(self.e2e, p) for p in (50, 95, 99)},
+        }
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.factory = UpdateFactory(parse_mix(args.mix), admin_id=args.admin_id, seed=args.seed)
+        self.stats: Dict[str, ScenarioStats] = {}
+        self.total = ScenarioStats()
+        self.track_e2e = not args.no_fake_api
+        self._waiters: Set[asyncio.Task] = set()
+        self._next_at = 0.0
+        self._sent = 0
+        self._deadline = 0.0
+
+    # ---------- pacing ----------
+
+    def _more(self) -> bool:
+        if self.args.updates and self._sent >= self.args.updates:
+            return False
+        return time.monotonic() < self._deadline
+
+    async def _pace(self) -> None:
+        if not self.args.rate:
+            return
+        now = time.monotonic()
+        wait = self._next_at - now
+        self._next_at = max(now, self._next_at) + 1 / self.args.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    # ---------- sending ----------
+
+    async def _worker(self, client: httpx.AsyncClient) -> None:
+        while self._more():
+            await self._pace()
+            if not self._more():
+                return
+            self._sent += 1
+            plan = self.factory.next()
+            stats = self.stats.setdefault(plan.scenario, ScenarioStats())
+            futures = [recorder.expect(key) for key in plan.keys] if self.track_e2e else []
+
+            started = time.perf_counter()
+            try:
+                response = await client.post(self.args.webhook_url, json=plan.update)
+                status: Optional[int] = response.status_code
+            except httpx.HTTPError as e:
+                status = None
+                for target in (stats, self.total):
+                    target.errors[type(e).__name__] += 1
+            ack = time.perf_counter() - started
+
+            for target in (stats, self.total):
+                target.sent += 1
+                if status is not None:
+                    target.statuses[status] += 1
+                    target.ack.append(ack)
+
+            if status == 200 and futures:
+                task = asyncio.create_task(self._await_response(plan, futures, started, stats))
+                self._waiters.add(task)
+                task.add_done_callback(self._waiters.discard)
+            else:
+                self._finish(plan)
+
+    async def _await_response(
+        self,
+        plan: Planned,
+        futures: List[asyncio.Future],
+        started: float,
+        stats: ScenarioStats,
+    ) -> None:
+        done, _ = await asyncio.wait(
+            futures, timeout=self.args.response_timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        if done:
+            answered_at = min(future.result()[0] for future in done)
+            for target in (stats, self.total):
+                target.e2e.append(answered_at - started)
+        else:
+            for target in (stats, self.total):
+                target.timeouts += 1
+        # "זמן חשיבה" – גם שאר ההודעות של אותו עדכון יוצאות לפני הפעולה הבאה
+        await asyncio.sleep(self.args.think_ms / 1000)
+        self._finish(plan)
+
+    def _finish(self, plan: Planned) -> None:
+        for key in plan.keys:
+            recorder.forget(key)
+        self.factory.release(plan.release)
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(
+            max_connections=self.args.concurrency, max_keepalive_connections=self.args.concurrency
+        )
+        async with httpx.AsyncClient(timeout=self.args.http_timeout, limits=limits) as client:
+            started = time.monotonic()
+            self._deadline = started + self.args.duration
+            self._next_at = started
+            await asyncio.gather(*(self._worker(client) for _ in range(self.args.concurrency)))
+            elapsed = time.monotonic() - started
+            if self._waiters:
+                await asyncio.gather(*self._waiters, return_exceptions=True)
+
+        return {
+            "config": {
+                key: value for key, value in vars(self.args).items() if key != "json"
+            },
+            "elapsed_seconds": round(elapsed, 2),
+            "scenarios": {
+                name: stats.summary(elapsed) for name, stats in sorted(self.stats.items())
+            },
+            "total": self.total.summary(elapsed),
+            "bot_api": {
+                "calls": dict(recorder.methods),
+                "injected_429": dict(recorder.injected_429),
+            },
+        }
+
+
+# =========================
+# report
+# =========================
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    header = (
+        f"{'scenario':<10} {'sent':>7} {'req/s':>7} {'err%':>6} {'t/o%':>6}"
+        f" {'ack p50':>8} {'p95':>7} {'p99':>7} {'e2e p50':>8} {'p95':>7} {'p99':>7}"
+    )
+    print()
+    print(f"elapsed: {report['elapsed_seconds']}s")
+    print(header)
+    print("-" * len(header))
+    rows = list(report["scenarios"].items()) + [("TOTAL", report["total"])]
+    for name, row in rows:
+        ack, e2e = row["ack_ms"], row["e2e_ms"]
+        print(
+            f"{name:<10} {row['sent']:>7} {row['throughput']:>7.1f}"
+            f" {row['error_rate'] * 100:>6.2f} {row['timeout_rate'] * 100:>6.2f}"
+            f" {_fmt(ack['p50']):>8} {_fmt(ack['p95']):>7} {_fmt(ack['p99']):>7}"
+            f" {_fmt(e2e['p50']):>8} {_fmt(e2e['p95']):>7} {_fmt(e2e['p99']):>7}"
+        )
+    total = report["total"]
+    print()
+    print(f"webhook statuses: {total['statuses']}  network errors: {total['errors']}")
+    print(f"Bot API calls: {report['bot_api']['calls']}")
+    print(f"injected 429: {report['bot_api']['injected_429']}")
+
+
+# =========================
+# הבוט
+# =========================
+
+async def spawn_bot(args: argparse.Namespace) -> asyncio.subprocess.Process:
+    url = urlsplit(args.webhook_url)
+    env = dict(os.environ)
+    env.setdefault("BOT_TOKEN", "123456:LOADTEST")
+    env["WEBHOOK_URL"] = args.webhook_url
+    env["TELEGRAM_API_BASE_URL"] = f"http://{args.fake_api_host}:{args.fake_api_port}"
+    log = open(args.bot_log, "ab") if args.bot_log else asyncio.subprocess.DEVNULL
+    try:
+        return await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            url.hostname or "127.0.0.1",
+            "--port",
+            str(url.port or 8000),
+            "--workers",
+            str(args.bot_workers),
+            cwd=BOTSHOP_DIR,
+            env=env,
+            stdout=log,
+            stderr=log,
+        )
+    finally:
+        if args.bot_log:
+            log.close()
+
+
+async def stop_bot(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), 30)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+async def wait_for_bot(args: argparse.Namespace) -> bool:
+    url = urlsplit(args.webhook_url)
+    health = f"{url.scheme}://{url.netloc}/health"
+    deadline = time.monotonic() + args.startup_timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(health)).status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+
+# =========================
+# main
+# =========================
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="botshop webhook load test")
+    parser.add_argument("--webhook-url", default="http://127.0.0.1:8000/webhook")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--updates", type=int, default=0, help="stop after N updates (0 = by duration)")
+    parser.add_argument("--rate", type=float, default=0, help="max updates/s (0 = unlimited)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights, e.g. start=3,menu=4")
+    parser.add_argument("--admin-id", type=int, default=DEFAULT_ADMIN_ID)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--think-ms", type=float, default=300)
+    parser.add_argument("--response-timeout", type=float, default=30)
+    parser.add_argument("--http-timeout", type=float, default=10)
+    parser.add_argument("--fake-api-host", default="127.0.0.1")
+    parser.add_argument("--fake-api-port", type=int, default=8081)
+    parser.add_argument(
+        "--no-fake-api",
+        action="store_true",
+        help="do not start the fake Bot API (ack latency only)",
+    )
+    parser.add_argument(
+        "--spawn-bot",
+        action="store_true",
+        help="run uvicorn main:app against the fake Bot API for the duration of the test",
+    )
+    parser.add_argument("--bot-workers", type=int, default=1)
+    parser.add_argument("--bot-log", help="append the spawned bot's output to this file")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--json", help="write the full report to this file")
+    fake_bot_api.add_fault_arguments(parser)
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    fake_bot_api.configure(args)
+
+    server = None
+    server_task = None
+    if not args.no_fake_api:
+        server = fake_bot_api.make_server(args.fake_api_host, args.fake_api_port)
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            if server_task.done():
+                print("fake Bot API failed to start", file=sys.stderr)
+                return 1
+            await asyncio.sleep(0.05)
+
+    bot = await spawn_bot(args) if args.spawn_bot else None
+    try:
+        if not await wait_for_bot(args):
+            print(f"bot did not become healthy at {args.webhook_url}", file=sys.stderr)
+            return 1
+        report = await LoadTest(args).run()
+    finally:
+        if bot is not None:
+            await stop_bot(bot)
+        if server is not None:
+            server.should_exit = True
+            await server_task
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
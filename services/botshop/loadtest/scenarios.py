@@ -0,0 +1,186 @@
+# scenarios.py
+"""
+יצירת עדכוני טלגרם מציאותיים לבדיקת עומס.
+
+כל משתמש מזויף עובר את המסלול של משתמש אמיתי:
+/start (חלק עם ref_ של משתמש קודם) → כפתורי תפריט / בחירת אמצעי תשלום →
+תמונת אישור תשלום → אישור אדמין. כל Scenario מחזיר את העדכון ואת המפתחות
+(chat_id / callback_query_id) שלפיהם run.py מזהה את התשובה הראשונה של
+הבוט ב-fake_bot_api. משתמש חוזר לתור רק אחרי שקיבל תשובה (release).
+"""
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional, Tuple
+
+# ה-admin שמוגדר ב-main.ADMIN_IDS (DEVELOPER_USER_ID) וקבוצת הלוגים
+DEFAULT_ADMIN_ID = 224223270
+PAYMENTS_LOG_CHAT_ID = -1001748319682
+BOT_FROM = {"id": 999_000_001, "is_bot": True, "first_name": "LoadTest"}
+
+MENU_CALLBACKS = ["info", "join", "support", "share", "back_main"]
+PAY_CALLBACKS = ["pay_bank", "pay_paybox", "pay_ton"]
+
+SCENARIOS = ("start", "menu", "payment", "approve")
+DEFAULT_MIX = "start=30,menu=40,payment=20,approve=10"
+
+
+class Planned(NamedTuple):
+    scenario: str
+    update: Dict[str, Any]
+    # התשובה הראשונה של הבוט לאחד מהם = סוף הטיפול בעדכון
+    keys: Tuple[str, ...]
+    # משתמש שחוזר לתור אחרי שהעדכון טופל (None – לא חוזר)
+    release: Optional[Tuple[str, int]] = None
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for part in mix.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r} (expected one of {SCENARIOS})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class UpdateFactory:
+    """
+    מחזיק את מצב המשתמשים המזויפים. משתמש נמצא בכל רגע בעדכון אחד לכל
+    היותר, כדי שהתשובה לפי chat_id תשויך לעדכון הנכון.
+    """
+
+    def __init__(
+        self,
+        mix: Dict[str, float],
+        admin_id: int = DEFAULT_ADMIN_ID,
+        user_id_base: Optional[int] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.admin_id = admin_id
+        self.random = random.Random(seed)
+        # מזהים שלא מתנגשים עם ריצות קודמות (dedup של update_id ב-DB)
+        base = user_id_base or 7_000_000_000 + int(time.time()) % 1_000_000 * 1000
+        self._next_user = base
+        self._next_update = int(time.time() * 1000)
+        self.started: Deque[int] = deque()
+        self.paid: Deque[int] = deque()
+
+    # ---------- ids ----------
+
+    def _user(self) -> int:
+        self._next_user += 1
+        return self._next_user
+
+    def _update_id(self) -> int:
+        self._next_update += 1
+        return self._next_update
+
+    def release(self, release: Optional[Tuple[str, int]]) -> None:
+        if release is None:
+            return
+        pool, user_id = release
+        (self.paid if pool == "paid" else self.started).append(user_id)
+
+    # ---------- payloads ----------
+
+    @staticmethod
+    def _from(user_id: int) -> Dict[str, Any]:
+        return {
+            "id": user_id,
+            "is_bot": False,
+            "first_name": "Load",
+            "last_name": str(user_id),
+            "username": f"lt{user_id}",
+            "language_code": "he",
+        }
+
+    def _message(self, sender: Dict[str, Any], chat_id: int, **fields: Any) -> Dict[str, Any]:
+        message = {
+            "message_id": self.random.randint(1, 2**31 - 1),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": sender,
+        }
+        message.update(fields)
+        return message
+
+    def _command(self, user_id: int, text: str) -> Dict[str, Any]:
+        command = text.split()[0]
+        return {
+            "update_id": self._update_id(),
+            "message": self._message(
+                self._from(user_id),
+                user_id,
+                text=text,
+                entities=[{"type": "bot_command", "offset": 0, "length": len(command)}],
+            ),
+        }
+
+    def _callback(self, user_id: int, chat_id: int, data: str) -> Tuple[Dict[str, Any], str]:
+        update_id = self._update_id()
+        query_id = f"lt{update_id}"
+        update = {
+            "update_id": update_id,
+            "callback_query": {
+                "id": query_id,
+                "from": self._from(user_id),
+                "chat_instance": str(chat_id),
+                "data": data,
+                # ההודעה של הבוט שעליה נלחץ הכפתור
+                "message": self._message(BOT_FROM, chat_id, text="menu"),
+            },
+        }
+        return update, query_id
+
+    # ---------- scenarios ----------
+
+    def next(self) -> Planned:
+        scenario = self.random.choices(self.names, self.weights)[0]
+        # אין עדיין משתמשים במצב המתאים – מתחילים משתמש חדש
+        if scenario in ("menu", "payment") and not self.started:
+            scenario = "start"
+        if scenario == "approve" and not self.paid:
+            scenario = "payment" if self.started else "start"
+        return getattr(self, f"_{scenario}")()
+
+    def _start(self) -> Planned:
+        user_id = self._user()
+        text = "/start"
+        # חלק מהמשתמשים מגיעים מלינק הפניה של משתמש קודם
+        if (self.started or self.paid) and self.random.random() < 0.5:
+            referrer = self.random.choice(self.started or self.paid)
+            text = f"/start ref_{referrer}"
+        return Planned("start", self._command(user_id, text), (str(user_id),), ("started", user_id))
+
+    def _menu(self) -> Planned:
+        user_id = self.started.popleft()
+        data = self.random.choice(MENU_CALLBACKS + PAY_CALLBACKS)
+        update, query_id = self._callback(user_id, user_id, data)
+        return Planned("menu", update, (query_id,), ("started", user_id))
+
+    def _payment(self) -> Planned:
+        user_id = self.started.popleft()
+        photo = [
+            {
+                "file_id": f"LT_PHOTO_{user_id}_{size}",
+                "file_unique_id": f"lt{user_id}{size}",
+                "width": size,
+                "height": size,
+            }
+            for size in (90, 320, 1280)
+        ]
+        update = {
+            "update_id": self._update_id(),
+            "message": self._message(self._from(user_id), user_id, photo=photo),
+        }
+        return Planned("payment", update, (str(user_id),), ("paid", user_id))
+
+    def _approve(self) -> Planned:
+        user_id = self.paid.popleft()
+        # הכפתור נלחץ על הודעת הלוג בקבוצת התשלומים; התשובה נשלחת למשתמש
+        update, _ = self._callback(self.admin_id, PAYMENTS_LOG_CHAT_ID, f"adm_approve:{user_id}")
+        return Planned("approve", update, (str(user_id),), ("started", user_id))
+
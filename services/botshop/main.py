@@ -1,13 +1,21 @@
 # main.py
 import os
+import io
+import time
+import asyncio
+import csv
+import json
+import hashlib
 import logging
 from collections import deque
 from contextlib import asynccontextmanager
 from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
 from http import HTTPStatus
-from typing import Deque, Set, Literal, Optional, Dict, Any, List
-from fastapi import FastAPI, Request, Response, HTTPException
+from typing import Deque, Set, Literal, Optional, Dict, Any, List, Tuple
+from fastapi import FastAPI, Request, Response, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
 from fastapi import FastAPI, Request, Response, HTTPException
 from telegram import (
@@ -15,6 +23,7 @@ from telegram import (
     InlineKeyboardMarkup,
     InlineKeyboardButton,
 )
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -24,6 +33,11 @@ from telegram.ext import (
     filters,
 )
 
+import telemetry
+from telemetry import span, timed_handler
+from dispatcher import UpdateDispatcher, ACCEPTED, QUEUE_FULL, STOPPING
+from rate_limiter import PriorityRateLimiter, HIGH_PRIORITY, LOW_PRIORITY
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
@@ -34,8 +48,9 @@ logger = logging.getLogger("gateway-bot")
 # DB
 # =========================
 try:
-    from db import (
+    from db_async import (
         init_schema,
+        wait_for_schema,
         log_payment,
         update_payment_status,
         store_user,
@@ -44,19 +59,49 @@ try:
         get_monthly_payments,
         get_approval_stats,
         create_reward,
+        get_share_points,
         set_promoter_bank,
         get_promoter_bank,
-        increment_metric,
-        get_metric,
-        get_share_points,
         get_top_sharers,
+        create_rewards_bulk,
+        get_reward_targets,
+        open_pool,
+        close_pool,
+        maintain_partitions,
+        export_rows,
+        ExportBusy,
+        get_replica_stats,
+        get_user_profile,
+        claim_update,
+        release_update,
+        purge_processed_updates,
+        get_media_file_id,
+        set_media_file_id,
+        delete_media_file_id,
+        get_broadcast,
+        list_broadcasts,
+        save_pending_payment,
+        get_pending_payment,
+        set_pending_reject,
+        pop_pending_reject,
     )
+    from db import DATABASE_URL
+    from queries import EXPORT_COLUMNS
+    from broadcast import BroadcastRunner
+    from leader import LeaderElection
+    from persistence import PostgresPersistence
+    from paid_index import PaidUserIndex
+    from counters import MetricCounters
+    from cache import cache_stats, share_board_snapshot
     DB_AVAILABLE = True
     logger.info("DB module loaded successfully, DB logging enabled.")
 except Exception as e:
     logger.warning("DB not available (missing db.py or error loading it): %s", e)
     DB_AVAILABLE = False
 
+# DB_AVAILABLE – המודולים נטענו; DB_ENABLED – וגם DATABASE_URL מוגדר (יש לאן לכתוב)
+DB_ENABLED = DB_AVAILABLE and bool(DATABASE_URL)
+
 # =========================
 # ENV
 # =========================
@@ -96,9 +141,14 @@ LANDING_URL = os.environ.get(
 BOT_USERNAME = os.environ.get("BOT_USERNAME", "BuyMyShopbot")
 
 ADMIN_DASH_TOKEN = os.environ.get("ADMIN_DASH_TOKEN")
+# אם מוגדר – /metrics דורש ?token= או Authorization: Bearer
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
 
 START_IMAGE_PATH = os.environ.get("START_IMAGE_PATH", "assets/start_banner.jpg")
 
+# Bot API חלופי (Local Bot API Server, או loadtest/fake_bot_api.py בבדיקות עומס)
+TELEGRAM_API_BASE_URL = os.environ.get("TELEGRAM_API_BASE_URL", "").rstrip("/")
+
 BANK_DETAILS_BASE = (
     "בנק הפועלים\n"
     "סניף כפר גנים (153)\n"
@@ -135,14 +185,20 @@ PayMethod = Literal["bank", "paybox", "ton"]
 # =========================
 # Dedup
 # =========================
+# מסלול מהיר בזיכרון של ה-worker, ומאחוריו processed_updates ב-DB –
+# משותף לכל ה-workers / השרתים, כך שעדכון שטלגרם שולח שוב ל-worker אחר
+# לא מעובד פעמיים.
+UPDATE_DEDUP_TTL_SECONDS = float(os.environ.get("UPDATE_DEDUP_TTL_SECONDS", "86400"))
+# כל כמה שניות למחוק מה-DB רשומות dedup ישנות מה-TTL
+UPDATE_DEDUP_PURGE_INTERVAL = 600.0
+
 _processed_ids: Deque[int] = deque(maxlen=1000)
 _processed_set: Set[int] = set()
+_last_dedup_purge = 0.0
+_dedup_purge_task: Optional[asyncio.Task] = None
 
 
-def is_duplicate_update(update: Update) -> bool:
-    if update is None:
-        return False
-    uid = update.update_id
+def _seen_locally(uid: int) -> bool:
     if uid in _processed_set:
         return True
     _processed_set.add(uid)
@@ -153,6 +209,57 @@ def is_duplicate_update(update: Update) -> bool:
     return False
 
 
+async def _purge_processed_updates() -> None:
+    try:
+        removed = await purge_processed_updates(UPDATE_DEDUP_TTL_SECONDS)
+        if removed:
+            logger.info("Purged %s old processed_updates rows.", removed)
+    except Exception as e:
+        logger.error("Failed to purge processed_updates: %s", e)
+
+
+def _maybe_purge_processed_updates() -> None:
+    global _last_dedup_purge, _dedup_purge_task
+    now = time.monotonic()
+    if now - _last_dedup_purge < UPDATE_DEDUP_PURGE_INTERVAL:
+        return
+    _last_dedup_purge = now
+    _dedup_purge_task = asyncio.create_task(_purge_processed_updates())
+
+
+async def is_duplicate_update(update: Update) -> bool:
+    if update is None:
+        return False
+    uid = update.update_id
+    if _seen_locally(uid):
+        return True
+    if not DB_AVAILABLE:
+        return False
+
+    try:
+        with span("webhook.dedup_db"):
+            fresh = await claim_update(uid)
+    except Exception as e:
+        # ה-DB לא זמין – נשארים עם ה-dedup המקומי
+        logger.error("Failed to check update_id=%s in DB: %s", uid, e)
+        return False
+    _maybe_purge_processed_updates()
+    return not fresh
+
+
+async def forget_update(update_id: int) -> None:
+    """
+    עדכון שלא נכנס לתור (טלגרם ישלח אותו שוב, ואז הוא לא כפילות), או שנזרק
+    מהתור בכיבוי – משחררים את ה-claim כדי ששליחה חוזרת שלו תעובד.
+    """
+    _processed_set.discard(update_id)
+    if DB_AVAILABLE:
+        try:
+            await release_update(update_id)
+        except Exception as e:
+            logger.error("Failed to release update_id=%s in DB: %s", update_id, e)
+
+
 # =========================
 # bot_data stores + paid flags
 # =========================
@@ -172,8 +279,76 @@ def get_pending_rejects(context: ContextTypes.DEFAULT_TYPE) -> Dict[int, int]:
     return store
 
 
+# עם DB – שורה לכל משתמש / אדמין (pending_payments / pending_rejects), כדי
+# שכל worker יראה אותן מיד; בלי DATABASE_URL – ב-bot_data
+async def save_payment_info(
+    context: ContextTypes.DEFAULT_TYPE, user_id: int, info: Dict[str, Any]
+) -> None:
+    if DB_ENABLED:
+        try:
+            await save_pending_payment(
+                user_id, info["file_id"], info["pay_method"], info["username"], info["chat_id"]
+            )
+            return
+        except Exception as e:
+            logger.error("Failed to save pending payment for %s: %s", user_id, e)
+    get_payments_store(context)[user_id] = info
+
+
+async def load_payment_info(
+    context: ContextTypes.DEFAULT_TYPE, user_id: int
+) -> Optional[Dict[str, Any]]:
+    if DB_ENABLED:
+        try:
+            info = await get_pending_payment(user_id)
+            if info is not None:
+                return info
+        except Exception as e:
+            logger.error("Failed to load pending payment for %s: %s", user_id, e)
+    # בלי DB, או תשלום שנשמר ב-bot_data לפני המעבר לטבלה
+    return context.application.bot_data.get("payments", {}).get(user_id)
+
+
+async def start_pending_reject(
+    context: ContextTypes.DEFAULT_TYPE, admin_id: int, target_id: int
+) -> None:
+    if DB_ENABLED:
+        try:
+            await set_pending_reject(admin_id, target_id)
+            return
+        except Exception as e:
+            logger.error("Failed to save pending reject for admin %s: %s", admin_id, e)
+    get_pending_rejects(context)[admin_id] = target_id
+
+
+async def take_pending_reject(
+    context: ContextTypes.DEFAULT_TYPE, admin_id: int
+) -> Optional[int]:
+    """ה-user_id שהאדמין בחר לדחות ומחכה לסיבה שלו (ומנקה את הבחירה)."""
+    target_id = None
+    if DB_ENABLED:
+        try:
+            target_id = await pop_pending_reject(admin_id)
+        except Exception as e:
+            logger.error("Failed to load pending reject for admin %s: %s", admin_id, e)
+    local = context.application.bot_data.get("pending_rejects")
+    if local and admin_id in local:
+        # נשמר מקומית כשה-DB לא היה זמין
+        local_target = local.pop(admin_id)
+        if target_id is None:
+            target_id = local_target
+    return target_id
+
+
+# עם DB – אינדקס של payments.status = 'approved'; בלי DATABASE_URL – set ב-bot_data
+paid_index = PaidUserIndex() if DB_ENABLED else None
+
+
 def mark_user_paid(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
-    """שומר בזיכרון שמזהה המשתמש הזה כבר עבר אישור תשלום."""
+    """שומר שמזהה המשתמש הזה כבר עבר אישור תשלום."""
+    if paid_index is not None:
+        paid_index.mark_paid(user_id)
+        return
     app_data = context.application.bot_data
     paid = app_data.get("paid_users")
     if paid is None:
@@ -182,23 +357,79 @@ def mark_user_paid(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
     paid.add(user_id)
 
 
-def is_user_paid(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
-    """בודק (in-memory) אם המשתמש כבר אושר כתשלום."""
+def mark_user_unpaid(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    if paid_index is not None:
+        paid_index.mark_unpaid(user_id)
+        return
+    paid = context.application.bot_data.get("paid_users")
+    if paid:
+        paid.discard(user_id)
+
+
+async def is_user_paid(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+    """בודק אם המשתמש כבר אושר כתשלום (בזיכרון, ובהחטאה – ב-DB)."""
+    if paid_index is not None:
+        try:
+            return await paid_index.is_paid(user_id)
+        except Exception as e:
+            logger.error("Failed to check paid status for %s: %s", user_id, e)
+            return False
     paid = context.application.bot_data.get("paid_users")
     if not paid:
         return False
     return user_id in paid
 
 
+# =========================
+# מונים (write-behind ל-metrics)
+# =========================
+metric_counters = MetricCounters() if DB_AVAILABLE else None
+
+
 # =========================
 # Telegram Application
 # =========================
-ptb_app: Application = (
+# כל השליחות לטלגרם עוברות דרך ה-rate limiter (קצב גלובלי + לכל צ'אט, עם עדיפויות)
+send_limiter = PriorityRateLimiter()
+
+# bot_data / user_data נשמרים ב-DB (שורדים deploy, משותפים בין workers)
+bot_persistence = PostgresPersistence() if DB_AVAILABLE else None
+
+ptb_builder = (
     Application.builder()
     .updater(None)
     .token(BOT_TOKEN)
-    .build()
+    .rate_limiter(send_limiter)
 )
+if TELEGRAM_API_BASE_URL:
+    ptb_builder = ptb_builder.base_url(f"{TELEGRAM_API_BASE_URL}/bot").base_file_url(
+        f"{TELEGRAM_API_BASE_URL}/file/bot"
+    )
+if bot_persistence is not None:
+    ptb_builder = ptb_builder.persistence(bot_persistence)
+ptb_app: Application = ptb_builder.build()
+
+# עדכונים מה-webhook מעובדים ברקע, לפי הסדר בכל צ'אט
+update_dispatcher = UpdateDispatcher(ptb_app.process_update, on_drop=forget_update)
+
+broadcast_runner = BroadcastRunner(ptb_app.bot) if DB_AVAILABLE else None
+
+# עם כמה workers / replicas – רק ה-leader רושם webhook, מריץ מיגרציות,
+# jobs ו-broadcasts. בלי DB – worker יחיד שהוא תמיד ה-leader.
+leader: Optional["LeaderElection"] = None
+if DB_AVAILABLE and DATABASE_URL:
+    leader = LeaderElection(DATABASE_URL)
+
+
+def is_leader() -> bool:
+    return leader is None or leader.is_leader
+
+
+telemetry.register_gauge("webhook_queue_depth", lambda: update_dispatcher.stats()["depth"])
+telemetry.register_gauge(
+    "telegram_send_waiting", lambda: sum(send_limiter.stats()["waiting"].values())
+)
+telemetry.register_gauge("leader", lambda: int(is_leader()))
 
 # =========================
 # Keyboards
@@ -267,6 +498,98 @@ def admin_menu_keyboard() -> InlineKeyboardMarkup:
     )
 
 
+# =========================
+# Start image – file_id cache
+# =========================
+# אחרי ההעלאה הראשונה שולחים את התמונה לפי ה-file_id שטלגרם החזיר, במקום
+# להעלות שוב את הבייטים. המפתח כולל את ה-sha256 של הקובץ (החלפת תמונה =
+# מפתח חדש) ואת מזהה הבוט (file_id תקף רק לבוט שהעלה אותו). נשמר בטבלת
+# media_cache, ובלי DB – רק בזיכרון.
+
+# (mtime, size, sha256) של הקובץ האחרון שחושב
+_start_image_digest: Optional[Tuple[float, int, str]] = None
+_start_image_file_ids: Dict[str, str] = {}
+_start_image_upload_lock = asyncio.Lock()
+
+
+def start_image_cache_key() -> str:
+    """מפתח ה-cache לתמונה הנוכחית; ה-hash מחושב מחדש רק כשהקובץ השתנה."""
+    global _start_image_digest
+    st = os.stat(START_IMAGE_PATH)
+    cached = _start_image_digest
+    if cached is None or cached[:2] != (st.st_mtime, st.st_size):
+        with open(START_IMAGE_PATH, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        cached = (st.st_mtime, st.st_size, digest)
+        _start_image_digest = cached
+    bot_id = BOT_TOKEN.split(":", 1)[0]
+    return f"start_image:{bot_id}:{cached[2]}"
+
+
+async def get_start_image_file_id(key: str) -> Optional[str]:
+    file_id = _start_image_file_ids.get(key)
+    if file_id is None and DB_AVAILABLE:
+        try:
+            file_id = await get_media_file_id(key)
+        except Exception as e:
+            logger.error("Failed to load start image file_id: %s", e)
+        if file_id:
+            _start_image_file_ids[key] = file_id
+    return file_id
+
+
+async def remember_start_image_file_id(key: str, file_id: str) -> None:
+    _start_image_file_ids[key] = file_id
+    if DB_AVAILABLE:
+        try:
+            await set_media_file_id(key, file_id)
+        except Exception as e:
+            logger.error("Failed to store start image file_id: %s", e)
+
+
+async def forget_start_image_file_id(key: str) -> None:
+    _start_image_file_ids.pop(key, None)
+    if DB_AVAILABLE:
+        try:
+            await delete_media_file_id(key)
+        except Exception as e:
+            logger.error("Failed to delete start image file_id: %s", e)
+
+
+async def upload_start_image(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    key: str,
+    caption: str,
+    rate_limit_args: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    מעלה את הקובץ ושומר את ה-file_id שחזר. ה-lock מונע כמה העלאות
+    במקביל של אותה תמונה – מי שחיכה מקבל כבר את ה-file_id.
+    """
+    async with _start_image_upload_lock:
+        file_id = _start_image_file_ids.get(key)
+        if file_id:
+            await context.bot.send_photo(
+                chat_id=chat_id,
+                photo=file_id,
+                caption=caption,
+                parse_mode="Markdown",
+                rate_limit_args=rate_limit_args,
+            )
+            return
+        with span("start_image.upload"), open(START_IMAGE_PATH, "rb") as f:
+            message = await context.bot.send_photo(
+                chat_id=chat_id,
+                photo=f,
+                caption=caption,
+                parse_mode="Markdown",
+                rate_limit_args=rate_limit_args,
+            )
+        if message.photo:
+            await remember_start_image_file_id(key, message.photo[-1].file_id)
+
+
 # =========================
 # Start image + metrics
 # =========================
@@ -278,15 +601,17 @@ async def send_start_image(
 
     if DB_AVAILABLE:
         try:
-            if mode == "view":
-                views = increment_metric("start_image_views", 1)
-                downloads = get_metric("start_image_downloads")
-            elif mode == "download":
-                downloads = increment_metric("start_image_downloads", 1)
-                views = get_metric("start_image_views")
-            else:  # reminder
-                views = get_metric("start_image_views")
-                downloads = get_metric("start_image_downloads")
+            with span("start_image.counters"):
+                if mode == "view":
+                    views = await metric_counters.incr("start_image_views", 1)
+                    downloads = await metric_counters.get("start_image_downloads")
+                elif mode == "download":
+                    # מספר סידורי מדויק – מטווח ששמור מראש ב-DB
+                    downloads = await metric_counters.next_serial("start_image_downloads")
+                    views = await metric_counters.get("start_image_views")
+                else:  # reminder
+                    views = await metric_counters.get("start_image_views")
+                    downloads = await metric_counters.get("start_image_downloads")
         except Exception as e:
             logger.error("Failed to update metrics: %s", e)
     else:
@@ -318,14 +643,35 @@ async def send_start_image(
             f"• עותקים ממוספרים שנשלחו: {downloads}\n"
         )
 
+    # העותק הממוספר נשלח כחלק מאישור תשלום; התזכורת יכולה לחכות
+    if mode == "download":
+        rate_limit_args = HIGH_PRIORITY
+    elif mode == "reminder":
+        rate_limit_args = LOW_PRIORITY
+    else:
+        rate_limit_args = None
+
     try:
-        with open(START_IMAGE_PATH, "rb") as f:
-            await context.bot.send_photo(
-                chat_id=chat_id,
-                photo=f,
-                caption=caption,
-                parse_mode="Markdown",
-            )
+        key = start_image_cache_key()
+        file_id = await get_start_image_file_id(key)
+        if file_id:
+            try:
+                with span("start_image.send_photo"):
+                    await context.bot.send_photo(
+                        chat_id=chat_id,
+                        photo=file_id,
+                        caption=caption,
+                        parse_mode="Markdown",
+                        rate_limit_args=rate_limit_args,
+                    )
+                return
+            except BadRequest as e:
+                # טלגרם לא מכיר את ה-file_id (נמחק / בוט אחר) – מעלים מחדש
+                if "file" not in str(e).lower():
+                    raise
+                logger.warning("Cached start image file_id rejected: %s", e)
+                await forget_start_image_file_id(key)
+        await upload_start_image(context, chat_id, key, caption, rate_limit_args)
     except FileNotFoundError:
         logger.error("Start image not found at path: %s", START_IMAGE_PATH)
     except Exception as e:
@@ -345,7 +691,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     if DB_AVAILABLE and user:
         try:
-            store_user(user.id, user.username)
+            with span("start.store_user"):
+                await store_user(user.id, user.username)
         except Exception as e:
             logger.error("Failed to store user: %s", e)
 
@@ -356,12 +703,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             try:
                 referrer_id = int(parts[1].split("ref_")[1])
                 if DB_AVAILABLE and referrer_id != user.id:
-                    add_referral(referrer_id, user.id, source="bot_start")
+                    with span("start.add_referral"):
+                        await add_referral(referrer_id, user.id, source="bot_start")
                 context.user_data["referrer_id"] = referrer_id
             except Exception as e:
                 logger.error("Failed to add referral: %s", e)
 
-    await send_start_image(context, message.chat_id, mode="view")
+    with span("start.send_image"):
+        await send_start_image(context, message.chat_id, mode="view")
 
     text = (
         "ברוך הבא לשער הכניסה לקהילת העסקים שלנו 🌐\n\n"
@@ -381,11 +730,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "כדי להתחיל – בחר באפשרות הרצויה:"
     )
 
-    await message.reply_text(
-        text,
-        parse_mode="Markdown",
-        reply_markup=main_menu_keyboard(),
-    )
+    with span("start.reply"):
+        await message.reply_text(
+            text,
+            parse_mode="Markdown",
+            reply_markup=main_menu_keyboard(),
+        )
 
 
 async def info_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -462,7 +812,7 @@ async def share_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = user.id
 
     # אם המשתמש עדיין לא אושר כתשלום – נחסום את השיתוף
-    if not is_user_paid(context, user_id):
+    if not await is_user_paid(context, user_id):
         text = (
             "🔐 *פיצ׳ר השיתוף נפתח רק לאחר תשלום מאושר*\n\n"
             "כדי לקבל בוט שיתופים אישי ונקודות על כל שיתוף, "
@@ -502,7 +852,7 @@ async def share_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     if DB_AVAILABLE and user_id:
         try:
-            create_reward(
+            await create_reward(
                 user_id,
                 "SHARE_POINTS",
                 "נקודות על שימוש בכפתור שיתוף",
@@ -519,7 +869,21 @@ async def back_main_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await start(fake_update, context)
 
 
-def build_bank_details_for_user(context: ContextTypes.DEFAULT_TYPE) -> str:
+async def load_user_profile(user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    פרופיל המשתמש (נקודות, הפניות, בנק מפיץ, סטטוס תשלום) בשאילתה אחת.
+    None כשאין DB או כשהקריאה נכשלה.
+    """
+    if not DB_AVAILABLE:
+        return None
+    try:
+        return await get_user_profile(user_id)
+    except Exception as e:
+        logger.error("Failed to load user profile for %s: %s", user_id, e)
+        return None
+
+
+async def build_bank_details_for_user(context: ContextTypes.DEFAULT_TYPE) -> str:
     """
     מחזיר טקסט בנק למשתמש – אם הגיע דרך referrer שהוא מפיץ עם בנק משלו, נשתמש בו.
     אחרת – הבנק הבסיסי.
@@ -529,9 +893,9 @@ def build_bank_details_for_user(context: ContextTypes.DEFAULT_TYPE) -> str:
         return BANK_DETAILS
 
     try:
-        custom = get_promoter_bank(referrer_id)
+        custom = await get_promoter_bank(referrer_id)
     except Exception as e:
-        logger.error("Failed to get promoter bank: %s", e)
+        logger.error("Failed to load promoter bank for %s: %s", referrer_id, e)
         custom = None
 
     if not custom:
@@ -554,7 +918,7 @@ async def payment_method_callback(update: Update, context: ContextTypes.DEFAULT_
 
     if data == "pay_bank":
         method = "bank"
-        details_text = build_bank_details_for_user(context)
+        details_text = await build_bank_details_for_user(context)
     elif data == "pay_paybox":
         method = "paybox"
         details_text = PAYBOX_DETAILS
@@ -580,6 +944,69 @@ async def payment_method_callback(update: Update, context: ContextTypes.DEFAULT_
     )
 
 
+# =========================
+# התראות לאדמינים ברקע
+# =========================
+
+# שליחות לקבוצת הלוגים / לאדמין שרצות ברקע (ראה notify_in_background)
+_notify_tasks: Set[asyncio.Task] = set()
+# כמה שניות לחכות בכיבוי להתראות שעוד לא נשלחו
+NOTIFY_DRAIN_TIMEOUT = float(os.environ.get("NOTIFY_DRAIN_TIMEOUT", "30"))
+
+
+def notify_in_background(coro) -> None:
+    """
+    מריץ שליחה לאדמינים בלי לחכות לה. ה-rate limiter ממתין ל-bucket של
+    הקבוצה בתוך ה-task הזה, ולא ב-handler שמחזיק worker של update_dispatcher.
+    """
+    task = asyncio.create_task(coro)
+    _notify_tasks.add(task)
+    task.add_done_callback(_notify_done)
+
+
+def _notify_done(task: asyncio.Task) -> None:
+    _notify_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background admin notification failed: %s", task.exception())
+
+
+async def drain_notifications(timeout: float = NOTIFY_DRAIN_TIMEOUT) -> None:
+    """בכיבוי: מחכה עד timeout להתראות שבדרך, ומבטל את מה שנשאר."""
+    if not _notify_tasks:
+        return
+    _, pending = await asyncio.wait(set(_notify_tasks), timeout=timeout)
+    if pending:
+        logger.warning("Dropping %s admin notifications on shutdown.", len(pending))
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def send_payment_to_admins(bot, user_id: int, file_id: str, caption_log: str) -> None:
+    """אישור התשלום לקבוצת הלוגים, ואם נכשל – ישירות למתכנת."""
+    try:
+        await bot.send_photo(
+            chat_id=PAYMENTS_LOG_CHAT_ID,
+            photo=file_id,
+            caption=caption_log,
+            reply_markup=admin_approval_keyboard(user_id),
+            rate_limit_args=HIGH_PRIORITY,
+        )
+    except Exception as e:
+        logger.error("Failed to forward payment photo to log group: %s", e)
+        try:
+            await bot.send_photo(
+                chat_id=DEVELOPER_USER_ID,
+                photo=file_id,
+                caption="(Fallback – לא הצלחתי לשלוח לקבוצת לוגים)\n\n"
+                + caption_log,
+                reply_markup=admin_approval_keyboard(user_id),
+                rate_limit_args=HIGH_PRIORITY,
+            )
+        except Exception as e2:
+            logger.error("Failed to send fallback payment: %s", e2)
+
+
 # =========================
 # תשלומים
 # =========================
@@ -616,39 +1043,27 @@ async def handle_payment_photo(update: Update, context: ContextTypes.DEFAULT_TYP
     photo = message.photo[-1]
     file_id = photo.file_id
 
-    payments = get_payments_store(context)
-    payments[user.id] = {
-        "file_id": file_id,
-        "pay_method": pay_method_text,
-        "username": username,
-        "chat_id": chat_id,
-    }
+    await save_payment_info(
+        context,
+        user.id,
+        {
+            "file_id": file_id,
+            "pay_method": pay_method_text,
+            "username": username,
+            "chat_id": chat_id,
+        },
+    )
 
     if DB_AVAILABLE:
         try:
-            log_payment(user.id, username, pay_method_text)
+            await log_payment(user.id, username, pay_method_text)
         except Exception as e:
             logger.error("Failed to log payment to DB: %s", e)
 
-    try:
-        await context.bot.send_photo(
-            chat_id=PAYMENTS_LOG_CHAT_ID,
-            photo=file_id,
-            caption=caption_log,
-            reply_markup=admin_approval_keyboard(user.id),
-        )
-    except Exception as e:
-        logger.error("Failed to forward payment photo to log group: %s", e)
-        try:
-            await context.bot.send_photo(
-                chat_id=DEVELOPER_USER_ID,
-                photo=file_id,
-                caption="(Fallback – לא הצלחתי לשלוח לקבוצת לוגים)\n\n"
-                + caption_log,
-                reply_markup=admin_approval_keyboard(user.id),
-            )
-        except Exception as e2:
-            logger.error("Failed to send fallback payment: %s", e2)
+    # קבוצת הלוגים מוגבלת ל-20 הודעות לדקה – לא מחכים לה לפני התשובה למשתמש
+    notify_in_background(
+        send_payment_to_admins(context.bot, user.id, file_id, caption_log)
+    )
 
     await message.reply_text(
         "תודה! אישור התשלום התקבל ונשלח לבדיקה ✅\n"
@@ -662,6 +1077,7 @@ async def handle_payment_photo(update: Update, context: ContextTypes.DEFAULT_TYP
 # אישור / דחייה
 # =========================
 
+@timed_handler
 async def do_approve(
     target_id: int, context: ContextTypes.DEFAULT_TYPE, source_message
 ) -> None:
@@ -678,7 +1094,9 @@ async def do_approve(
         # נסמן בזיכרון שהמשתמש הזה אושר כתשלום
         mark_user_paid(context, target_id)
 
-        await context.bot.send_message(chat_id=target_id, text=text)
+        await context.bot.send_message(
+            chat_id=target_id, text=text, rate_limit_args=HIGH_PRIORITY
+        )
 
         # עותק ממוספר של התמונה
         await send_start_image(context, target_id, mode="download")
@@ -686,7 +1104,12 @@ async def do_approve(
         # מסר נוסף – פאנל מפיץ זוטר
         base_bot_url = f"https://t.me/{BOT_USERNAME}"
         share_link = f"{base_bot_url}?start=ref_{target_id}"
-        points = get_share_points(target_id) if DB_AVAILABLE else 0
+        points = 0
+        if DB_AVAILABLE:
+            try:
+                points = await get_share_points(target_id)
+            except Exception as e:
+                logger.error("Failed to load share points for %s: %s", target_id, e)
 
         promo_text = (
             "📣 עכשיו אתה חלק מהמשחק של המפיצים בקהילה!\n\n"
@@ -703,32 +1126,39 @@ async def do_approve(
         )
 
         await context.bot.send_message(
-            chat_id=target_id, text=promo_text, parse_mode="Markdown"
+            chat_id=target_id,
+            text=promo_text,
+            parse_mode="Markdown",
+            rate_limit_args=LOW_PRIORITY,
         )
 
         if DB_AVAILABLE:
             try:
-                update_payment_status(target_id, "approved", None)
+                await update_payment_status(target_id, "approved", None)
             except Exception as e:
                 logger.error("Failed to update payment status in DB: %s", e)
 
         if source_message:
-            await source_message.reply_text(
-                f"אושר ונשלח קישור + קלף ממוספר + פאנל מפיץ למשתמש {target_id}."
+            notify_in_background(
+                source_message.reply_text(
+                    f"אושר ונשלח קישור + קלף ממוספר + פאנל מפיץ למשתמש {target_id}."
+                )
             )
     except Exception as e:
         logger.error("Failed to send approval message: %s", e)
         if source_message:
-            await source_message.reply_text(
-                f"שגיאה בשליחת הודעה למשתמש {target_id}: {e}"
+            notify_in_background(
+                source_message.reply_text(
+                    f"שגיאה בשליחת הודעה למשתמש {target_id}: {e}"
+                )
             )
 
 
+@timed_handler
 async def do_reject(
     target_id: int, reason: str, context: ContextTypes.DEFAULT_TYPE, source_message
 ) -> None:
-    payments = context.application.bot_data.get("payments", {})
-    payment_info = payments.get(target_id)
+    payment_info = await load_payment_info(context, target_id)
 
     base_text = (
         "לצערנו לא הצלחנו לאמת את התשלום שנשלח.\n\n"
@@ -742,25 +1172,33 @@ async def do_reject(
                 chat_id=target_id,
                 photo=payment_info["file_id"],
                 caption=base_text,
+                rate_limit_args=HIGH_PRIORITY,
             )
         else:
-            await context.bot.send_message(chat_id=target_id, text=base_text)
+            await context.bot.send_message(
+                chat_id=target_id, text=base_text, rate_limit_args=HIGH_PRIORITY
+            )
 
         if DB_AVAILABLE:
             try:
-                update_payment_status(target_id, "rejected", reason)
+                await update_payment_status(target_id, "rejected", reason)
             except Exception as e:
                 logger.error("Failed to update payment status in DB: %s", e)
+        mark_user_unpaid(context, target_id)
 
         if source_message:
-            await source_message.reply_text(
-                f"התשלום של המשתמש {target_id} נדחה והודעה נשלחה עם הסיבה."
+            notify_in_background(
+                source_message.reply_text(
+                    f"התשלום של המשתמש {target_id} נדחה והודעה נשלחה עם הסיבה."
+                )
             )
     except Exception as e:
         logger.error("Failed to send rejection message: %s", e)
         if source_message:
-            await source_message.reply_text(
-                f"שגיאה בשליחת הודעת דחייה למשתמש {target_id}: {e}"
+            notify_in_background(
+                source_message.reply_text(
+                    f"שגיאה בשליחת הודעת דחייה למשתמש {target_id}: {e}"
+                )
             )
 
 
@@ -854,8 +1292,7 @@ async def admin_reject_callback(update: Update, context: ContextTypes.DEFAULT_TY
         await query.answer("שגיאה בנתוני המשתמש.", show_alert=True)
         return
 
-    pending = get_pending_rejects(context)
-    pending[admin.id] = target_id
+    await start_pending_reject(context, admin.id, target_id)
 
     await query.message.reply_text(
         f"❌ בחרת לדחות את התשלום של המשתמש {target_id}.\n"
@@ -870,11 +1307,10 @@ async def admin_reject_reason_handler(
     if user is None or user.id not in ADMIN_IDS:
         return
 
-    pending = get_pending_rejects(context)
-    if user.id not in pending:
+    target_id = await take_pending_reject(context, user.id)
+    if target_id is None:
         return
 
-    target_id = pending.pop(user.id)
     reason = update.message.text.strip()
     await do_reject(target_id, reason, context, update.effective_message)
 
@@ -898,7 +1334,7 @@ async def admin_leaderboard_command(
         return
 
     try:
-        rows = get_top_referrers(10)
+        rows = await get_top_referrers(10)
     except Exception as e:
         logger.error("Failed to get top referrers: %s", e)
         await update.effective_message.reply_text("שגיאה בקריאת נתוני הפניות.")
@@ -941,8 +1377,8 @@ async def admin_payments_stats_command(
     year, month = now.year, now.month
 
     try:
-        rows = get_monthly_payments(year, month)
-        stats = get_approval_stats()
+        rows = await get_monthly_payments(year, month)
+        stats = await get_approval_stats()
     except Exception as e:
         logger.error("Failed to get payment stats: %s", e)
         await update.effective_message.reply_text("שגיאה בקריאת נתוני תשלום.")
@@ -1008,7 +1444,7 @@ async def admin_reward_slh_command(
     reason = " ".join(context.args[2:])
 
     try:
-        create_reward(target_id, "SLH", reason, points)
+        await create_reward(target_id, "SLH", reason, points)
     except Exception as e:
         logger.error("Failed to create reward: %s", e)
         await update.effective_message.reply_text("שגיאה ביצירת Reward.")
@@ -1034,6 +1470,134 @@ async def admin_reward_slh_command(
         logger.error("Failed to notify user about reward: %s", e)
 
 
+async def admin_airdrop_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """
+    הנפקת נקודות SLH מרוכזת:
+    /airdrop approved <points> <reason...> – לכל מי ששילם ואושר
+    /airdrop top_sharers <N> <points> <reason...> – ל-N המשתפים המובילים
+    """
+    if update.effective_user is None or update.effective_user.id not in ADMIN_IDS:
+        await update.effective_message.reply_text(
+            "אין לך הרשאה ליצור Rewards.\n"
+            "אם אתה צריך גישה – דבר עם המתכנת: @OsifEU"
+        )
+        return
+
+    if not DB_AVAILABLE:
+        await update.effective_message.reply_text("DB לא פעיל כרגע.")
+        return
+
+    usage = (
+        "שימוש:\n"
+        "/airdrop approved <points> <reason...>\n"
+        "/airdrop top_sharers <N> <points> <reason...>"
+    )
+    args = context.args or []
+    target = args[0] if args else ""
+    limit: Optional[int] = None
+
+    try:
+        if target == "approved" and len(args) >= 3:
+            points = int(args[1])
+            reason = " ".join(args[2:])
+        elif target == "top_sharers" and len(args) >= 4:
+            limit = int(args[1])
+            points = int(args[2])
+            reason = " ".join(args[3:])
+        else:
+            await update.effective_message.reply_text(usage)
+            return
+    except ValueError:
+        await update.effective_message.reply_text(
+            "N ו-points חייבים להיות מספריים.\n\n" + usage
+        )
+        return
+
+    try:
+        user_ids = await get_reward_targets(target, limit)
+        inserted = await create_rewards_bulk(
+            ((uid, points) for uid in user_ids), "SLH", reason
+        )
+    except Exception as e:
+        logger.error("Failed to run airdrop: %s", e)
+        await update.effective_message.reply_text("שגיאה בהנפקת ה-Rewards.")
+        return
+
+    await update.effective_message.reply_text(
+        f"🎁 Airdrop הושלם ({target}): נוצרו {inserted} Rewards של SLH "
+        f"({points} נק׳ לכל משתמש).\n"
+        f"סיבה: {reason}"
+    )
+
+
+async def admin_broadcast_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """
+    /broadcast <text...> – שולח את הטקסט לכל המשתמשים בטבלת users.
+    ההתקדמות מתעדכנת בהודעה בצ'אט הזה.
+    """
+    if update.effective_user is None or update.effective_user.id not in ADMIN_IDS:
+        await update.effective_message.reply_text(
+            "אין לך הרשאה לשלוח הודעה לכל המשתמשים.\n"
+            "אם אתה צריך גישה – דבר עם המתכנת: @OsifEU"
+        )
+        return
+
+    if not DB_AVAILABLE:
+        await update.effective_message.reply_text("DB לא פעיל כרגע.")
+        return
+
+    # הטקסט המלא אחרי הפקודה, כולל שורות חדשות
+    parts = (update.effective_message.text or "").split(None, 1)
+    text = parts[1].strip() if len(parts) > 1 else ""
+    if not text:
+        await update.effective_message.reply_text("שימוש: /broadcast <טקסט ההודעה>")
+        return
+
+    try:
+        row = await broadcast_runner.create(
+            text, update.effective_user.id, update.effective_chat.id, start=is_leader()
+        )
+    except Exception as e:
+        logger.error("Failed to create broadcast: %s", e)
+        row = None
+    if row is None:
+        await update.effective_message.reply_text("שגיאה ביצירת ה-broadcast.")
+        return
+
+    await update.effective_message.reply_text(
+        f"📣 Broadcast #{row['id']} נוצר – {row['total']} נמענים.\n"
+        f"לביטול: /broadcast_cancel {row['id']}"
+    )
+
+
+async def admin_broadcast_cancel_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    if update.effective_user is None or update.effective_user.id not in ADMIN_IDS:
+        return
+
+    if not DB_AVAILABLE:
+        await update.effective_message.reply_text("DB לא פעיל כרגע.")
+        return
+
+    try:
+        broadcast_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.effective_message.reply_text("שימוש: /broadcast_cancel <id>")
+        return
+
+    if await broadcast_runner.cancel(broadcast_id):
+        await update.effective_message.reply_text(f"Broadcast #{broadcast_id} בוטל.")
+    else:
+        await update.effective_message.reply_text(
+            f"Broadcast #{broadcast_id} לא נמצא או שכבר הסתיים."
+        )
+
+
 async def share_board_command(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -1045,7 +1609,7 @@ async def share_board_command(
         return
 
     try:
-        rows = get_top_sharers(20)
+        rows = await get_top_sharers(20)
     except Exception as e:
         logger.error("Failed to get top sharers: %s", e)
         await update.effective_message.reply_text("שגיאה בקריאת נתוני שיתופים.")
@@ -1064,8 +1628,12 @@ async def share_board_command(
         lines.append(f"{rank}. {uname} – {pts} נק׳ שיתוף")
         rank += 1
 
-    await update.effective_message.reply_text(
-        "\n".join(lines), parse_mode="Markdown"
+    # reply_text לא מעביר rate_limit_args – שולחים דרך ה-bot
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="\n".join(lines),
+        parse_mode="Markdown",
+        rate_limit_args=LOW_PRIORITY,
     )
 
 
@@ -1095,7 +1663,7 @@ async def set_bank_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     bank_details = " ".join(context.args)
 
     try:
-        set_promoter_bank(user.id, bank_details)
+        await set_promoter_bank(user.id, bank_details)
     except Exception as e:
         logger.error("Failed to set promoter bank: %s", e)
         await update.effective_message.reply_text("שגיאה בשמירת פרטי הבנק.")
@@ -1117,14 +1685,10 @@ async def my_panel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
     base_bot_url = f"https://t.me/{BOT_USERNAME}"
     share_link = f"{base_bot_url}?start=ref_{user_id}"
-    points = get_share_points(user_id) if DB_AVAILABLE else 0
-    bank_details = None
-
-    if DB_AVAILABLE:
-        try:
-            bank_details = get_promoter_bank(user_id)
-        except Exception as e:
-            logger.error("Failed to get promoter bank in my_panel: %s", e)
+    profile = await load_user_profile(user_id)
+    points = profile["share_points"] if profile else 0
+    referral_count = profile["referral_count"] if profile else 0
+    bank_details = profile["bank_details"] if profile else None
 
     bank_text = (
         bank_details
@@ -1135,7 +1699,8 @@ async def my_panel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     text = (
         "📊 *פאנל מפיץ אישי*\n\n"
         f"user_id: `{user_id}`\n\n"
-        f"*נקודות שיתוף שצברת:* {points}\n\n"
+        f"*נקודות שיתוף שצברת:* {points}\n"
+        f"*משתמשים שהגיעו דרכך:* {referral_count}\n\n"
         "*פרטי בנק למקבלי תשלום מההפניות שלך:*\n"
         f"{bank_text}\n\n"
         "*לינק הפניה אישי לבוט:*\n"
@@ -1168,6 +1733,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/leaderboard – לוח מפנים\n"
         "/payments_stats – דוח תשלומים\n"
         "/reward_slh – יצירת Reward SLH\n"
+        "/airdrop – הנפקת SLH מרוכזת (מאושרים / משתפים מובילים)\n"
         "/approve / /reject – ניהול תשלומים\n"
     )
 
@@ -1192,6 +1758,7 @@ async def admin_menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         "/leaderboard – לוח מפנים\n"
         "/payments_stats – דוח תשלומים\n"
         "/reward_slh – יצירת Reward SLH\n"
+        "/airdrop – הנפקת SLH מרוכזת\n"
     )
 
     await update.effective_message.reply_text(
@@ -1214,8 +1781,10 @@ async def admin_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     data = query.data
 
     if data == "adm_status":
-        views = get_metric("start_image_views") if DB_AVAILABLE else 0
-        downloads = get_metric("start_image_downloads") if DB_AVAILABLE else 0
+        views = await metric_counters.get("start_image_views") if DB_AVAILABLE else 0
+        downloads = (
+            await metric_counters.get("start_image_downloads") if DB_AVAILABLE else 0
+        )
         text = (
             "📊 *סטטוס מערכת*\n\n"
             f"• DB: {'פעיל' if DB_AVAILABLE else 'כבוי'}\n"
@@ -1233,8 +1802,10 @@ async def admin_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
     elif data == "adm_counters":
-        views = get_metric("start_image_views") if DB_AVAILABLE else 0
-        downloads = get_metric("start_image_downloads") if DB_AVAILABLE else 0
+        views = await metric_counters.get("start_image_views") if DB_AVAILABLE else 0
+        downloads = (
+            await metric_counters.get("start_image_downloads") if DB_AVAILABLE else 0
+        )
         text = (
             "📈 *מוני תמונת שער*\n\n"
             f"• מספר הצגות (start): {views}\n"
@@ -1261,36 +1832,40 @@ async def admin_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 # =========================
 # register handlers
 # =========================
-
-ptb_app.add_handler(CommandHandler("start", start))
-ptb_app.add_handler(CommandHandler("help", help_command))
-ptb_app.add_handler(CommandHandler("admin", admin_menu_command))
-ptb_app.add_handler(CommandHandler("approve", approve_command))
-ptb_app.add_handler(CommandHandler("reject", reject_command))
-ptb_app.add_handler(CommandHandler("leaderboard", admin_leaderboard_command))
-ptb_app.add_handler(CommandHandler("payments_stats", admin_payments_stats_command))
-ptb_app.add_handler(CommandHandler("reward_slh", admin_reward_slh_command))
-ptb_app.add_handler(CommandHandler("set_bank", set_bank_command))
-ptb_app.add_handler(CommandHandler("my_panel", my_panel_command))
-ptb_app.add_handler(CommandHandler("share_board", share_board_command))
-
-ptb_app.add_handler(CallbackQueryHandler(info_callback, pattern="^info$"))
-ptb_app.add_handler(CallbackQueryHandler(join_callback, pattern="^join$"))
-ptb_app.add_handler(CallbackQueryHandler(support_callback, pattern="^support$"))
-ptb_app.add_handler(CallbackQueryHandler(share_callback, pattern="^share$"))
-ptb_app.add_handler(CallbackQueryHandler(back_main_callback, pattern="^back_main$"))
-ptb_app.add_handler(CallbackQueryHandler(payment_method_callback, pattern="^pay_"))
+# כל handler עטוף ב-timed_handler – זמן ושגיאות לפי שם ב-/metrics
+
+ptb_app.add_handler(CommandHandler("start", timed_handler(start)))
+ptb_app.add_handler(CommandHandler("help", timed_handler(help_command)))
+ptb_app.add_handler(CommandHandler("admin", timed_handler(admin_menu_command)))
+ptb_app.add_handler(CommandHandler("approve", timed_handler(approve_command)))
+ptb_app.add_handler(CommandHandler("reject", timed_handler(reject_command)))
+ptb_app.add_handler(CommandHandler("leaderboard", timed_handler(admin_leaderboard_command)))
+ptb_app.add_handler(CommandHandler("payments_stats", timed_handler(admin_payments_stats_command)))
+ptb_app.add_handler(CommandHandler("reward_slh", timed_handler(admin_reward_slh_command)))
+ptb_app.add_handler(CommandHandler("airdrop", timed_handler(admin_airdrop_command)))
+ptb_app.add_handler(CommandHandler("broadcast", timed_handler(admin_broadcast_command)))
+ptb_app.add_handler(CommandHandler("broadcast_cancel", timed_handler(admin_broadcast_cancel_command)))
+ptb_app.add_handler(CommandHandler("set_bank", timed_handler(set_bank_command)))
+ptb_app.add_handler(CommandHandler("my_panel", timed_handler(my_panel_command)))
+ptb_app.add_handler(CommandHandler("share_board", timed_handler(share_board_command)))
+
+ptb_app.add_handler(CallbackQueryHandler(timed_handler(info_callback), pattern="^info$"))
+ptb_app.add_handler(CallbackQueryHandler(timed_handler(join_callback), pattern="^join$"))
+ptb_app.add_handler(CallbackQueryHandler(timed_handler(support_callback), pattern="^support$"))
+ptb_app.add_handler(CallbackQueryHandler(timed_handler(share_callback), pattern="^share$"))
+ptb_app.add_handler(CallbackQueryHandler(timed_handler(back_main_callback), pattern="^back_main$"))
+ptb_app.add_handler(CallbackQueryHandler(timed_handler(payment_method_callback), pattern="^pay_"))
 ptb_app.add_handler(
-    CallbackQueryHandler(admin_menu_callback, pattern="^adm_(status|counters|ideas)$")
+    CallbackQueryHandler(timed_handler(admin_menu_callback), pattern="^adm_(status|counters|ideas)$")
 )
-ptb_app.add_handler(CallbackQueryHandler(admin_approve_callback, pattern="^adm_approve:"))
-ptb_app.add_handler(CallbackQueryHandler(admin_reject_callback, pattern="^adm_reject:"))
+ptb_app.add_handler(CallbackQueryHandler(timed_handler(admin_approve_callback), pattern="^adm_approve:"))
+ptb_app.add_handler(CallbackQueryHandler(timed_handler(admin_reject_callback), pattern="^adm_reject:"))
 
 ptb_app.add_handler(
-    MessageHandler(filters.PHOTO & filters.ChatType.PRIVATE, handle_payment_photo)
+    MessageHandler(filters.PHOTO & filters.ChatType.PRIVATE, timed_handler(handle_payment_photo))
 )
 ptb_app.add_handler(
-    MessageHandler(filters.TEXT & filters.User(list(ADMIN_IDS)), admin_reject_reason_handler)
+    MessageHandler(filters.TEXT & filters.User(list(ADMIN_IDS)), timed_handler(admin_reject_reason_handler))
 )
 
 
@@ -1302,38 +1877,154 @@ async def remind_update_links(context: ContextTypes.DEFAULT_TYPE) -> None:
     await send_start_image(context, PAYMENTS_LOG_CHAT_ID, mode="reminder")
 
 
+async def run_partition_maintenance(context: Optional[ContextTypes.DEFAULT_TYPE] = None) -> None:
+    """partitions חודשיים ל-payments / rewards – בעלייה ופעם ביום."""
+    try:
+        summary = await maintain_partitions()
+        logger.info("Partition maintenance done: %s", summary)
+    except Exception as e:
+        logger.error("Partition maintenance failed: %s", e)
+
+
 # =========================
 # FastAPI + webhook
 # =========================
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
+async def ensure_webhook() -> None:
+    """setWebhook רק אם ה-webhook הרשום בטלגרם שונה – חוסך קריאה בכל עלייה."""
+    try:
+        info = await ptb_app.bot.get_webhook_info()
+        if info.url == WEBHOOK_URL and set(info.allowed_updates or ()) >= set(
+            Update.ALL_TYPES
+        ):
+            logger.info("Telegram webhook already set to %s", WEBHOOK_URL)
+            return
+    except Exception as e:
+        logger.warning("getWebhookInfo failed, setting webhook anyway: %s", e)
+
     logger.info("Setting Telegram webhook to %s", WEBHOOK_URL)
     await ptb_app.bot.setWebhook(url=WEBHOOK_URL, allowed_updates=Update.ALL_TYPES)
 
+
+async def init_leader_state() -> None:
+    """חד-פעמי ל-leader חדש: webhook, מיגרציות, partitions."""
+    await ensure_webhook()
     if DB_AVAILABLE:
         try:
-            init_schema()
+            await init_schema()
             logger.info("DB schema initialized.")
         except Exception as e:
             logger.error("Failed to init DB schema: %s", e)
+        await run_partition_maintenance()
+
+
+# jobs של ה-leader – מוסרים כשהוא מאבד את ההנהגה
+_leader_jobs: List[Any] = []
+_leader_jobs_running = False
 
-    async with ptb_app:
-        logger.info("Starting Telegram Application")
-        await ptb_app.start()
 
-        if ptb_app.job_queue:
+def start_leader_jobs() -> None:
+    global _leader_jobs_running
+    if _leader_jobs_running:
+        return
+    _leader_jobs_running = True
+    if DB_AVAILABLE:
+        broadcast_runner.watch()
+
+    if ptb_app.job_queue:
+        _leader_jobs.append(
             ptb_app.job_queue.run_repeating(
                 remind_update_links,
                 interval=6 * 24 * 60 * 60,
                 first=6 * 24 * 60 * 60,
             )
+        )
+        if DB_AVAILABLE:
+            _leader_jobs.append(
+                ptb_app.job_queue.run_repeating(
+                    run_partition_maintenance,
+                    interval=24 * 60 * 60,
+                    first=24 * 60 * 60,
+                )
+            )
+
+
+async def stop_leader_jobs() -> None:
+    global _leader_jobs_running
+    _leader_jobs_running = False
+    for job in _leader_jobs:
+        job.schedule_removal()
+    _leader_jobs.clear()
+    if DB_AVAILABLE:
+        await broadcast_runner.stop()
+
+
+async def on_elected() -> None:
+    """failover: ה-worker הזה קיבל את ההנהגה כשהאפליקציה כבר רצה."""
+    await init_leader_state()
+    start_leader_jobs()
+
+
+if leader is not None:
+    leader.on_elected = on_elected
+    leader.on_demoted = stop_leader_jobs
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor = asyncio.create_task(telemetry.monitor_event_loop())
+
+    if DB_AVAILABLE:
+        try:
+            await open_pool()
+        except Exception as e:
+            logger.error("Failed to open DB pool: %s", e)
+
+    if leader is None or await leader.acquire():
+        await init_leader_state()
+    else:
+        # ה-leader מריץ את המיגרציות; מחכים לו לפני שמטפלים בעדכונים
+        logger.info("Not the leader – waiting for DB schema.")
+        await wait_for_schema()
+
+    if DB_AVAILABLE:
+        metric_counters.start()
+    if paid_index is not None:
+        await paid_index.start()
+
+    async with ptb_app:
+        logger.info("Starting Telegram Application")
+        await ptb_app.start()
+        update_dispatcher.start()
+
+        if is_leader():
+            start_leader_jobs()
+        if leader is not None:
+            leader.start()
 
         yield
 
+        if leader is not None:
+            # משחרר את המנעול – worker אחר הופך ל-leader מיד
+            await leader.stop()
+        await stop_leader_jobs()
+        await update_dispatcher.stop()
+        await drain_notifications()
         logger.info("Stopping Telegram Application")
         await ptb_app.stop()
 
+    if paid_index is not None:
+        await paid_index.stop()
+    if DB_AVAILABLE:
+        try:
+            await metric_counters.stop()
+        except Exception as e:
+            logger.error("Failed to flush metric counters on shutdown: %s", e)
+        await close_pool()
+
+    loop_monitor.cancel()
+    await asyncio.gather(loop_monitor, return_exceptions=True)
+
 
 app = FastAPI(lifespan=lifespan)
 # לאפשר ל-GitHub Pages / landing למשוך את ה-API הציבורי
@@ -1348,14 +2039,37 @@ app.add_middleware(
 
 @app.post("/webhook")
 async def telegram_webhook(request: Request) -> Response:
-    data = await request.json()
-    update = Update.de_json(data, ptb_app.bot)
+    """
+    מאמת את העדכון, מכניס לתור ומחזיר 200 מיד – העיבוד עצמו
+    נעשה ב-workers של update_dispatcher (ראה dispatcher.py).
+    """
+    try:
+        data = await request.json()
+        update = Update.de_json(data, ptb_app.bot)
+    except Exception as e:
+        logger.warning("Invalid webhook payload: %s", e)
+        return Response(status_code=HTTPStatus.BAD_REQUEST.value)
+    if update is None:
+        return Response(status_code=HTTPStatus.BAD_REQUEST.value)
+    telemetry.increment("updates_received")
 
-    if is_duplicate_update(update):
+    if await is_duplicate_update(update):
+        telemetry.increment("updates_duplicate")
         logger.warning("Duplicate update_id=%s – ignoring", update.update_id)
         return Response(status_code=HTTPStatus.OK.value)
 
-    await ptb_app.process_update(update)
+    result = update_dispatcher.submit(update)
+    if result != ACCEPTED:
+        telemetry.increment("updates_rejected", {"reason": result})
+        await forget_update(update.update_id)
+        status = (
+            HTTPStatus.SERVICE_UNAVAILABLE
+            if result in (QUEUE_FULL, STOPPING)
+            else HTTPStatus.TOO_MANY_REQUESTS
+        )
+        logger.warning("Rejected update_id=%s (%s)", update.update_id, result)
+        return Response(status_code=status.value, headers={"Retry-After": "1"})
+
     return Response(status_code=HTTPStatus.OK.value)
 
 
@@ -1368,8 +2082,77 @@ async def health():
     }
 
 
+# snapshot של קריאות ה-DB של /admin/stats – הדשבורד מרענן לעיתים קרובות
+ADMIN_STATS_CACHE_SECONDS = float(os.environ.get("ADMIN_STATS_CACHE_SECONDS", "10"))
+_admin_stats_snapshot: Optional[Dict[str, Any]] = None
+_admin_stats_expires_at = 0.0
+_admin_stats_lock = asyncio.Lock()
+
+
+async def load_admin_db_stats(fresh: bool = False) -> Dict[str, Any]:
+    """
+    ארבע הקריאות של /admin/stats במקביל (כל אחת על חיבור משלה מה-pool),
+    עם snapshot ל-ADMIN_STATS_CACHE_SECONDS. רק בקשה אחת מחשבת – השאר
+    מחכות לה.
+    """
+    global _admin_stats_snapshot, _admin_stats_expires_at
+
+    def cached() -> Optional[Dict[str, Any]]:
+        if fresh or _admin_stats_snapshot is None:
+            return None
+        if _admin_stats_expires_at <= time.monotonic():
+            return None
+        return _admin_stats_snapshot
+
+    snapshot = cached()
+    if snapshot is not None:
+        return snapshot
+    async with _admin_stats_lock:
+        snapshot = cached()
+        if snapshot is not None:
+            return snapshot
+        now = datetime.utcnow()
+        stats, monthly, top_ref, top_share = await asyncio.gather(
+            get_approval_stats(),
+            get_monthly_payments(now.year, now.month),
+            get_top_referrers(5),
+            get_top_sharers(5),
+        )
+        _admin_stats_snapshot = {
+            "generated_at": now.isoformat() + "Z",
+            "payments_stats": stats,
+            "monthly_breakdown": monthly,
+            "top_referrers": top_ref,
+            "top_sharers": top_share,
+        }
+        _admin_stats_expires_at = time.monotonic() + ADMIN_STATS_CACHE_SECONDS
+        return _admin_stats_snapshot
+
+
+@app.get("/metrics")
+async def metrics(request: Request, token: str = ""):
+    """
+    מדדים בפורמט הטקסט של Prometheus: עדכונים (התקבלו / כפולים / נדחו),
+    זמן לכל handler, קריאות ל-Bot API (זמן + שגיאות לפי method), זמני DB
+    ו-lag של ה-event loop. הכל נאסף בזיכרון; החישוב רק בזמן ה-scrape.
+    """
+    if METRICS_TOKEN:
+        bearer = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if METRICS_TOKEN not in (token, bearer):
+            raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return Response(
+        content=telemetry.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.get("/admin/stats")
-async def admin_stats(token: str = ""):
+async def admin_stats(token: str = "", fresh: bool = False):
+    """
+    נתוני ה-DB מגיעים מ-snapshot של עד ADMIN_STATS_CACHE_SECONDS שניות
+    (generated_at); ?fresh=1 מחשב מחדש. שאר הנתונים (תורים, cache) – חיים.
+    """
     if not ADMIN_DASH_TOKEN or token != ADMIN_DASH_TOKEN:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
@@ -1377,46 +2160,263 @@ async def admin_stats(token: str = ""):
         return {"db": "disabled"}
 
     try:
-        stats = get_approval_stats()
-        monthly = get_monthly_payments(datetime.utcnow().year, datetime.utcnow().month)
-        top_ref = get_top_referrers(5)
-        top_share = get_top_sharers(5)
+        db_stats = await load_admin_db_stats(fresh)
     except Exception as e:
         logger.error("Failed to get admin stats: %s", e)
         raise HTTPException(status_code=500, detail="DB error")
 
     return {
         "db": "enabled",
-        "payments_stats": stats,
-        "monthly_breakdown": monthly,
-        "top_referrers": top_ref,
-        "top_sharers": top_share,
+        **db_stats,
+        "cache": cache_stats(),
+        "replica": get_replica_stats(),
+        "webhook_queue": update_dispatcher.stats(),
+        "send_queue": send_limiter.stats(),
+        "persistence": bot_persistence.stats(),
+        "paid_index": paid_index.stats() if paid_index is not None else None,
+        "leader": leader.stats() if leader is not None else {"is_leader": True},
+    }
+
+
+# =========================
+# ייצוא מלא (CSV / NDJSON)
+# =========================
+
+# כמה שורות נצברות לפני שנשלח chunk ללקוח
+EXPORT_CHUNK_ROWS = 500
+
+
+def _export_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def _export_csv(table: str, rows):
+    columns = EXPORT_COLUMNS[table]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    count = 0
+    async for row in rows:
+        writer.writerow(
+            ["" if row[c] is None else _export_value(row[c]) for c in columns]
+        )
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+async def _prepend_row(first, rows):
+    if first is not None:
+        yield first
+    async for row in rows:
+        yield row
+
+
+async def _export_ndjson(rows):
+    lines: List[str] = []
+    async for row in rows:
+        lines.append(
+            json.dumps({k: _export_value(v) for k, v in row.items()}, ensure_ascii=False)
+        )
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+@app.get("/admin/export/{table}")
+async def admin_export(
+    table: str,
+    token: str = "",
+    fmt: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    after_id: int = 0,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    """
+    ייצוא של payments / referrals / rewards / users לפי id עולה, בזרימה.
+    הורדה שנקטעה ממשיכים עם after_id = ה-id האחרון שהתקבל;
+    limit מאפשר להוריד בחלקים.
+    """
+    if not ADMIN_DASH_TOKEN or token != ADMIN_DASH_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if not DB_AVAILABLE:
+        raise HTTPException(status_code=503, detail="DB disabled")
+
+    if table not in EXPORT_COLUMNS:
+        raise HTTPException(status_code=404, detail="Unknown table")
+
+    # השורה הראשונה נקראת לפני התשובה: עומס / שגיאת DB מחזירים סטטוס
+    # מתאים במקום זרם שנקטע
+    rows = export_rows(table, after_id=after_id, limit=limit)
+    try:
+        first = await rows.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except ExportBusy:
+        raise HTTPException(
+            status_code=429, detail="Too many exports running", headers={"Retry-After": "10"}
+        )
+    except Exception as e:
+        logger.error("Failed to start export of %s: %s", table, e)
+        raise HTTPException(status_code=500, detail="DB error")
+    rows = _prepend_row(first, rows)
+
+    if fmt == "csv":
+        body = _export_csv(table, rows)
+        media_type = "text/csv; charset=utf-8"
+    else:
+        body = _export_ndjson(rows)
+        media_type = "application/x-ndjson"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{table}.{fmt}"'},
+    )
+
+
+@app.get("/admin/timings")
+async def admin_timings(token: str = ""):
+    """
+    היסטוגרמות זמנים: db_call / db_pool_wait / db_execute / db_fetch לפי
+    פונקציה ב-DB, span לפי שלב (למשל שלבי /start), ושאילתות איטיות אחרונות.
+    """
+    if not ADMIN_DASH_TOKEN or token != ADMIN_DASH_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    return {
+        "histograms": telemetry.snapshot(),
+        "slow_queries": telemetry.slow_queries(),
     }
 
 
+@app.post("/admin/broadcasts")
+async def admin_create_broadcast(request: Request, token: str = ""):
+    """
+    יוצר broadcast לכל המשתמשים. גוף JSON: {"text": "...", "admin_chat_id": ...}
+    (admin_chat_id – לאן לשלוח את הודעת ההתקדמות; ברירת מחדל: קבוצת הלוגים).
+    """
+    if not ADMIN_DASH_TOKEN or token != ADMIN_DASH_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if not DB_AVAILABLE:
+        raise HTTPException(status_code=503, detail="DB disabled")
+
+    try:
+        data = await request.json()
+        text = str(data.get("text") or "").strip()
+        admin_chat_id = int(data.get("admin_chat_id") or PAYMENTS_LOG_CHAT_ID)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not text:
+        raise HTTPException(status_code=400, detail="text is required")
+
+    row = await broadcast_runner.create(text, None, admin_chat_id, start=is_leader())
+    if row is None:
+        raise HTTPException(status_code=500, detail="DB error")
+    return row
+
+
+@app.get("/admin/broadcasts")
+async def admin_list_broadcasts(token: str = "", limit: int = Query(20, ge=1, le=200)):
+    if not ADMIN_DASH_TOKEN or token != ADMIN_DASH_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if not DB_AVAILABLE:
+        raise HTTPException(status_code=503, detail="DB disabled")
+
+    return {
+        "items": await list_broadcasts(limit),
+        "runner": broadcast_runner.stats(),
+    }
+
+
+@app.get("/admin/broadcasts/{broadcast_id}")
+async def admin_get_broadcast(broadcast_id: int, token: str = ""):
+    if not ADMIN_DASH_TOKEN or token != ADMIN_DASH_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if not DB_AVAILABLE:
+        raise HTTPException(status_code=503, detail="DB disabled")
+
+    row = await get_broadcast(broadcast_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Unknown broadcast")
+    row["live"] = broadcast_runner.stats()["progress"].get(str(broadcast_id))
+    return row
+
+
+@app.post("/admin/broadcasts/{broadcast_id}/cancel")
+async def admin_cancel_broadcast(broadcast_id: int, token: str = ""):
+    if not ADMIN_DASH_TOKEN or token != ADMIN_DASH_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    if not DB_AVAILABLE:
+        raise HTTPException(status_code=503, detail="DB disabled")
+
+    if not await broadcast_runner.cancel(broadcast_id):
+        raise HTTPException(status_code=409, detail="Broadcast not found or already finished")
+    return {"id": broadcast_id, "status": "cancelled"}
+
+
+async def build_share_board() -> bytes:
+    rows = await get_top_sharers(50)
+    items = [
+        {
+            "user_id": row["user_id"],
+            "username": row["username"],
+            "points": row["total_points"],
+        }
+        for row in rows
+    ]
+    return json.dumps({"items": items}, ensure_ascii=False).encode("utf-8")
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
 @app.get("/public/share_board")
-async def public_share_board():
+async def public_share_board(request: Request):
     """
     API ציבורי לטבלת השיתופים.
     מחזיר JSON: { items: [ {user_id, username, points}, ... ] }
+
+    התשובה נבנית לכל היותר פעם ב-SHARE_BOARD_CACHE_SECONDS (אחרי הענקת
+    נקודות שיתוף – כבר אחרי SHARE_BOARD_MIN_REBUILD_SECONDS) ומוגשת עם
+    ETag / Last-Modified – דף הנחיתה ו-CDN מקבלים 304 כשלא השתנה כלום.
     """
     if not DB_AVAILABLE:
         return {"items": []}
 
     try:
-        rows = get_top_sharers(50)
+        snapshot = await share_board_snapshot.get(build_share_board)
     except Exception as e:
         logger.error("Failed to get public share board: %s", e)
         raise HTTPException(status_code=500, detail="DB error")
 
-    items = []
-    for row in rows:
-        items.append(
-            {
-                "user_id": row["user_id"],
-                "username": row["username"],
-                "points": row["total_points"],
-            }
-        )
-
-    return {"items": items}
+    headers = {
+        "ETag": snapshot.etag,
+        "Last-Modified": format_datetime(snapshot.last_modified, usegmt=True),
+        "Cache-Control": f"public, max-age={int(share_board_snapshot.ttl)}",
+    }
+    if _not_modified(request, snapshot.etag, snapshot.last_modified):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED.value, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
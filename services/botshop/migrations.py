@@ -0,0 +1,521 @@
+# migrations.py
+"""
+מיגרציות סכמה עם גרסאות.
+
+כל מיגרציה רצה פעם אחת ונרשמת בטבלת schema_migrations.
+כשאין שינוי – run_migrations עושה שאילתה אחת (max(version)) וחוזרת.
+כמה workers שעולים יחד מסתנכרנים על advisory lock, כך שרק אחד מריץ.
+
+מיגרציה עם transactional=False רצה ב-autocommit – נדרש ל-CREATE INDEX
+CONCURRENTLY, שלא נועל כתיבות לטבלה בזמן הבנייה.
+"""
+import logging
+from typing import Callable, List, NamedTuple, Union
+
+import psycopg2
+import psycopg2.errors
+
+import partitions
+import queries
+
+logger = logging.getLogger(__name__)
+
+# מזהה קבוע ל-pg_advisory_lock של המיגרציות
+MIGRATIONS_LOCK_ID = 7_240_001
+
+Step = Union[str, Callable]
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    steps: List[Step]
+    transactional: bool = True
+
+
+def concurrent_index(name: str, definition: str) -> Callable:
+    """
+    CREATE INDEX CONCURRENTLY אידמפוטנטי: אם בנייה קודמת נכשלה והשאירה
+    אינדקס INVALID – מוחקים אותו ובונים מחדש.
+    """
+
+    def step(cur) -> None:
+        cur.execute(
+            "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s);",
+            (name,),
+        )
+        row = cur.fetchone()
+        if row and not row[0]:
+            logger.warning("Dropping invalid index %s before rebuilding it.", name)
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition};")
+
+    return step
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "baseline tables",
+        [
+            # payments – כבר קיימת אצלך, כאן רק לוודא
+            """
+            CREATE TABLE IF NOT EXISTS payments (
+                id SERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                username TEXT,
+                pay_method TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                reason TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+            # users – לזיהוי משתמשים/מפנים
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id BIGINT PRIMARY KEY,
+                username TEXT,
+                first_seen_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+            # referrals – הפניות בין משתמשים
+            """
+            CREATE TABLE IF NOT EXISTS referrals (
+                id SERIAL PRIMARY KEY,
+                referrer_id BIGINT NOT NULL,
+                referred_id BIGINT NOT NULL,
+                source TEXT,
+                points INT NOT NULL DEFAULT 1,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+            # rewards – פרסים / נקודות (כולל SHARE_POINTS)
+            """
+            CREATE TABLE IF NOT EXISTS rewards (
+                id SERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                reward_type TEXT NOT NULL,
+                reason TEXT,
+                points INT NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                tx_hash TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+            # promoters – מי שרכש והפך למפיץ עם פרטי בנק משלו
+            """
+            CREATE TABLE IF NOT EXISTS promoters (
+                user_id BIGINT PRIMARY KEY,
+                bank_details TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+            # metrics – מונים כלליים (למשל start_image_views)
+            """
+            CREATE TABLE IF NOT EXISTS metrics (
+                key TEXT PRIMARY KEY,
+                value BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+        ],
+    ),
+    Migration(
+        2,
+        "leaderboard totals",
+        [
+            # referral_totals – סיכום הפניות לכל מפנה, מתעדכן יחד עם add_referral
+            """
+            CREATE TABLE IF NOT EXISTS referral_totals (
+                referrer_id BIGINT PRIMARY KEY,
+                total_referrals BIGINT NOT NULL DEFAULT 0,
+                total_points BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS referral_totals_rank_idx
+                ON referral_totals (total_points DESC, total_referrals DESC);
+            """,
+            # reward_totals – סיכום נקודות לכל משתמש וסוג reward, מתעדכן יחד עם create_reward
+            """
+            CREATE TABLE IF NOT EXISTS reward_totals (
+                user_id BIGINT NOT NULL,
+                reward_type TEXT NOT NULL,
+                total_points BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (user_id, reward_type)
+            );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS reward_totals_rank_idx
+                ON reward_totals (reward_type, total_points DESC);
+            """,
+            *queries.BACKFILL_LEADERBOARDS,
+        ],
+    ),
+    Migration(
+        3,
+        "dedup referrals",
+        [
+            # עד עכשיו לא היה constraint, אז ON CONFLICT DO NOTHING ב-add_referral
+            # לא עצר כפילויות. מוחקים כפילויות (משאירים את הראשונה), מוסיפים
+            # unique ובונים מחדש את referral_totals – הכל בטרנזקציה אחת.
+            "LOCK TABLE referrals IN SHARE ROW EXCLUSIVE MODE;",
+            """
+            DELETE FROM referrals a
+            USING referrals b
+            WHERE a.referrer_id = b.referrer_id
+              AND a.referred_id = b.referred_id
+              AND a.id > b.id;
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS referrals_referrer_referred_key
+                ON referrals (referrer_id, referred_id);
+            """,
+            *queries.BACKFILL_REFERRAL_TOTALS,
+        ],
+    ),
+    # update_payment_status – "התשלום האחרון של המשתמש"
+    Migration(
+        4,
+        "payments user/created_at index",
+        [
+            concurrent_index(
+                "payments_user_created_idx",
+                "ON payments (user_id, created_at DESC)",
+            )
+        ],
+        transactional=False,
+    ),
+    # get_share_points – index-only scan על (user_id, reward_type) + points
+    Migration(
+        5,
+        "rewards user/type index",
+        [
+            concurrent_index(
+                "rewards_user_type_idx",
+                "ON rewards (user_id, reward_type) INCLUDE (points)",
+            )
+        ],
+        transactional=False,
+    ),
+    # get_approval_stats – index-only scan במקום קריאת כל השורות
+    Migration(
+        6,
+        "payments status index",
+        [concurrent_index("payments_status_idx", "ON payments (status)")],
+        transactional=False,
+    ),
+    Migration(
+        7,
+        "payments monthly rollup",
+        [
+            # payments_monthly – ספירת תשלומים לחודש × אמצעי תשלום × סטטוס,
+            # מתעדכנת ב-log_payment / update_payment_status
+            """
+            CREATE TABLE IF NOT EXISTS payments_monthly (
+                month DATE NOT NULL,
+                pay_method TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL,
+                count BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (month, pay_method, status)
+            );
+            """,
+            *queries.BACKFILL_PAYMENTS_MONTHLY,
+        ],
+    ),
+    # get_monthly_payments (החודש הנוכחי) – טווח על created_at
+    Migration(
+        8,
+        "payments created_at index",
+        [concurrent_index("payments_created_idx", "ON payments (created_at)")],
+        transactional=False,
+    ),
+    # payments / rewards -> partitioned לפי חודש (ראה partitions.py).
+    # הטבלה הישנה מקבלת שם _legacy, הנתונים מועתקים והיא נמחקת – הכל
+    # בטרנזקציה אחת, תחת ACCESS EXCLUSIVE. ה-sequences נשמרים (ומורחבים
+    # ל-BIGINT), כך שה-ids ממשיכים מאותו מקום.
+    # אינדקסים על טבלה partitioned לא נבנים CONCURRENTLY.
+    # זה downtime מתוכנן: עד סוף ההעתקה שתי הטבלאות נעולות גם לקריאה
+    # (ראה "שדרוג ל-partitions" ב-README).
+    Migration(
+        9,
+        "monthly partitions for payments and rewards",
+        [
+            "LOCK TABLE payments, rewards IN ACCESS EXCLUSIVE MODE;",
+            "ALTER TABLE payments RENAME TO payments_legacy;",
+            "ALTER TABLE payments_legacy RENAME CONSTRAINT payments_pkey TO payments_legacy_pkey;",
+            "ALTER SEQUENCE payments_id_seq AS BIGINT;",
+            """
+            CREATE TABLE payments (
+                id BIGINT NOT NULL DEFAULT nextval('payments_id_seq'),
+                user_id BIGINT NOT NULL,
+                username TEXT,
+                pay_method TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                reason TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at);
+            """,
+            "CREATE TABLE payments_default PARTITION OF payments DEFAULT;",
+            lambda cur: partitions.create_initial_partitions(cur, "payments", "payments_legacy"),
+            """
+            INSERT INTO payments
+                (id, user_id, username, pay_method, status, reason, created_at, updated_at)
+            SELECT id, user_id, username, pay_method, status, reason, created_at, updated_at
+            FROM payments_legacy;
+            """,
+            "ALTER SEQUENCE payments_id_seq OWNED BY payments.id;",
+            "DROP TABLE payments_legacy;",
+            "CREATE INDEX payments_user_created_idx ON payments (user_id, created_at DESC);",
+            "CREATE INDEX payments_status_idx ON payments (status);",
+            "CREATE INDEX payments_created_idx ON payments (created_at);",
+            "ALTER TABLE rewards RENAME TO rewards_legacy;",
+            "ALTER TABLE rewards_legacy RENAME CONSTRAINT rewards_pkey TO rewards_legacy_pkey;",
+            "ALTER SEQUENCE rewards_id_seq AS BIGINT;",
+            """
+            CREATE TABLE rewards (
+                id BIGINT NOT NULL DEFAULT nextval('rewards_id_seq'),
+                user_id BIGINT NOT NULL,
+                reward_type TEXT NOT NULL,
+                reason TEXT,
+                points INT NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                tx_hash TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at);
+            """,
+            "CREATE TABLE rewards_default PARTITION OF rewards DEFAULT;",
+            lambda cur: partitions.create_initial_partitions(cur, "rewards", "rewards_legacy"),
+            """
+            INSERT INTO rewards
+                (id, user_id, reward_type, reason, points, status, tx_hash, created_at, updated_at)
+            SELECT id, user_id, reward_type, reason, points, status, tx_hash, created_at, updated_at
+            FROM rewards_legacy;
+            """,
+            "ALTER SEQUENCE rewards_id_seq OWNED BY rewards.id;",
+            "DROP TABLE rewards_legacy;",
+            "CREATE INDEX rewards_user_type_idx ON rewards (user_id, reward_type) INCLUDE (points);",
+        ],
+    ),
+    # processed_updates – dedup של עדכוני טלגרם בין workers / שרתים.
+    # UNLOGGED: בלי WAL (זול יותר לכל עדכון); אחרי קריסה הטבלה מתרוקנת,
+    # וזה בסדר לחלון dedup.
+    Migration(
+        10,
+        "processed updates",
+        [
+            """
+            CREATE UNLOGGED TABLE IF NOT EXISTS processed_updates (
+                update_id BIGINT PRIMARY KEY,
+                received_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS processed_updates_received_idx
+                ON processed_updates (received_at);
+            """,
+        ],
+    ),
+    # media_cache – file_id של קבצים שכבר הועלו לטלגרם, לפי sha256 של התוכן
+    Migration(
+        11,
+        "media cache",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS media_cache (
+                key TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+        ],
+    ),
+    # broadcasts – הודעה לכל המשתמשים; broadcast_deliveries – מצב לכל נמען,
+    # כדי שאחרי קריסה / deploy השליחה תמשיך מאיפה שעצרה
+    Migration(
+        12,
+        "broadcasts",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id BIGSERIAL PRIMARY KEY,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_by BIGINT,
+                admin_chat_id BIGINT,
+                progress_message_id BIGINT,
+                last_user_id BIGINT NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                blocked INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                started_at TIMESTAMPTZ,
+                finished_at TIMESTAMPTZ
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                broadcast_id BIGINT NOT NULL REFERENCES broadcasts (id) ON DELETE CASCADE,
+                user_id BIGINT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                sent_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (broadcast_id, user_id)
+            );
+            """,
+        ],
+    ),
+    # ptb_user_data / ptb_bot_data – ה-persistence של PTB (pickle לכל משתמש / מפתח)
+    Migration(
+        13,
+        "ptb persistence",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS ptb_user_data (
+                user_id BIGINT PRIMARY KEY,
+                data BYTEA NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS ptb_bot_data (
+                key TEXT PRIMARY KEY,
+                data BYTEA NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+        ],
+    ),
+    # pending_payments – צילום האישור האחרון של כל משתמש (ל-/reject);
+    # pending_rejects – אדמין שלחץ "דחייה" וממתינים לסיבה ממנו.
+    # שורה לכל משתמש / אדמין, כדי שכל worker יראה אותן מיד
+    Migration(
+        14,
+        "pending payments and rejects",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS pending_payments (
+                user_id BIGINT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                pay_method TEXT,
+                username TEXT,
+                chat_id BIGINT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS pending_rejects (
+                admin_id BIGINT PRIMARY KEY,
+                target_id BIGINT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """,
+        ],
+    ),
+    # version = txid של הטרנזקציה שכתבה את השורה. קורא ממשיך מ-xmin של
+    # ה-snapshot שלו, כך שכתיבה שעוד לא עשתה commit בזמן הקריאה לא מתפספסת
+    # (בשונה מ-updated_at = NOW(), שהוא זמן תחילת הטרנזקציה).
+    # data = NULL – המפתח / המשתמש נמחק (tombstone), כדי ש-workers אחרים
+    # יראו גם מחיקות.
+    Migration(
+        15,
+        "ptb persistence versions",
+        [
+            "ALTER TABLE ptb_user_data ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;",
+            "ALTER TABLE ptb_user_data ALTER COLUMN data DROP NOT NULL;",
+            "ALTER TABLE ptb_bot_data ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;",
+            "ALTER TABLE ptb_bot_data ALTER COLUMN data DROP NOT NULL;",
+        ],
+    ),
+]
+
+
+def _applied_version(cur) -> int:
+    cur.execute(queries.SCHEMA_VERSION)
+    return cur.fetchone()[0]
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version
+
+
+def _run_steps(cur, migration: Migration) -> None:
+    for step in migration.steps:
+        if callable(step):
+            step(cur)
+        else:
+            cur.execute(step)
+
+
+def run_migrations(dsn: str) -> int:
+    """
+    מריץ את כל המיגרציות שעוד לא רצו, לפי הסדר.
+    מחזיר את גרסת הסכמה אחרי הריצה.
+    """
+    latest = latest_version()
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+
+        # מסלול מהיר: הכל כבר רץ
+        try:
+            if _applied_version(cur) >= latest:
+                return latest
+        except psycopg2.errors.UndefinedTable:
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                );
+                """
+            )
+
+        cur.execute("SELECT pg_advisory_lock(%s);", (MIGRATIONS_LOCK_ID,))
+        try:
+            # worker אחר אולי הריץ אותן בזמן שחיכינו למנעול
+            current = _applied_version(cur)
+            for migration in MIGRATIONS:
+                if migration.version <= current:
+                    continue
+
+                logger.info(
+                    "Applying migration %s: %s", migration.version, migration.name
+                )
+                if migration.transactional:
+                    cur.execute("BEGIN;")
+                    try:
+                        _run_steps(cur, migration)
+                        cur.execute(
+                            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                            (migration.version, migration.name),
+                        )
+                        cur.execute("COMMIT;")
+                    except Exception:
+                        cur.execute("ROLLBACK;")
+                        raise
+                else:
+                    _run_steps(cur, migration)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                        (migration.version, migration.name),
+                    )
+                current = migration.version
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATIONS_LOCK_ID,))
+
+        logger.info("DB schema at version %s.", current)
+        return current
+    finally:
+        conn.close()
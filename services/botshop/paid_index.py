@@ -0,0 +1,116 @@
+# paid_index.py
+"""
+אינדקס בזיכרון של משתמשים ששילמו (יש להם תשלום ב-status = 'approved').
+
+- ב-startup נטענים כל ה-user_ids המאושרים ל-set, ומתרעננים כל
+  PAID_INDEX_RELOAD_INTERVAL שניות (אישורים / דחיות ב-workers אחרים).
+- אישור / דחייה ב-worker הזה מעדכנים את ה-set מיד.
+- משתמש שלא נמצא ב-set נבדק ב-DB; תשובה שלילית נשמרת ל-PAID_INDEX_NEGATIVE_TTL
+  שניות, כדי שלחיצות חוזרות של משתמש שלא שילם לא יגיעו כל פעם ל-DB.
+"""
+import os
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+
+from cache import MISSING, TTLCache
+from db_async import get_reward_targets, get_user_paid
+
+logger = logging.getLogger(__name__)
+
+PAID_INDEX_RELOAD_INTERVAL = float(os.environ.get("PAID_INDEX_RELOAD_INTERVAL", "300"))
+PAID_INDEX_NEGATIVE_TTL = float(os.environ.get("PAID_INDEX_NEGATIVE_TTL", "30"))
+
+
+class PaidUserIndex:
+    def __init__(
+        self,
+        reload_interval: float = PAID_INDEX_RELOAD_INTERVAL,
+        negative_ttl: float = PAID_INDEX_NEGATIVE_TTL,
+    ) -> None:
+        self.reload_interval = reload_interval
+        self._paid: Set[int] = set()
+        # עולה בכל mark_*; טעינה מלאה שהתחילה לפני כן לא דורסת את השינוי
+        self._version = 0
+        self._loaded = False
+        self._not_paid = TTLCache("paid_negative", ttl=negative_ttl)
+        self._task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "negative_hits": 0,
+            "db_checks": 0,
+            "reloads": 0,
+        }
+
+    # ---------- lifecycle ----------
+
+    async def start(self) -> None:
+        try:
+            await self.reload()
+        except Exception as e:
+            logger.error("Failed to load paid users: %s", e)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error("Failed to reload paid users: %s", e)
+
+    async def reload(self) -> None:
+        version = self._version
+        paid = set(await get_reward_targets("approved"))
+        if version != self._version:
+            # היה אישור / דחייה בזמן הטעינה – ננסה בסבב הבא
+            return
+        self._paid = paid
+        self._not_paid.clear()
+        self._loaded = True
+        self._stats["reloads"] += 1
+
+    # ---------- lookups / updates ----------
+
+    async def is_paid(self, user_id: int) -> bool:
+        if user_id in self._paid:
+            self._stats["hits"] += 1
+            return True
+        if self._not_paid.get(user_id) is not MISSING:
+            self._stats["negative_hits"] += 1
+            return False
+
+        self._stats["db_checks"] += 1
+        epoch = self._not_paid.begin_read()
+        version = self._version
+        paid = await get_user_paid(user_id)
+        if not paid:
+            self._not_paid.fill(user_id, False, epoch)
+        elif version == self._version:
+            self._paid.add(user_id)
+        return paid
+
+    def mark_paid(self, user_id: int) -> None:
+        self._version += 1
+        self._paid.add(user_id)
+        self._not_paid.invalidate(user_id)
+
+    def mark_unpaid(self, user_id: int) -> None:
+        """אחרי דחייה. אם יש למשתמש תשלום מאושר אחר – הבדיקה ב-DB תחזיר אותו."""
+        self._version += 1
+        self._paid.discard(user_id)
+        self._not_paid.invalidate(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        stats["loaded"] = self._loaded
+        stats["paid_users"] = len(self._paid)
+        stats["negative_cache"] = self._not_paid.stats()
+        return stats
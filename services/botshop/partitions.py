@@ -0,0 +1,184 @@
+# partitions.py
+"""
+חלוקה חודשית (RANGE על created_at) של payments ו-rewards.
+
+- לכל טבלה יש partition חודשי בשם <table>_pYYYY_MM (חודש לפי UTC)
+  ו-partition ברירת מחדל <table>_default, כך שהכנסה לעולם לא נכשלת.
+- maintain_partitions() יוצר מראש את החודשים הבאים (PARTITION_MONTHS_AHEAD)
+  ואם PARTITION_RETENTION_MONTHS > 0 – מנתק partitions ישנים של rewards
+  ומעביר אותם ל-schema הארכיון (PARTITION_ARCHIVE_SCHEMA). הנתונים לא נמחקים,
+  והסיכום reward_totals לא משתנה. שימו לב: backfill של הסיכומים מחשב רק
+  מה-partitions המחוברים.
+- payments לא עוברים לארכיון: סטטוס התשלום (is_user_paid, PaidUserIndex,
+  יעדי airdrop) נקרא ישירות מהם ואין לו סיכום.
+"""
+import os
+import re
+import logging
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("payments", "rewards")
+# רק להן יש retention – payments נשארים מחוברים (ראה למעלה)
+RETENTION_TABLES = ("rewards",)
+
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", "3"))
+# 0 = לא מנתקים partitions ישנים
+PARTITION_RETENTION_MONTHS = int(os.environ.get("PARTITION_RETENTION_MONTHS", "0"))
+PARTITION_ARCHIVE_SCHEMA = os.environ.get("PARTITION_ARCHIVE_SCHEMA", "archive")
+
+_PARTITION_RE = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})_(?P<month>\d{2})$")
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    index = d.year * 12 + (d.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _utc(d: date) -> datetime:
+    return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def ensure_partition(cur, table: str, month: date) -> bool:
+    """
+    יוצר את ה-partition של החודש אם הוא חסר. אם כבר נכנסו שורות לחודש הזה
+    ל-partition ברירת המחדל – מעבירים אותן ל-partition החדש לפני החיבור.
+    מחזיר True אם נוצר partition.
+    """
+    name = partition_name(table, month)
+    cur.execute("SELECT to_regclass(%s);", (name,))
+    if cur.fetchone()[0] is not None:
+        return False
+
+    start, end = _utc(month), _utc(add_months(month, 1))
+    default = f"{table}_default"
+    cur.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {default} WHERE created_at >= %s AND created_at < %s);",
+        (start, end),
+    )
+    if cur.fetchone()[0]:
+        cur.execute(
+            f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);"
+        )
+        cur.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {default}
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved;
+            """,
+            (start, end),
+        )
+        cur.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s);",
+            (start, end),
+        )
+        logger.warning("Moved rows of %s from %s into new partition.", name, default)
+    else:
+        cur.execute(
+            f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s);",
+            (start, end),
+        )
+    logger.info("Created partition %s.", name)
+    return True
+
+
+def create_initial_partitions(cur, table: str, source: str) -> None:
+    """
+    partitions לכל החודשים שיש בהם נתונים ב-source, ועד PARTITION_MONTHS_AHEAD
+    חודשים קדימה. משמש את המיגרציה שממירה טבלה קיימת ל-partitioned.
+    """
+    cur.execute(f"SELECT MIN(created_at) FROM {source};")
+    oldest = cur.fetchone()[0]
+    today = datetime.now(timezone.utc).date()
+    month = month_start(oldest.astimezone(timezone.utc).date() if oldest else today)
+    last = add_months(month_start(today), PARTITION_MONTHS_AHEAD)
+    while month <= last:
+        ensure_partition(cur, table, month)
+        month = add_months(month, 1)
+
+
+def _is_partitioned(cur, table: str) -> bool:
+    cur.execute(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);", (table,)
+    )
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def _attached_partitions(cur, table: str) -> List[str]:
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s);
+        """,
+        (table,),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def archive_old_partitions(cur, table: str, cutoff: date) -> List[str]:
+    """מנתק partitions שכל הטווח שלהם לפני cutoff ומעביר אותם ל-schema הארכיון."""
+    archived = []
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {PARTITION_ARCHIVE_SCHEMA};")
+    for name in sorted(_attached_partitions(cur, table)):
+        match = _PARTITION_RE.match(name)
+        if not match or match.group("table") != table:
+            continue
+        month = date(int(match.group("year")), int(match.group("month")), 1)
+        if add_months(month, 1) > cutoff:
+            continue
+        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name};")
+        cur.execute(f"ALTER TABLE {name} SET SCHEMA {PARTITION_ARCHIVE_SCHEMA};")
+        logger.info("Archived partition %s to schema %s.", name, PARTITION_ARCHIVE_SCHEMA)
+        archived.append(name)
+    return archived
+
+
+def maintain_partitions(dsn: str, today: Optional[date] = None) -> Dict[str, Dict[str, List[str]]]:
+    """
+    יוצר partitions לחודש הנוכחי ול-PARTITION_MONTHS_AHEAD הבאים,
+    ומעביר לארכיון partitions ישנים של RETENTION_TABLES לפי PARTITION_RETENTION_MONTHS.
+    כל פעולה בטרנזקציה משלה. מחזיר סיכום לפי טבלה.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    current = month_start(today)
+    summary: Dict[str, Dict[str, List[str]]] = {}
+
+    conn = psycopg2.connect(dsn)
+    try:
+        for table in PARTITIONED_TABLES:
+            created: List[str] = []
+            archived: List[str] = []
+            with conn, conn.cursor() as cur:
+                if not _is_partitioned(cur, table):
+                    continue
+            for offset in range(PARTITION_MONTHS_AHEAD + 1):
+                month = add_months(current, offset)
+                with conn, conn.cursor() as cur:
+                    if ensure_partition(cur, table, month):
+                        created.append(partition_name(table, month))
+            if PARTITION_RETENTION_MONTHS > 0 and table in RETENTION_TABLES:
+                cutoff = add_months(current, -PARTITION_RETENTION_MONTHS)
+                with conn, conn.cursor() as cur:
+                    archived = archive_old_partitions(cur, table, cutoff)
+            summary[table] = {"created": created, "archived": archived}
+    finally:
+        conn.close()
+    return summary
@@ -0,0 +1,318 @@
+# persistence.py
+"""
+persistence של PTB על ה-PostgreSQL: bot_data ו-user_data שורדים deploy
+ומשותפים בין workers.
+
+- user_data נטען לכל משתמש רק כשמגיע ממנו עדכון (refresh_user_data),
+  לא כולו ב-startup. bot_data נשמר שורה לכל מפתח עליון. מה שכמה workers
+  כותבים במקביל לא נשמר כאן, כי כתיבה של מפתח שלם דורסת שינויים של
+  worker אחר. תשלומים ממתינים ודחיות נשמרים בטבלאות משלהם
+  (pending_payments / pending_rejects), שורה לכל משתמש / אדמין.
+- dirty tracking: כל ערך נשמר כ-pickle, ונכתב רק אם ה-hash שלו השתנה
+  מאז הכתיבה / הקריאה האחרונה.
+- כתיבה מרוכזת: update_* של PTB רק מסמנים ערכים לכתיבה; אחרי
+  PERSISTENCE_FLUSH_DELAY שניות כל מה שהצטבר נכתב בשאילתה אחת לכל טבלה
+  (אותו משתמש / מפתח שהשתנה כמה פעמים נכתב פעם אחת).
+- שינויים של workers אחרים נקראים לכל היותר פעם ב-PERSISTENCE_REFRESH_INTERVAL
+  שניות, ורק אם אין בזיכרון שינוי מקומי שעוד לא נכתב (אחרת – הכתיבה
+  שלנו מנצחת).
+- כל שורה נושאת version (txid של הכותב), וכל קריאה מחזירה את ה-xmin של
+  ה-snapshot שלה – הקריאה הבאה מתחילה ממנו, כך שכתיבה שעשתה commit אחרי
+  הקריאה לא מתפספסת. מחיקה נשמרת כ-tombstone (data = NULL) ומוחקת את
+  המפתח / ה-user_data גם ב-workers האחרים.
+"""
+import os
+import time
+import pickle
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Set, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from db_async import (
+    get_ptb_user_data,
+    save_ptb_user_data,
+    delete_ptb_user_data,
+    get_ptb_bot_data,
+    save_ptb_bot_data,
+    delete_ptb_bot_data,
+)
+
+logger = logging.getLogger(__name__)
+
+# כל כמה שניות PTB מעביר ל-persistence את מה שהשתנה
+PERSISTENCE_UPDATE_INTERVAL = float(os.environ.get("PERSISTENCE_UPDATE_INTERVAL", "5"))
+PERSISTENCE_FLUSH_DELAY = float(os.environ.get("PERSISTENCE_FLUSH_DELAY", "1"))
+PERSISTENCE_REFRESH_INTERVAL = float(os.environ.get("PERSISTENCE_REFRESH_INTERVAL", "5"))
+
+
+def _dumps(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class PostgresPersistence(BasePersistence[Dict[Any, Any], Dict[Any, Any], Dict[Any, Any]]):
+    def __init__(
+        self,
+        update_interval: float = PERSISTENCE_UPDATE_INTERVAL,
+        flush_delay: float = PERSISTENCE_FLUSH_DELAY,
+        refresh_interval: float = PERSISTENCE_REFRESH_INTERVAL,
+    ) -> None:
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=True, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.flush_delay = flush_delay
+        self.refresh_interval = refresh_interval
+
+        # hash של מה שידוע שנמצא ב-DB, ו-version שממנו ממשיכים לקרוא
+        self._user_hashes: Dict[int, bytes] = {}
+        self._user_versions: Dict[int, int] = {}
+        self._user_checked: Dict[int, float] = {}
+        self._bot_hashes: Dict[str, bytes] = {}
+        self._bot_version = 0
+        self._bot_checked = 0.0
+
+        # מה שממתין לכתיבה
+        self._pending_users: Dict[int, bytes] = {}
+        self._pending_user_deletes: Set[int] = set()
+        self._pending_bot: Dict[str, bytes] = {}
+        self._pending_bot_deletes: Set[str] = set()
+
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, int] = {
+            "user_loads": 0,
+            "user_writes": 0,
+            "bot_key_writes": 0,
+            "flushes": 0,
+            "skipped_clean": 0,
+        }
+
+    # ---------- bot_data ----------
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        bot_data: Dict[Any, Any] = {}
+        rows, self._bot_version = await get_ptb_bot_data(0)
+        for key, data in rows:
+            if data is None:  # נמחק
+                continue
+            try:
+                bot_data[key] = pickle.loads(data)
+            except Exception as e:
+                logger.error("Failed to unpickle bot_data[%s]: %s", key, e)
+                continue
+            self._bot_hashes[key] = _digest(data)
+        self._bot_checked = time.monotonic()
+        return bot_data
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        changed = False
+        for key, value in data.items():
+            key = str(key)
+            dumped = _dumps(value)
+            digest = _digest(dumped)
+            if self._bot_hashes.get(key) == digest:
+                continue
+            self._bot_hashes[key] = digest
+            self._pending_bot[key] = dumped
+            self._pending_bot_deletes.discard(key)
+            changed = True
+        for key in set(self._bot_hashes) - {str(k) for k in data}:
+            del self._bot_hashes[key]
+            self._pending_bot.pop(key, None)
+            self._pending_bot_deletes.add(key)
+            changed = True
+        if changed:
+            self._schedule_flush()
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        """קורא מפתחות שעודכנו ב-worker אחר (לכל היותר פעם ב-refresh_interval)."""
+        now = time.monotonic()
+        if now - self._bot_checked < self.refresh_interval:
+            return
+        self._bot_checked = now
+        try:
+            rows, seen = await get_ptb_bot_data(self._bot_version)
+        except Exception as e:
+            logger.error("Failed to refresh bot_data: %s", e)
+            return
+        self._bot_version = max(self._bot_version, seen)
+        for key, data in rows:
+            digest = _digest(data) if data is not None else None
+            if digest == self._bot_hashes.get(key) or key in self._pending_bot:
+                continue
+            # שינוי מקומי שעוד לא הגיע ל-update_bot_data – לא דורסים אותו
+            if key in bot_data and self._bot_hashes.get(key) != _digest(_dumps(bot_data[key])):
+                continue
+            if data is None:
+                # נמחק ב-worker אחר
+                bot_data.pop(key, None)
+                self._bot_hashes.pop(key, None)
+                continue
+            try:
+                bot_data[key] = pickle.loads(data)
+            except Exception as e:
+                logger.error("Failed to unpickle bot_data[%s]: %s", key, e)
+                continue
+            self._bot_hashes[key] = digest
+
+    # ---------- user_data ----------
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        # נטען לכל משתמש בנפרד ב-refresh_user_data
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        now = time.monotonic()
+        if now - self._user_checked.get(user_id, 0.0) < self.refresh_interval:
+            return
+        if user_id in self._pending_users:
+            return
+        known = self._user_hashes.get(user_id)
+        # שינוי מקומי שעוד לא הגיע ל-update_user_data – לא דורסים אותו
+        if known is not None and known != _digest(_dumps(user_data)):
+            return
+        since = self._user_versions.get(user_id, 0)
+        try:
+            changed, data, seen = await get_ptb_user_data(user_id, since)
+        except Exception as e:
+            logger.error("Failed to load user_data for %s: %s", user_id, e)
+            return
+        self._user_checked[user_id] = now
+        self._user_versions[user_id] = max(since, seen)
+        if not changed:
+            if known is None:
+                self._user_hashes[user_id] = _digest(_dumps(user_data))
+            return
+        if data is None:
+            # נמחק ב-worker אחר
+            user_data.clear()
+            self._user_hashes[user_id] = _digest(_dumps(user_data))
+            return
+        if _digest(data) == known:
+            return
+        try:
+            loaded = pickle.loads(data)
+        except Exception as e:
+            logger.error("Failed to unpickle user_data for %s: %s", user_id, e)
+            return
+        user_data.clear()
+        user_data.update(loaded)
+        self._user_hashes[user_id] = _digest(data)
+        self._stats["user_loads"] += 1
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        known = self._user_hashes.get(user_id)
+        if known is None and not data:
+            # לא נטען מה-DB (למשל הקריאה נכשלה) – לא דורסים שורה קיימת בריק
+            return
+        dumped = _dumps(data)
+        digest = _digest(dumped)
+        if digest == known:
+            self._stats["skipped_clean"] += 1
+            return
+        self._user_hashes[user_id] = digest
+        self._pending_users[user_id] = dumped
+        self._pending_user_deletes.discard(user_id)
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending_users.pop(user_id, None)
+        self._user_hashes.pop(user_id, None)
+        self._user_versions.pop(user_id, None)
+        self._user_checked.pop(user_id, None)
+        self._pending_user_deletes.add(user_id)
+        self._schedule_flush()
+
+    # ---------- flush ----------
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        try:
+            await self._write_pending()
+        except Exception as e:
+            logger.error("Failed to flush persistence: %s", e)
+
+    async def _write_pending(self) -> None:
+        async with self._flush_lock:
+            users, self._pending_users = self._pending_users, {}
+            user_deletes, self._pending_user_deletes = self._pending_user_deletes, set()
+            bot, self._pending_bot = self._pending_bot, {}
+            bot_deletes, self._pending_bot_deletes = self._pending_bot_deletes, set()
+            if not (users or user_deletes or bot or bot_deletes):
+                return
+            try:
+                # ה-version לא מתקדם כאן: worker אחר עם txid קטן משלנו עוד
+                # יכול לעשות commit אחרינו. הקריאה הבאה תחזיר גם את השורות
+                # שלנו, וה-hash יזהה שאין בהן שינוי
+                await save_ptb_user_data(users)
+                await delete_ptb_user_data(sorted(user_deletes))
+                await save_ptb_bot_data(bot)
+                await delete_ptb_bot_data(sorted(bot_deletes))
+            except Exception:
+                # מחזירים לתור – ייכתב ב-flush הבא (אלא אם כבר יש ערך חדש יותר)
+                for user_id, dumped in users.items():
+                    self._pending_users.setdefault(user_id, dumped)
+                self._pending_user_deletes |= user_deletes - set(self._pending_users)
+                for key, dumped in bot.items():
+                    self._pending_bot.setdefault(key, dumped)
+                self._pending_bot_deletes |= bot_deletes - set(self._pending_bot)
+                raise
+            self._stats["flushes"] += 1
+            self._stats["user_writes"] += len(users)
+            self._stats["bot_key_writes"] += len(bot)
+
+    async def flush(self) -> None:
+        """נקרא ב-shutdown של PTB – כותב כל מה שממתין, בלי לחכות ל-delay."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        try:
+            await self._write_pending()
+        except Exception as e:
+            logger.error("Failed to flush persistence on shutdown: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        stats["pending_users"] = len(self._pending_users)
+        stats["pending_bot_keys"] = len(self._pending_bot)
+        stats["users_tracked"] = len(self._user_hashes)
+        return stats
+
+    # ---------- לא בשימוש: chat_data / callback_data / conversations ----------
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def get_callback_data(self) -> Optional[Tuple[Any, Any]]:
+        return None
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def get_conversations(self, name: str) -> Dict[Any, Any]:
+        return {}
+
+    async def update_conversation(self, name: str, key: Any, new_state: Optional[object]) -> None:
+        pass
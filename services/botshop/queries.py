@@ -0,0 +1,702 @@
+# queries.py
+"""
+SQL משותף ל-db.py (psycopg2, סינכרוני) ול-db_async.py (psycopg 3, אסינכרוני).
+שני הדרייברים משתמשים ב-placeholders מסוג %s, כך שכל שאילתה נכתבת פעם אחת.
+ה-DDL נמצא ב-migrations.py.
+"""
+
+# =========================
+# leaderboards – backfill
+# =========================
+
+# בונים מחדש את טבלאות הסיכום מ-referrals / rewards.
+# רצים בטרנזקציה אחת עם נעילה על טבלת המקור כדי שלא יתפספסו כתיבות באמצע.
+BACKFILL_REFERRAL_TOTALS = [
+    "LOCK TABLE referrals IN SHARE ROW EXCLUSIVE MODE;",
+    "TRUNCATE referral_totals;",
+    """
+    INSERT INTO referral_totals (referrer_id, total_referrals, total_points)
+    SELECT referrer_id, COUNT(*), COALESCE(SUM(points), 0)
+    FROM referrals
+    GROUP BY referrer_id;
+    """,
+]
+
+BACKFILL_REWARD_TOTALS = [
+    "LOCK TABLE rewards IN SHARE ROW EXCLUSIVE MODE;",
+    "TRUNCATE reward_totals;",
+    """
+    INSERT INTO reward_totals (user_id, reward_type, total_points)
+    SELECT user_id, reward_type, COALESCE(SUM(points), 0)
+    FROM rewards
+    GROUP BY user_id, reward_type;
+    """,
+]
+
+BACKFILL_LEADERBOARDS = BACKFILL_REFERRAL_TOTALS + BACKFILL_REWARD_TOTALS
+
+
+# =========================
+# schema
+# =========================
+
+SCHEMA_VERSION = "SELECT COALESCE(MAX(version), 0) AS version FROM schema_migrations;"
+
+
+# =========================
+# replica
+# =========================
+
+# lag של replica בשניות: 0 כשכל ה-WAL שהתקבל כבר הוחל (גם כשה-primary
+# שקט ואין טרנזקציות חדשות), 0 גם כשזה בכלל לא standby.
+REPLICA_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag;
+"""
+
+
+# =========================
+# payments
+# =========================
+
+# כל כתיבה ל-payments מעדכנת גם את payments_monthly (רולאפ חודשי לפי אמצעי
+# תשלום וסטטוס) באותה שאילתה. החודש נחתך לפי UTC; pay_method ריק = NULL.
+LOG_PAYMENT = """
+    WITH ins AS (
+        INSERT INTO payments (user_id, username, pay_method, status, created_at, updated_at)
+        VALUES (%s, %s, %s, 'pending', NOW(), NOW())
+        RETURNING pay_method, status, created_at
+    )
+    INSERT INTO payments_monthly (month, pay_method, status, count)
+    SELECT date_trunc('month', created_at AT TIME ZONE 'UTC')::date,
+           COALESCE(pay_method, ''),
+           status,
+           1
+    FROM ins
+    ON CONFLICT (month, pay_method, status) DO UPDATE
+      SET count = payments_monthly.count + 1;
+"""
+
+# התשלום האחרון מחופש קודם ב-3 החודשים האחרונים (partition pruning);
+# רק אם אין שם תשלום – הענף השני סורק את כל ה-partitions.
+UPDATE_PAYMENT_STATUS = """
+    WITH latest AS (
+        (SELECT id, created_at
+         FROM payments
+         WHERE user_id = %(user_id)s
+           AND created_at >= NOW() - INTERVAL '3 months'
+         ORDER BY created_at DESC
+         LIMIT 1)
+        UNION ALL
+        (SELECT id, created_at
+         FROM payments
+         WHERE user_id = %(user_id)s
+         ORDER BY created_at DESC
+         LIMIT 1)
+        LIMIT 1
+    ),
+    target AS (
+        SELECT p.id, p.created_at, p.status AS old_status
+        FROM payments p
+        JOIN latest l ON p.id = l.id AND p.created_at = l.created_at
+        FOR UPDATE OF p
+    ),
+    upd AS (
+        UPDATE payments p
+        SET status = %(status)s,
+            reason = %(reason)s,
+            updated_at = NOW()
+        FROM target
+        WHERE p.id = target.id
+          AND p.created_at = target.created_at
+        RETURNING target.old_status, p.status, p.pay_method, p.created_at
+    ),
+    deltas AS (
+        SELECT created_at, pay_method, old_status AS status, -1 AS delta
+        FROM upd
+        WHERE old_status <> status
+        UNION ALL
+        SELECT created_at, pay_method, status, 1 AS delta
+        FROM upd
+        WHERE old_status <> status
+    )
+    INSERT INTO payments_monthly (month, pay_method, status, count)
+    SELECT date_trunc('month', created_at AT TIME ZONE 'UTC')::date,
+           COALESCE(pay_method, ''),
+           status,
+           delta
+    FROM deltas
+    ON CONFLICT (month, pay_method, status) DO UPDATE
+      SET count = payments_monthly.count + EXCLUDED.count;
+"""
+
+
+# =========================
+# pending_payments / pending_rejects
+# =========================
+
+SAVE_PENDING_PAYMENT = """
+    INSERT INTO pending_payments (user_id, file_id, pay_method, username, chat_id, created_at)
+    VALUES (%s, %s, %s, %s, %s, NOW())
+    ON CONFLICT (user_id) DO UPDATE
+      SET file_id = EXCLUDED.file_id,
+          pay_method = EXCLUDED.pay_method,
+          username = EXCLUDED.username,
+          chat_id = EXCLUDED.chat_id,
+          created_at = NOW();
+"""
+
+GET_PENDING_PAYMENT = """
+    SELECT file_id, pay_method, username, chat_id
+    FROM pending_payments
+    WHERE user_id = %s;
+"""
+
+SET_PENDING_REJECT = """
+    INSERT INTO pending_rejects (admin_id, target_id, created_at)
+    VALUES (%s, %s, NOW())
+    ON CONFLICT (admin_id) DO UPDATE
+      SET target_id = EXCLUDED.target_id,
+          created_at = NOW();
+"""
+
+# שליפה ומחיקה באותה שאילתה – רק worker אחד מקבל את הסיבה של האדמין
+POP_PENDING_REJECT = """
+    DELETE FROM pending_rejects
+    WHERE admin_id = %s
+    RETURNING target_id;
+"""
+
+
+# =========================
+# users / referrals
+# =========================
+
+STORE_USER = """
+    INSERT INTO users (id, username, first_seen_at)
+    VALUES (%s, %s, NOW())
+    ON CONFLICT (id) DO UPDATE
+      SET username = EXCLUDED.username;
+"""
+
+# ההפניה וה-referral_totals מתעדכנים באותה שאילתה (ולכן באותה טרנזקציה);
+# אם ההפניה כבר קיימת (ON CONFLICT) – הסיכום לא משתנה.
+ADD_REFERRAL = """
+    WITH ins AS (
+        INSERT INTO referrals (referrer_id, referred_id, source, points)
+        VALUES (%s, %s, %s, 1)
+        ON CONFLICT DO NOTHING
+        RETURNING referrer_id, points
+    )
+    INSERT INTO referral_totals (referrer_id, total_referrals, total_points, updated_at)
+    SELECT referrer_id, 1, points, NOW()
+    FROM ins
+    ON CONFLICT (referrer_id) DO UPDATE
+      SET total_referrals = referral_totals.total_referrals + 1,
+          total_points = referral_totals.total_points + EXCLUDED.total_points,
+          updated_at = NOW();
+"""
+
+GET_TOP_REFERRERS = """
+    SELECT t.referrer_id,
+           u.username,
+           t.total_referrals,
+           t.total_points
+    FROM referral_totals t
+    LEFT JOIN users u ON u.id = t.referrer_id
+    ORDER BY t.total_points DESC, t.total_referrals DESC
+    LIMIT %s;
+"""
+
+
+# =========================
+# דוחות תשלומים
+# =========================
+
+# החודש הנוכחי – חישוב חי על טווח חצי-פתוח [start, end), שמשתמש באינדקס על created_at
+GET_MONTHLY_PAYMENTS_LIVE = """
+    SELECT pay_method,
+           status,
+           COUNT(*) AS count
+    FROM payments
+    WHERE created_at >= %s
+      AND created_at < %s
+    GROUP BY pay_method, status
+    ORDER BY pay_method, status;
+"""
+
+# חודשים שנסגרו – מהרולאפ
+GET_MONTHLY_PAYMENTS_ROLLUP = """
+    SELECT NULLIF(pay_method, '') AS pay_method,
+           status,
+           count
+    FROM payments_monthly
+    WHERE month = %s
+      AND count > 0
+    ORDER BY pay_method, status;
+"""
+
+BACKFILL_PAYMENTS_MONTHLY = [
+    "LOCK TABLE payments IN SHARE ROW EXCLUSIVE MODE;",
+    "TRUNCATE payments_monthly;",
+    """
+    INSERT INTO payments_monthly (month, pay_method, status, count)
+    SELECT date_trunc('month', created_at AT TIME ZONE 'UTC')::date,
+           COALESCE(pay_method, ''),
+           status,
+           COUNT(*)
+    FROM payments
+    GROUP BY 1, 2, 3;
+    """,
+]
+
+# מתוך payments_monthly – שורה לכל חודש במקום סריקת כל ה-partitions
+GET_APPROVAL_STATS = """
+    SELECT
+      COALESCE(SUM(count) FILTER (WHERE status = 'pending'), 0)::bigint AS pending,
+      COALESCE(SUM(count) FILTER (WHERE status = 'approved'), 0)::bigint AS approved,
+      COALESCE(SUM(count) FILTER (WHERE status = 'rejected'), 0)::bigint AS rejected,
+      COALESCE(SUM(count), 0)::bigint AS total
+    FROM payments_monthly;
+"""
+
+
+# =========================
+# rewards / נקודות
+# =========================
+
+CREATE_REWARD = """
+    WITH ins AS (
+        INSERT INTO rewards (user_id, reward_type, reason, points, status, created_at, updated_at)
+        VALUES (%s, %s, %s, %s, 'pending', NOW(), NOW())
+        RETURNING user_id, reward_type, points
+    )
+    INSERT INTO reward_totals (user_id, reward_type, total_points, updated_at)
+    SELECT user_id, reward_type, points, NOW()
+    FROM ins
+    ON CONFLICT (user_id, reward_type) DO UPDATE
+      SET total_points = reward_totals.total_points + EXCLUDED.total_points,
+          updated_at = NOW();
+"""
+
+# מתוך reward_totals – לא נוגע ב-partitions של rewards
+GET_SHARE_POINTS = """
+    SELECT COALESCE(
+        (SELECT total_points
+         FROM reward_totals
+         WHERE user_id = %s
+           AND reward_type = 'SHARE_POINTS'),
+        0
+    ) AS pts;
+"""
+
+GET_TOP_SHARERS = """
+    SELECT t.user_id,
+           u.username,
+           t.total_points
+    FROM reward_totals t
+    LEFT JOIN users u ON u.id = t.user_id
+    WHERE t.reward_type = 'SHARE_POINTS'
+    ORDER BY t.total_points DESC
+    LIMIT %s;
+"""
+
+
+# =========================
+# rewards – הנפקה מרוכזת (airdrop / בונוס)
+# =========================
+
+# השורות נטענות ב-COPY לטבלה זמנית, ומשם נכנסות ל-rewards ול-reward_totals
+# בשתי שאילתות – הכל בטרנזקציה אחת.
+CREATE_BULK_REWARD_STAGING = """
+    CREATE TEMP TABLE bulk_reward_rows (
+        user_id BIGINT NOT NULL,
+        points INT NOT NULL
+    ) ON COMMIT DROP;
+"""
+
+COPY_BULK_REWARD_ROWS = "COPY bulk_reward_rows (user_id, points) FROM STDIN"
+
+INSERT_BULK_REWARDS = """
+    INSERT INTO rewards (user_id, reward_type, reason, points, status, created_at, updated_at)
+    SELECT user_id, %s, %s, points, 'pending', NOW(), NOW()
+    FROM bulk_reward_rows;
+"""
+
+UPSERT_BULK_REWARD_TOTALS = """
+    INSERT INTO reward_totals (user_id, reward_type, total_points, updated_at)
+    SELECT user_id, %s, SUM(points), NOW()
+    FROM bulk_reward_rows
+    GROUP BY user_id
+    ON CONFLICT (user_id, reward_type) DO UPDATE
+      SET total_points = reward_totals.total_points + EXCLUDED.total_points,
+          updated_at = NOW();
+"""
+
+# יעדים לקמפיין
+GET_APPROVED_USER_IDS = """
+    SELECT DISTINCT user_id
+    FROM payments
+    WHERE status = 'approved';
+"""
+
+IS_USER_PAID = """
+    SELECT EXISTS (
+        SELECT 1
+        FROM payments
+        WHERE user_id = %s
+          AND status = 'approved'
+    ) AS paid;
+"""
+
+GET_TOP_SHARER_IDS = """
+    SELECT user_id
+    FROM reward_totals
+    WHERE reward_type = 'SHARE_POINTS'
+    ORDER BY total_points DESC
+    LIMIT %s;
+"""
+
+
+# =========================
+# promoters – בנק אישי למפיצים
+# =========================
+
+SET_PROMOTER_BANK = """
+    INSERT INTO promoters (user_id, bank_details, created_at)
+    VALUES (%s, %s, NOW())
+    ON CONFLICT (user_id) DO UPDATE
+      SET bank_details = EXCLUDED.bank_details;
+"""
+
+GET_PROMOTER_BANK = """
+    SELECT bank_details
+    FROM promoters
+    WHERE user_id = %s;
+"""
+
+
+# =========================
+# פרופיל משתמש – /my_panel ואישור תשלום
+# =========================
+
+# כל מה שהפאנל צריך בשאילתה אחת. התשלום האחרון מחופש קודם
+# ב-3 החודשים האחרונים (כמו ב-UPDATE_PAYMENT_STATUS).
+GET_USER_PROFILE = """
+    SELECT
+      COALESCE(
+        (SELECT total_points
+         FROM reward_totals
+         WHERE user_id = %(user_id)s
+           AND reward_type = 'SHARE_POINTS'),
+        0
+      ) AS share_points,
+      COALESCE(
+        (SELECT total_referrals
+         FROM referral_totals
+         WHERE referrer_id = %(user_id)s),
+        0
+      ) AS referral_count,
+      (SELECT bank_details
+       FROM promoters
+       WHERE user_id = %(user_id)s) AS bank_details,
+      (SELECT status
+       FROM (
+         (SELECT status
+          FROM payments
+          WHERE user_id = %(user_id)s
+            AND created_at >= NOW() - INTERVAL '3 months'
+          ORDER BY created_at DESC
+          LIMIT 1)
+         UNION ALL
+         (SELECT status
+          FROM payments
+          WHERE user_id = %(user_id)s
+          ORDER BY created_at DESC
+          LIMIT 1)
+         LIMIT 1
+       ) latest) AS payment_status,
+      EXISTS (
+        SELECT 1
+        FROM payments
+        WHERE user_id = %(user_id)s
+          AND status = 'approved'
+      ) AS paid;
+"""
+
+# =========================
+# media_cache – file_id של קבצים שהועלו
+# =========================
+
+GET_MEDIA_FILE_ID = """
+    SELECT file_id
+    FROM media_cache
+    WHERE key = %s;
+"""
+
+SET_MEDIA_FILE_ID = """
+    INSERT INTO media_cache (key, file_id, updated_at)
+    VALUES (%s, %s, NOW())
+    ON CONFLICT (key) DO UPDATE
+      SET file_id = EXCLUDED.file_id,
+          updated_at = NOW();
+"""
+
+DELETE_MEDIA_FILE_ID = """
+    DELETE FROM media_cache
+    WHERE key = %s;
+"""
+
+# =========================
+# metrics – counters
+# =========================
+
+INCREMENT_METRIC = """
+    INSERT INTO metrics (key, value, updated_at)
+    VALUES (%s, %s, NOW())
+    ON CONFLICT (key) DO UPDATE
+      SET value = metrics.value + EXCLUDED.value,
+          updated_at = NOW()
+    RETURNING value;
+"""
+
+GET_METRIC = """
+    SELECT value
+    FROM metrics
+    WHERE key = %s;
+"""
+
+# מוסיף כמה מונים בבת אחת (ה-flush של counters.MetricCounters).
+# המפתחות ממוינים מראש כדי שכמה workers ינעלו שורות באותו סדר.
+ADD_METRICS = """
+    INSERT INTO metrics (key, value, updated_at)
+    SELECT t.key, t.delta, NOW()
+    FROM unnest(%s::text[], %s::bigint[]) AS t(key, delta)
+    ON CONFLICT (key) DO UPDATE
+      SET value = metrics.value + EXCLUDED.value,
+          updated_at = NOW()
+    RETURNING key, value;
+"""
+
+GET_METRICS = """
+    SELECT key, value
+    FROM metrics
+    WHERE key = ANY(%s::text[]);
+"""
+
+# שומר טווח של מספרים סידוריים: מקדם את ה-high-water mark של <key>:serial_hwm
+# ב-size ומחזיר את הערך החדש. בפעם הראשונה מתחיל מהערך הנוכחי של המונה עצמו.
+RESERVE_METRIC_RANGE = """
+    INSERT INTO metrics (key, value, updated_at)
+    VALUES (
+        %(hwm_key)s,
+        COALESCE((SELECT value FROM metrics WHERE key = %(key)s), 0) + %(size)s,
+        NOW()
+    )
+    ON CONFLICT (key) DO UPDATE
+      SET value = metrics.value + %(size)s,
+          updated_at = NOW()
+    RETURNING value;
+"""
+
+
+# =========================
+# dedup של עדכוני טלגרם
+# =========================
+
+# שורה חוזרת = העדכון חדש; בלי שורה = כבר טופל (ב-worker הזה או באחר)
+CLAIM_UPDATE = """
+    INSERT INTO processed_updates (update_id)
+    VALUES (%s)
+    ON CONFLICT (update_id) DO NOTHING
+    RETURNING update_id;
+"""
+
+RELEASE_UPDATE = """
+    DELETE FROM processed_updates
+    WHERE update_id = %s;
+"""
+
+PURGE_PROCESSED_UPDATES = """
+    DELETE FROM processed_updates
+    WHERE received_at < NOW() - make_interval(secs => %s);
+"""
+
+# =========================
+# broadcasts – הודעה לכל המשתמשים
+# =========================
+
+BROADCAST_COLUMNS = """
+    id, text, status, created_by, admin_chat_id, progress_message_id,
+    last_user_id, total, sent, failed, blocked,
+    created_at, started_at, finished_at
+"""
+
+CREATE_BROADCAST = f"""
+    INSERT INTO broadcasts (text, created_by, admin_chat_id, total)
+    VALUES (%s, %s, %s, (SELECT COUNT(*) FROM users))
+    RETURNING {BROADCAST_COLUMNS};
+"""
+
+GET_BROADCAST = f"""
+    SELECT {BROADCAST_COLUMNS}
+    FROM broadcasts
+    WHERE id = %s;
+"""
+
+LIST_BROADCASTS = f"""
+    SELECT {BROADCAST_COLUMNS}
+    FROM broadcasts
+    ORDER BY id DESC
+    LIMIT %s;
+"""
+
+GET_UNFINISHED_BROADCASTS = """
+    SELECT id
+    FROM broadcasts
+    WHERE status IN ('pending', 'running')
+    ORDER BY id;
+"""
+
+# done / cancelled הם סופיים – לא חוזרים מהם
+SET_BROADCAST_STATUS = """
+    UPDATE broadcasts
+    SET status = %(status)s,
+        started_at = CASE WHEN %(status)s = 'running'
+                          THEN COALESCE(started_at, NOW()) ELSE started_at END,
+        finished_at = CASE WHEN %(status)s IN ('done', 'cancelled')
+                           THEN NOW() ELSE finished_at END
+    WHERE id = %(broadcast_id)s
+      AND status NOT IN ('done', 'cancelled')
+    RETURNING id;
+"""
+
+SET_BROADCAST_PROGRESS_MESSAGE = """
+    UPDATE broadcasts
+    SET progress_message_id = %s
+    WHERE id = %s;
+"""
+
+# keyset על users.id; מי שכבר יש לו שורה ב-broadcast_deliveries מדולג
+GET_BROADCAST_RECIPIENTS = """
+    SELECT u.id
+    FROM users u
+    WHERE u.id > %(after_id)s
+      AND NOT EXISTS (
+          SELECT 1
+          FROM broadcast_deliveries d
+          WHERE d.broadcast_id = %(broadcast_id)s
+            AND d.user_id = u.id
+      )
+    ORDER BY u.id
+    LIMIT %(limit)s;
+"""
+
+# תוצאות של אצווה + קידום ה-cursor והמונים באותה טרנזקציה
+RECORD_BROADCAST_BATCH = """
+    WITH ins AS (
+        INSERT INTO broadcast_deliveries (broadcast_id, user_id, status, error)
+        SELECT %(broadcast_id)s, t.user_id, t.status, t.error
+        FROM unnest(%(user_ids)s::bigint[], %(statuses)s::text[], %(errors)s::text[])
+             AS t(user_id, status, error)
+        ON CONFLICT (broadcast_id, user_id) DO NOTHING
+        RETURNING status
+    )
+    UPDATE broadcasts
+    SET last_user_id = GREATEST(last_user_id, %(last_user_id)s),
+        sent = sent + (SELECT COUNT(*) FROM ins WHERE status = 'sent'),
+        failed = failed + (SELECT COUNT(*) FROM ins WHERE status = 'failed'),
+        blocked = blocked + (SELECT COUNT(*) FROM ins WHERE status = 'blocked')
+    WHERE id = %(broadcast_id)s
+    RETURNING status, total, sent, failed, blocked;
+"""
+
+# =========================
+# PTB persistence – user_data / bot_data
+# =========================
+
+# version = txid_current() של הכותב; הקורא מקבל גם את ה-xmin של ה-snapshot
+# שלו – כל טרנזקציה עם txid קטן ממנו כבר הסתיימה, אז הקריאה הבאה
+# (version >= xmin) לא מפספסת כתיבה שעשתה commit אחרי הקריאה הזו.
+# שאילתה אחת = snapshot אחד, ותמיד שורה אחת לפחות (גם כשאין שינויים).
+GET_PTB_USER_DATA = """
+    WITH s AS (SELECT txid_snapshot_xmin(txid_current_snapshot()) AS seen)
+    SELECT s.seen, d.user_id IS NOT NULL AS changed, d.data
+    FROM s
+    LEFT JOIN ptb_user_data d
+      ON d.user_id = %s
+     AND d.version >= %s;
+"""
+
+SAVE_PTB_USER_DATA = """
+    INSERT INTO ptb_user_data (user_id, data, version, updated_at)
+    SELECT t.user_id, t.data, txid_current(), NOW()
+    FROM unnest(%s::bigint[], %s::bytea[]) AS t(user_id, data)
+    ON CONFLICT (user_id) DO UPDATE
+      SET data = EXCLUDED.data,
+          version = EXCLUDED.version,
+          updated_at = NOW();
+"""
+
+# מחיקה = tombstone (data = NULL), כדי ש-workers אחרים יראו אותה
+DELETE_PTB_USER_DATA = """
+    UPDATE ptb_user_data
+    SET data = NULL,
+        version = txid_current(),
+        updated_at = NOW()
+    WHERE user_id = ANY(%s::bigint[]);
+"""
+
+GET_PTB_BOT_DATA = """
+    WITH s AS (SELECT txid_snapshot_xmin(txid_current_snapshot()) AS seen)
+    SELECT s.seen, d.key, d.data
+    FROM s
+    LEFT JOIN ptb_bot_data d
+      ON d.version >= %s;
+"""
+
+SAVE_PTB_BOT_DATA = """
+    INSERT INTO ptb_bot_data (key, data, version, updated_at)
+    SELECT t.key, t.data, txid_current(), NOW()
+    FROM unnest(%s::text[], %s::bytea[]) AS t(key, data)
+    ON CONFLICT (key) DO UPDATE
+      SET data = EXCLUDED.data,
+          version = EXCLUDED.version,
+          updated_at = NOW();
+"""
+
+DELETE_PTB_BOT_DATA = """
+    UPDATE ptb_bot_data
+    SET data = NULL,
+        version = txid_current(),
+        updated_at = NOW()
+    WHERE key = ANY(%s::text[]);
+"""
+
+# =========================
+# exports – ייצוא מלא לאדמין
+# =========================
+
+# העמודות בכל ייצוא (וגם כותרת ה-CSV). הדפדוף הוא keyset על id:
+# הורדה שנקטעה ממשיכה עם after_id = ה-id האחרון שהתקבל.
+EXPORT_COLUMNS = {
+    "payments": ["id", "user_id", "username", "pay_method", "status", "reason", "created_at", "updated_at"],
+    "referrals": ["id", "referrer_id", "referred_id", "source", "points", "created_at"],
+    "rewards": ["id", "user_id", "reward_type", "reason", "points", "status", "tx_hash", "created_at", "updated_at"],
+    "users": ["id", "username", "first_seen_at"],
+}
+
+# LIMIT NULL = בלי הגבלה
+EXPORT_QUERIES = {
+    table: f"""
+    SELECT {", ".join(columns)}
+    FROM {table}
+    WHERE id > %(after_id)s
+    ORDER BY id
+    LIMIT %(limit)s;
+"""
+    for table, columns in EXPORT_COLUMNS.items()
+}
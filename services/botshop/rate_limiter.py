@@ -0,0 +1,285 @@
+# rate_limiter.py
+"""
+הגבלת קצב לשליחות לטלגרם (rate limiter של PTB, מחובר ב-Application.builder()).
+
+- token bucket גלובלי (TELEGRAM_GLOBAL_RATE הודעות בשנייה) ו-bucket לכל צ'אט:
+  TELEGRAM_CHAT_RATE לצ'אט פרטי, TELEGRAM_GROUP_RATE_PER_MIN לקבוצה / ערוץ.
+- עדיפויות: כשה-bucket הגלובלי ריק, הבקשות ממתינות בתור לפי עדיפות –
+  הודעות אדמין / תשלומים (HIGH_PRIORITY) לפני תשובות רגילות, ותזכורות /
+  דירוגים (LOW_PRIORITY) אחרונות. שימוש:
+      await bot.send_message(..., rate_limit_args=HIGH_PRIORITY)
+- RetryAfter (429) מטלגרם: כל השליחות נעצרות לזמן שטלגרם ביקש, והבקשה
+  נשלחת שוב (עד TELEGRAM_MAX_RETRIES פעמים).
+- בקשות בלי chat_id (getMe, answerCallbackQuery וכו') לא מוגבלות.
+- מדדים: stats(), זמני המתנה בסדרה telegram_send של telemetry, וזמן /
+  שגיאות של כל קריאה ל-Bot API (telegram_api, telegram_api_errors) לפי method.
+"""
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_GLOBAL_RATE = float(os.environ.get("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.environ.get("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = int(os.environ.get("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_GROUP_RATE_PER_MIN = float(os.environ.get("TELEGRAM_GROUP_RATE_PER_MIN", "20"))
+TELEGRAM_MAX_RETRIES = int(os.environ.get("TELEGRAM_MAX_RETRIES", "3"))
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+
+# ערכים מוכנים ל-rate_limit_args
+HIGH_PRIORITY: Dict[str, Any] = {"priority": PRIORITY_HIGH}
+LOW_PRIORITY: Dict[str, Any] = {"priority": PRIORITY_LOW}
+
+_Result = Union[bool, Dict[str, Any], List[Dict[str, Any]]]
+
+# מעל כמה buckets של צ'אטים מנקים את אלה שכבר התמלאו (צ'אטים שקטים)
+_CHAT_BUCKETS_PRUNE_AT = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """כמה שניות עד שיהיה token פנוי (0 = יש עכשיו)."""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    def reserve(self) -> float:
+        """
+        לוקח token גם אם אין (היתרה יורדת למינוס) ומחזיר כמה לחכות עד
+        שהוא תקף – כך בקשות לאותו צ'אט מקבלות תורות לפי הסדר.
+        """
+        self.take()
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+def _seconds(value: Union[int, float, timedelta]) -> float:
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class PriorityRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = TELEGRAM_CHAT_RATE,
+        chat_burst: int = TELEGRAM_CHAT_BURST,
+        group_rate_per_min: float = TELEGRAM_GROUP_RATE_PER_MIN,
+        max_retries: int = TELEGRAM_MAX_RETRIES,
+    ) -> None:
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate_per_min / 60
+        self.max_retries = max_retries
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        # (priority, seq, future) – ממתינים ל-token גלובלי
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        # עד מתי כל השליחות עצורות אחרי RetryAfter (time.monotonic)
+        self._paused_until = 0.0
+        self._stats: Dict[str, int] = {
+            "sent": 0,
+            "unlimited": 0,
+            "throttled": 0,
+            "retry_after": 0,
+            "failed_retries": 0,
+        }
+        self._max_wait = 0.0
+
+    # ---------- lifecycle ----------
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            await asyncio.gather(self._pump_task, return_exceptions=True)
+            self._pump_task = None
+        for _, _, future in self._waiting:
+            if not future.done():
+                future.cancel()
+        self._waiting = []
+
+    # ---------- buckets ----------
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _CHAT_BUCKETS_PRUNE_AT:
+                self._chats = {
+                    key: b for key, b in self._chats.items() if not b.is_full()
+                }
+            # מזהה שלילי / מחרוזת (@channel) = קבוצה או ערוץ
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire_global(self, priority: int) -> None:
+        if (
+            not self._waiting
+            and time.monotonic() >= self._paused_until
+            and self._global.wait_time() == 0
+        ):
+            self._global.take()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self) -> None:
+        """משחרר ממתינים אחד-אחד לפי עדיפות, בקצב של ה-bucket הגלובלי."""
+        while self._waiting:
+            delay = max(
+                self._paused_until - time.monotonic(), self._global.wait_time()
+            )
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():  # הבקשה בוטלה בזמן ההמתנה
+                continue
+            self._global.take()
+            future.set_result(None)
+
+    # ---------- PTB ----------
+
+    async def _call(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, _Result]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+    ) -> _Result:
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception as e:
+            telemetry.increment(
+                "telegram_api_errors", {"method": endpoint, "error": type(e).__name__}
+            )
+            raise
+        finally:
+            telemetry.observe("telegram_api", endpoint, time.perf_counter() - started)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, _Result]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> _Result:
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            self._stats["unlimited"] += 1
+            return await self._call(callback, args, kwargs, endpoint)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+
+        options = rate_limit_args or {}
+        priority = options.get("priority", PRIORITY_NORMAL)
+        max_retries = options.get("max_retries", self.max_retries)
+        label = PRIORITY_NAMES.get(priority, str(priority))
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            chat_wait = self._chat_bucket(chat_id).reserve()
+            if chat_wait > 0:
+                await asyncio.sleep(chat_wait)
+            await self._acquire_global(priority)
+            waited = time.perf_counter() - started
+            telemetry.observe("telegram_send", f"wait_{label}", waited)
+            if waited > 0.001:
+                self._stats["throttled"] += 1
+            if waited > self._max_wait:
+                self._max_wait = waited
+
+            try:
+                result = await self._call(callback, args, kwargs, endpoint)
+                self._stats["sent"] += 1
+                return result
+            except RetryAfter as e:
+                self._stats["retry_after"] += 1
+                pause = _seconds(e.retry_after) + 0.1
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                if attempt == max_retries:
+                    self._stats["failed_retries"] += 1
+                    logger.error(
+                        "Telegram rate limit on %s (chat %s) after %s retries",
+                        endpoint,
+                        chat_id,
+                        max_retries,
+                    )
+                    raise
+                logger.warning(
+                    "Telegram rate limit on %s (chat %s), retrying in %.1fs",
+                    endpoint,
+                    chat_id,
+                    pause,
+                )
+                attempt += 1
+                await asyncio.sleep(pause)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        waiting: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiting:
+            if not future.done():
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                waiting[name] = waiting.get(name, 0) + 1
+        stats["waiting"] = waiting
+        stats["chats_tracked"] = len(self._chats)
+        stats["paused_for"] = round(max(0.0, self._paused_until - time.monotonic()), 3)
+        stats["max_wait"] = round(self._max_wait, 3)
+        stats["global_rate"] = self.global_rate
+        return stats
@@ -0,0 +1,345 @@
+# telemetry.py
+"""
+מדידת זמנים בזיכרון: היסטוגרמות לפי סדרה (series) ותווית (label).
+
+סדרות של שכבת ה-DB (התווית = שם הפונקציה ב-db.py / db_async.py):
+- db_call      – כל הקריאה לפונקציה
+- db_pool_wait – המתנה לחיבור מה-pool
+- db_execute   – execute
+- db_fetch     – fetchone / fetchall / fetchmany
+
+span("name") מודד כל קטע קוד אחר (למשל שלבי /start) בסדרה span.
+שאילתה מעל DB_SLOW_QUERY_MS נרשמת ללוג; בחלק מהמקרים
+(DB_SLOW_QUERY_EXPLAIN_RATE) גם עם תוכנית ה-EXPLAIN שלה.
+
+בנוסף: handler (זמן כל handler של PTB), telegram_api (כל קריאה ל-Bot API),
+event_loop (lag), מונים (increment) ו-gauges. הכל מוצג בפורמט של
+Prometheus ב-render_prometheus() (/metrics).
+"""
+import os
+import time
+import random
+import bisect
+import asyncio
+import inspect
+import logging
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DB_SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", "200"))
+DB_SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get("DB_SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get("EVENT_LOOP_LAG_INTERVAL", "0.5"))
+
+# גבולות עליונים של ה-buckets, בשניות
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# כמה שאילתות איטיות אחרונות לשמור לתצוגה
+SLOW_QUERY_HISTORY = 50
+
+# שם הפונקציה של ה-DB שרצה עכשיו (נקבע ב-timed_db_call)
+current_db_call: ContextVar[str] = ContextVar("current_db_call", default="unlabelled")
+
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def _quantile(self, counts: List[int], count: int, q: float) -> float:
+        """גבול ה-bucket שבו נמצא האחוזון (הערכה כלפי מעלה)."""
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            count, total, peak = self.count, self.sum, self.max
+        cumulative: Dict[str, int] = {}
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            seen += bucket_count
+            cumulative[str(bound)] = seen
+        cumulative["+Inf"] = count
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "avg": round(total / count, 6) if count else 0.0,
+            "p50": self._quantile(counts, count, 0.50) if count else 0.0,
+            "p95": self._quantile(counts, count, 0.95) if count else 0.0,
+            "p99": self._quantile(counts, count, 0.99) if count else 0.0,
+            "max": round(peak, 6),
+            "buckets": cumulative,
+        }
+
+
+_histograms: Dict[Tuple[str, str], Histogram] = {}
+_histograms_lock = threading.Lock()
+# (name, ((label, value), ...)) -> value
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_counters_lock = threading.Lock()
+_gauges: Dict[str, Callable[[], float]] = {}
+_slow_queries: Deque[Dict[str, Any]] = deque(maxlen=SLOW_QUERY_HISTORY)
+_slow_query_count = 0
+
+
+def histogram(series: str, label: str) -> Histogram:
+    key = (series, label)
+    hist = _histograms.get(key)
+    if hist is None:
+        with _histograms_lock:
+            hist = _histograms.setdefault(key, Histogram())
+    return hist
+
+
+def observe(series: str, label: str, seconds: float) -> None:
+    histogram(series, label).observe(seconds)
+
+
+def snapshot() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """{series: {label: {count, sum, avg, p50, p95, p99, max, buckets}}}"""
+    with _histograms_lock:
+        items = list(_histograms.items())
+    result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for (series, label), hist in sorted(items):
+        result.setdefault(series, {})[label] = hist.snapshot()
+    return result
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """מודד קטע קוד (גם עם await בפנים) לסדרה span."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("span", name, time.perf_counter() - start)
+
+
+def increment(name: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+    key = (name, tuple(sorted(labels.items())) if labels else ())
+    with _counters_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def register_gauge(name: str, read: Callable[[], float]) -> None:
+    """gauge שנקרא רק בזמן ה-scrape (למשל עומק תור)."""
+    _gauges[name] = read
+
+
+def timed_handler(fn: Callable) -> Callable:
+    """עוטף handler של PTB: זמן בסדרה handler ומונה שגיאות לפי שם הפונקציה."""
+    label = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            increment("handler_errors", {"handler": label})
+            raise
+        finally:
+            observe("handler", label, time.perf_counter() - start)
+
+    return wrapper
+
+
+def timed_db_call(fn: Callable) -> Callable:
+    """
+    דקורטור לפונקציות של db.py / db_async.py: מודד את כל הקריאה (db_call)
+    וקובע את שם הפונקציה כתווית לכל מה שנמדד בתוכה.
+    """
+    label = fn.__name__
+
+    if inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            token = current_db_call.set(label)
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                observe("db_call", label, time.perf_counter() - start)
+                current_db_call.reset(token)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = current_db_call.set(label)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            observe("db_call", label, time.perf_counter() - start)
+            current_db_call.reset(token)
+
+    return wrapper
+
+
+# =========================
+# event loop lag
+# =========================
+
+async def monitor_event_loop(interval: float = EVENT_LOOP_LAG_INTERVAL) -> None:
+    """ישן interval שניות ומודד בכמה ההתעוררות איחרה – זה ה-lag של ה-loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        observe("event_loop", "lag", max(0.0, loop.time() - expected))
+
+
+# =========================
+# Prometheus
+# =========================
+
+# שם ה-label של כל סדרה ב-/metrics
+SERIES_LABELS = {
+    "db_call": "function",
+    "db_pool_wait": "function",
+    "db_execute": "function",
+    "db_fetch": "function",
+    "handler": "handler",
+    "telegram_api": "method",
+    "telegram_send": "priority",
+    "span": "name",
+    "webhook": "stage",
+    "event_loop": "kind",
+}
+
+METRICS_PREFIX = "botshop"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in pairs) + "}"
+
+
+def render_prometheus() -> str:
+    """כל ההיסטוגרמות, המונים וה-gauges בפורמט הטקסט של Prometheus."""
+    lines: List[str] = []
+
+    with _histograms_lock:
+        items = sorted(_histograms.items())
+    by_series: Dict[str, List[Tuple[str, Histogram]]] = {}
+    for (series, label), hist in items:
+        by_series.setdefault(series, []).append((label, hist))
+    for series, hists in by_series.items():
+        name = f"{METRICS_PREFIX}_{series}_seconds"
+        label_name = SERIES_LABELS.get(series, "label")
+        lines.append(f"# TYPE {name} histogram")
+        for label, hist in hists:
+            snap = hist.snapshot()
+            for bound, cumulative in snap["buckets"].items():
+                lines.append(
+                    f"{name}_bucket{_labels([(label_name, label), ('le', bound)])} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_labels([(label_name, label)])} {snap['sum']}")
+            lines.append(f"{name}_count{_labels([(label_name, label)])} {snap['count']}")
+
+    with _counters_lock:
+        counters = sorted(_counters.items())
+    typed: Set[str] = set()
+    for (counter, pairs), value in counters:
+        name = f"{METRICS_PREFIX}_{counter}_total"
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_labels(list(pairs))} {value}")
+
+    for gauge, read in sorted(_gauges.items()):
+        try:
+            value = read()
+        except Exception as e:
+            logger.warning("Failed to read gauge %s: %s", gauge, e)
+            continue
+        name = f"{METRICS_PREFIX}_{gauge}"
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+
+    lines.append("")
+    return "\n".join(lines)
+
+
+# =========================
+# שאילתות איטיות
+# =========================
+
+def is_slow(seconds: float) -> bool:
+    return seconds * 1000 >= DB_SLOW_QUERY_MS
+
+
+def should_explain(query: Any) -> bool:
+    """דגימה של שאילתות איטיות ל-EXPLAIN – רק DML/SELECT (לא DDL / COPY / LOCK)."""
+    if not isinstance(query, str):
+        return False
+    words = query.split(None, 1)
+    if not words or words[0].upper() not in _EXPLAINABLE:
+        return False
+    return random.random() < DB_SLOW_QUERY_EXPLAIN_RATE
+
+
+def record_slow_query(
+    label: str, seconds: float, query: Any, plan: Optional[str] = None
+) -> None:
+    global _slow_query_count
+    _slow_query_count += 1
+    text = " ".join(str(query).split())
+    _slow_queries.append(
+        {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "function": label,
+            "ms": round(seconds * 1000, 1),
+            "query": text,
+            "plan": plan,
+        }
+    )
+    if plan:
+        logger.warning(
+            "Slow query in %s (%.1f ms): %s\n%s", label, seconds * 1000, text, plan
+        )
+    else:
+        logger.warning("Slow query in %s (%.1f ms): %s", label, seconds * 1000, text)
+
+
+def slow_queries() -> Dict[str, Any]:
+    return {
+        "threshold_ms": DB_SLOW_QUERY_MS,
+        "explain_rate": DB_SLOW_QUERY_EXPLAIN_RATE,
+        "total": _slow_query_count,
+        "recent": list(_slow_queries),
+    }
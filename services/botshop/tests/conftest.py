@@ -0,0 +1,32 @@
+# conftest.py
+"""
+בדיקות יחידה ל-botshop: רצות בלי DB ובלי טלגרם.
+הרצה מתיקיית השירות: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telemetry  # noqa: E402
+
+
+@pytest.fixture
+def clean_telemetry():
+    """telemetry שומר מצב גלובלי – כל בדיקה מתחילה מאפס."""
+    saved = (
+        dict(telemetry._histograms),
+        dict(telemetry._counters),
+        dict(telemetry._gauges),
+    )
+    telemetry._histograms.clear()
+    telemetry._counters.clear()
+    telemetry._gauges.clear()
+    yield telemetry
+    for store, values in zip(
+        (telemetry._histograms, telemetry._counters, telemetry._gauges), saved
+    ):
+        store.clear()
+        store.update(values)
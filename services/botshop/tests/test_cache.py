@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+
+import cache
+from cache import MISSING, SnapshotCache, TTLCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", fake)
+    return fake
+
+
+# =========================
+# TTLCache
+# =========================
+
+def test_fill_stores_when_nothing_was_written():
+    c = TTLCache("t")
+    epoch = c.begin_read()
+    c.fill(1, "bank", epoch)
+    assert c.get(1) == "bank"
+
+
+def test_fill_after_invalidate_is_dropped():
+    c = TTLCache("t")
+    epoch = c.begin_read()
+    # כתיבה שהגיעה בזמן שהקריאה מה-DB עוד רצה
+    c.invalidate(1)
+    c.fill(1, "stale", epoch)
+    assert c.get(1) is MISSING
+
+
+def test_fill_after_set_keeps_written_value():
+    c = TTLCache("t")
+    epoch = c.begin_read()
+    c.set(1, "new")
+    c.fill(1, "old", epoch)
+    assert c.get(1) == "new"
+
+
+def test_fill_after_clear_is_dropped():
+    c = TTLCache("t")
+    epoch = c.begin_read()
+    c.clear()
+    c.fill(2, "stale", epoch)
+    assert c.get(2) is MISSING
+
+
+def test_none_is_a_cached_value():
+    c = TTLCache("t")
+    c.fill(1, None, c.begin_read())
+    assert c.get(1) is None
+
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache("t", ttl=10)
+    c.set(1, "x")
+    clock.now += 9
+    assert c.get(1) == "x"
+    clock.now += 2
+    assert c.get(1) is MISSING
+    assert c.stats()["expirations"] == 1
+
+
+def test_lru_eviction():
+    c = TTLCache("t", maxsize=2)
+    c.set(1, "a")
+    c.set(2, "b")
+    c.get(1)
+    c.set(3, "c")
+    assert c.get(2) is MISSING
+    assert c.get(1) == "a"
+    assert c.stats()["evictions"] == 1
+
+
+# =========================
+# SnapshotCache
+# =========================
+
+def _builder(*bodies):
+    calls = []
+
+    async def build() -> bytes:
+        calls.append(1)
+        return bodies[min(len(calls), len(bodies)) - 1]
+
+    return build, calls
+
+
+def test_snapshot_served_from_cache_within_ttl(clock):
+    snap = SnapshotCache("s", ttl=30)
+    build, calls = _builder(b"one")
+    first = asyncio.run(snap.get(build))
+    clock.now += 10
+    second = asyncio.run(snap.get(build))
+    assert second is first
+    assert len(calls) == 1
+
+
+def test_etag_kept_when_body_unchanged(clock):
+    snap = SnapshotCache("s", ttl=30)
+    build, calls = _builder(b"same", b"same")
+    first = asyncio.run(snap.get(build))
+    clock.now += 31
+    second = asyncio.run(snap.get(build))
+    assert len(calls) == 2
+    assert second.etag == first.etag
+    assert second.last_modified == first.last_modified
+
+
+def test_etag_changes_with_body(clock):
+    snap = SnapshotCache("s", ttl=30)
+    build, _ = _builder(b"one", b"two")
+    first = asyncio.run(snap.get(build))
+    clock.now += 31
+    second = asyncio.run(snap.get(build))
+    assert second.body == b"two"
+    assert second.etag != first.etag
+    assert second.etag.startswith('"') and second.etag.endswith('"')
+
+
+def test_mark_stale_waits_for_min_interval(clock):
+    snap = SnapshotCache("s", ttl=30, min_interval=5)
+    build, calls = _builder(b"one", b"two")
+    asyncio.run(snap.get(build))
+    snap.mark_stale()
+    clock.now += 1
+    assert asyncio.run(snap.get(build)).body == b"one"
+    clock.now += 5
+    assert asyncio.run(snap.get(build)).body == b"two"
+    assert len(calls) == 2
+
+
+def test_failed_build_serves_previous_snapshot(clock):
+    snap = SnapshotCache("s", ttl=30)
+    build, _ = _builder(b"one")
+    first = asyncio.run(snap.get(build))
+
+    async def broken() -> bytes:
+        raise RuntimeError("db down")
+
+    clock.now += 31
+    assert asyncio.run(snap.get(broken)) is first
+    assert snap.stats()["errors"] == 1
+
+
+def test_failed_first_build_raises():
+    snap = SnapshotCache("s", ttl=30)
+
+    async def broken() -> bytes:
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(snap.get(broken))
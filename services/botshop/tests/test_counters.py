@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+import counters
+from counters import MetricCounters
+
+
+class FakeMetricsDB:
+    def __init__(self) -> None:
+        self.values = {}
+        self.fail = False
+
+    async def add_metrics(self, deltas):
+        if self.fail:
+            raise RuntimeError("db down")
+        for key, delta in deltas.items():
+            self.values[key] = self.values.get(key, 0) + delta
+        return {key: self.values[key] for key in deltas}
+
+    async def get_metrics(self, keys):
+        return {key: self.values[key] for key in keys if key in self.values}
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeMetricsDB()
+    monkeypatch.setattr(counters, "add_metrics", db.add_metrics)
+    monkeypatch.setattr(counters, "get_metrics", db.get_metrics)
+    return db
+
+
+def test_failed_flush_requeues_deltas(fake_db):
+    async def run():
+        metrics = MetricCounters(flush_every=1000)
+        await metrics.incr("start_image", 3)
+        fake_db.fail = True
+        with pytest.raises(RuntimeError):
+            await metrics.flush()
+        # הדלתות חזרו ל-pending – הערך לא ירד
+        after_failure = await metrics.get("start_image")
+        pending = dict(metrics._pending)
+        await metrics.incr("start_image", 2)
+        fake_db.fail = False
+        await metrics.flush()
+        return after_failure, pending, await metrics.get("start_image")
+
+    after_failure, pending, final = asyncio.run(run())
+    assert after_failure == 3
+    assert pending == {"start_image": 3}
+    assert final == 5
+    assert fake_db.values == {"start_image": 5}
+
+
+def test_value_counts_snapshot_and_pending(fake_db):
+    fake_db.values["start_image"] = 10
+
+    async def run():
+        metrics = MetricCounters(flush_every=1000)
+        value = await metrics.incr("start_image")
+        return value, dict(fake_db.values)
+
+    value, stored = asyncio.run(run())
+    assert value == 11
+    # עדיין לא נכתב
+    assert stored == {"start_image": 10}
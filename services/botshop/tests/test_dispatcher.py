@@ -0,0 +1,140 @@
+import asyncio
+import random
+from datetime import datetime
+
+from telegram import Chat, Message, Update
+
+from dispatcher import ACCEPTED, CHAT_BUSY, QUEUE_FULL, STOPPING, UpdateDispatcher
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    return Update(update_id, message=Message(update_id, datetime.now(), Chat(chat_id, "private")))
+
+
+def test_updates_of_a_chat_are_processed_in_order_one_at_a_time():
+    async def run():
+        processed = {}
+        active = set()
+        overlaps = []
+
+        async def process(update):
+            chat_id = update.effective_chat.id
+            if chat_id in active:
+                overlaps.append(update.update_id)
+            active.add(chat_id)
+            await asyncio.sleep(random.uniform(0, 0.005))
+            active.discard(chat_id)
+            processed.setdefault(chat_id, []).append(update.update_id)
+
+        dispatcher = UpdateDispatcher(process, workers=4)
+        dispatcher.start()
+        update_id = 0
+        for _ in range(10):
+            for chat_id in (1, 2, 3):
+                update_id += 1
+                assert dispatcher.submit(make_update(update_id, chat_id)) == ACCEPTED
+        await dispatcher.stop(timeout=5)
+        return processed, overlaps, dispatcher.stats()
+
+    processed, overlaps, stats = asyncio.run(run())
+    assert overlaps == []
+    for chat_id, ids in processed.items():
+        assert ids == sorted(ids)
+        assert len(ids) == 10
+    assert stats["processed"] == 30
+    assert stats["depth"] == 0
+
+
+def test_busy_chat_does_not_block_other_chats():
+    async def run():
+        release = asyncio.Event()
+        done = []
+
+        async def process(update):
+            if update.effective_chat.id == 1:
+                await release.wait()
+            done.append(update.update_id)
+
+        dispatcher = UpdateDispatcher(process, workers=2)
+        dispatcher.start()
+        dispatcher.submit(make_update(1, 1))
+        dispatcher.submit(make_update(2, 1))
+        dispatcher.submit(make_update(3, 2))
+        await asyncio.sleep(0.05)
+        before = list(done)
+        release.set()
+        await dispatcher.stop(timeout=5)
+        return before, done
+
+    before, done = asyncio.run(run())
+    assert before == [3]
+    assert done == [3, 1, 2]
+
+
+def test_stop_drains_queued_updates():
+    async def run():
+        processed = []
+
+        async def process(update):
+            await asyncio.sleep(0.01)
+            processed.append(update.update_id)
+
+        dispatcher = UpdateDispatcher(process, workers=1)
+        dispatcher.start()
+        for update_id in range(5):
+            dispatcher.submit(make_update(update_id, 1))
+        await dispatcher.stop(timeout=5)
+        return processed, dispatcher.submit(make_update(99, 1))
+
+    processed, after_stop = asyncio.run(run())
+    assert processed == [0, 1, 2, 3, 4]
+    assert after_stop == STOPPING
+
+
+def test_stop_timeout_drops_queued_updates_and_calls_on_drop():
+    async def run():
+        dropped = []
+
+        async def process(update):
+            await asyncio.sleep(1)
+
+        async def on_drop(update_id):
+            dropped.append(update_id)
+
+        dispatcher = UpdateDispatcher(process, workers=1, on_drop=on_drop)
+        dispatcher.start()
+        for update_id in range(4):
+            dispatcher.submit(make_update(update_id, 1))
+        await asyncio.sleep(0.01)
+        await dispatcher.stop(timeout=0.05)
+        return dropped, dispatcher.stats()
+
+    dropped, stats = asyncio.run(run())
+    # 0 נקטע באמצע עיבוד; 1-3 לא התחילו
+    assert sorted(dropped) == [1, 2, 3]
+    assert stats["dropped"] == 3
+    assert stats["cancelled"] == 1
+    assert stats["depth"] == 0
+
+
+def test_back_pressure():
+    async def run():
+        async def process(update):
+            await asyncio.sleep(1)
+
+        dispatcher = UpdateDispatcher(process, workers=1, max_queue=3, max_per_chat=2)
+        before_start = dispatcher.submit(make_update(0, 1))
+        dispatcher.start()
+        results = [
+            dispatcher.submit(make_update(1, 1)),
+            dispatcher.submit(make_update(2, 1)),
+            dispatcher.submit(make_update(3, 1)),
+            dispatcher.submit(make_update(4, 2)),
+            dispatcher.submit(make_update(5, 3)),
+        ]
+        await dispatcher.stop(timeout=0)
+        return before_start, results
+
+    before_start, results = asyncio.run(run())
+    assert before_start == STOPPING
+    assert results == [ACCEPTED, ACCEPTED, CHAT_BUSY, ACCEPTED, QUEUE_FULL]
@@ -0,0 +1,42 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+from db import month_bounds
+from partitions import add_months, month_start, partition_name
+
+
+def test_month_bounds_is_half_open_utc_range():
+    start, end = month_bounds(2026, 3)
+    assert start == datetime(2026, 3, 1, tzinfo=timezone.utc)
+    assert end == datetime(2026, 4, 1, tzinfo=timezone.utc)
+
+
+def test_month_bounds_december_rolls_over_the_year():
+    start, end = month_bounds(2025, 12)
+    assert start == datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert end == datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "start, months, expected",
+    [
+        (date(2026, 1, 1), 0, date(2026, 1, 1)),
+        (date(2026, 1, 1), 1, date(2026, 2, 1)),
+        (date(2026, 11, 1), 2, date(2027, 1, 1)),
+        (date(2026, 1, 1), -1, date(2025, 12, 1)),
+        (date(2026, 3, 1), -15, date(2024, 12, 1)),
+        (date(2026, 1, 1), 24, date(2028, 1, 1)),
+    ],
+)
+def test_add_months(start, months, expected):
+    assert add_months(start, months) == expected
+
+
+def test_add_months_returns_first_of_month():
+    assert add_months(date(2026, 1, 31), 1) == date(2026, 2, 1)
+
+
+def test_month_start_and_partition_name():
+    assert month_start(date(2026, 7, 19)) == date(2026, 7, 1)
+    assert partition_name("payments", date(2026, 7, 1)) == "payments_p2026_07"
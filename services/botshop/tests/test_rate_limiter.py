@@ -0,0 +1,69 @@
+import asyncio
+
+from rate_limiter import (
+    HIGH_PRIORITY,
+    LOW_PRIORITY,
+    PriorityRateLimiter,
+    TokenBucket,
+)
+
+
+def _request(limiter, sent, name, chat_id, rate_limit_args=None):
+    async def callback():
+        sent.append(name)
+        return True
+
+    return limiter.process_request(
+        callback, (), {}, "sendMessage", {"chat_id": chat_id}, rate_limit_args
+    )
+
+
+def test_waiting_requests_are_released_by_priority():
+    async def run():
+        limiter = PriorityRateLimiter(global_rate=50, chat_rate=50, chat_burst=5)
+        # ה-bucket הגלובלי ריק – כל הבקשות נכנסות לתור
+        limiter._global = TokenBucket(50, 1)
+        limiter._global.tokens = 0
+        sent = []
+        await asyncio.gather(
+            _request(limiter, sent, "low", 1, LOW_PRIORITY),
+            _request(limiter, sent, "normal", 2),
+            _request(limiter, sent, "high", 3, HIGH_PRIORITY),
+            _request(limiter, sent, "low2", 4, LOW_PRIORITY),
+            _request(limiter, sent, "high2", 5, HIGH_PRIORITY),
+        )
+        await limiter.shutdown()
+        return sent
+
+    # באותה עדיפות – לפי סדר ההגעה
+    assert asyncio.run(run()) == ["high", "high2", "normal", "low", "low2"]
+
+
+def test_requests_without_chat_are_not_limited():
+    async def run():
+        limiter = PriorityRateLimiter(global_rate=1)
+        limiter._global.tokens = 0
+
+        async def callback():
+            return True
+
+        result = await asyncio.wait_for(
+            limiter.process_request(callback, (), {}, "getMe", {}, None), 1
+        )
+        return result, limiter.stats()
+
+    result, stats = asyncio.run(run())
+    assert result is True
+    assert stats["unlimited"] == 1
+    assert stats["sent"] == 0
+
+
+def test_same_chat_keeps_order():
+    async def run():
+        limiter = PriorityRateLimiter(global_rate=100, chat_rate=100, chat_burst=1)
+        sent = []
+        await asyncio.gather(*(_request(limiter, sent, i, 7) for i in range(5)))
+        await limiter.shutdown()
+        return sent
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4]
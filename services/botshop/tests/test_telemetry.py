@@ -0,0 +1,52 @@
+def _lines(text):
+    return text.splitlines()
+
+
+def test_histogram_is_rendered_with_cumulative_buckets(clean_telemetry):
+    telemetry = clean_telemetry
+    telemetry.observe("db_call", "log_payment", 0.004)
+    telemetry.observe("db_call", "log_payment", 0.2)
+
+    lines = _lines(telemetry.render_prometheus())
+    assert "# TYPE botshop_db_call_seconds histogram" in lines
+    assert 'botshop_db_call_seconds_bucket{function="log_payment",le="0.001"} 0' in lines
+    assert 'botshop_db_call_seconds_bucket{function="log_payment",le="0.005"} 1' in lines
+    assert 'botshop_db_call_seconds_bucket{function="log_payment",le="0.25"} 2' in lines
+    assert 'botshop_db_call_seconds_bucket{function="log_payment",le="+Inf"} 2' in lines
+    assert 'botshop_db_call_seconds_count{function="log_payment"} 2' in lines
+    assert 'botshop_db_call_seconds_sum{function="log_payment"} 0.204' in lines
+
+
+def test_unknown_series_uses_generic_label(clean_telemetry):
+    telemetry = clean_telemetry
+    telemetry.observe("custom", "x", 0.01)
+    assert 'botshop_custom_seconds_count{label="x"} 1' in _lines(telemetry.render_prometheus())
+
+
+def test_counters_are_typed_once_and_labels_escaped(clean_telemetry):
+    telemetry = clean_telemetry
+    telemetry.increment("updates_rejected", {"reason": "queue_full"})
+    telemetry.increment("updates_rejected", {"reason": "queue_full"})
+    telemetry.increment("updates_rejected", {"reason": 'say "hi"\n'})
+
+    lines = _lines(telemetry.render_prometheus())
+    assert lines.count("# TYPE botshop_updates_rejected_total counter") == 1
+    assert 'botshop_updates_rejected_total{reason="queue_full"} 2' in lines
+    assert 'botshop_updates_rejected_total{reason="say \\"hi\\"\\n"} 1' in lines
+
+
+def test_gauges_and_failing_gauge_is_skipped(clean_telemetry):
+    telemetry = clean_telemetry
+    telemetry.register_gauge("webhook_queue_depth", lambda: 7)
+
+    def broken():
+        raise RuntimeError("boom")
+
+    telemetry.register_gauge("broken", broken)
+
+    text = telemetry.render_prometheus()
+    lines = _lines(text)
+    assert "# TYPE botshop_webhook_queue_depth gauge" in lines
+    assert "botshop_webhook_queue_depth 7" in lines
+    assert "botshop_broken" not in text
+    assert text.endswith("\n")